@@ -0,0 +1,161 @@
+"""
+Seeded generator of paired external / velaris CSVs for benchmarks.
+
+Both sides describe the same customers: velaris renames every column, some
+rows differ in one value (mismatch rate), some keys exist on one side only
+(orphan rate) and some keys repeat (key cardinality, duplicate rate). With
+transform-heavy data the velaris side is formatted differently, so the
+mapping needs transforms, pipelines and custom functions to line values up.
+The same parameters and seed always give byte-identical files.
+
+Run from the server directory:
+    python -m benchmarks.datagen --rows 100000 --out /tmp/bench
+"""
+import argparse
+import json
+import os
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+STATUSES = np.array(["active", "trial", "churned", "paused", "closed"])
+
+@dataclass
+class DataSpec:
+    rows: int = 100_000
+    columns: int = 4  # mapped value columns besides key and status
+    value_width: int = 12  # characters per text value
+    key_cardinality: Optional[int] = None  # distinct keys per side (default: rows); rows beyond it repeat keys
+    duplicate_rate: float = 0.0  # extra rows per side repeating another row's key
+    mismatch_rate: float = 0.05  # paired rows with one differing value
+    orphan_rate: float = 0.02  # rows per side whose key the other side lacks
+    transform_heavy: bool = False
+    seed: int = 0
+
+def _text(rng, rows, width):
+    letters = np.frombuffer(b"abcdefghijklmnopqrstuvwxyz", dtype="S1")
+    raw = rng.choice(letters, size=(rows, width)).view(f"S{width}").ravel()
+    return raw.astype(str).astype(object)
+
+def _keys(rng, spec):
+    """Key ids: distinct keys cycled up to rows, plus duplicates of random rows."""
+    cardinality = min(spec.key_cardinality or spec.rows, spec.rows)
+    ids = np.arange(spec.rows) % cardinality
+    extra = int(spec.rows * spec.duplicate_rate)
+    if extra:
+        ids = np.concatenate([ids, rng.choice(ids, extra)])
+    return ids
+
+def mapping_config(spec):
+    """mapping_config comparing the generated files (transforms only with transform_heavy)."""
+    mappings = []
+    for i in range(spec.columns):
+        m = {"external_field": f"value_{i}", "velaris_field": f"field_{i}", "rule": "equals"}
+        if i % 3 == 1:
+            m["rule"] = "numeric_equals"
+        if spec.transform_heavy:
+            if i % 3 == 0:
+                m["velaris_transforms"] = ["trim", "lower"]
+            elif i % 3 == 2:
+                m["external_custom"] = "return value.toUpperCase()"
+                m["velaris_custom"] = "trim|replace(-,)|upper"
+        mappings.append(m)
+    config = {
+        "key_fields": {"external_field": "customer_id", "velaris_field": "account_id"},
+        "mappings": mappings,
+        "filters": {
+            "external": {
+                "logic": "AND",
+                "conditions": [{"field": "status", "operator": "not_equals", "data_type": "string", "value": "closed"}],
+            },
+        },
+    }
+    if spec.transform_heavy:
+        config["key_fields"]["velaris_custom"] = "trim|replace(ACC-,)"
+    return config
+
+def generate(spec):
+    """(external DataFrame, velaris DataFrame, mapping_config) for a DataSpec."""
+    rng = np.random.default_rng(spec.seed)
+    ext_ids = _keys(rng, spec)
+    n = len(ext_ids)
+    # Velaris holds the same keys in another order, with orphans swapped for keys external lacks
+    order = rng.permutation(n)
+    vel_ids = ext_ids[order].copy()
+    vel_orphans = rng.random(n) < spec.orphan_rate
+    vel_ids[vel_orphans] = spec.rows + np.arange(vel_orphans.sum())
+    ext_orphans = rng.random(n) < spec.orphan_rate
+    ext_ids = ext_ids.copy()
+    ext_ids[ext_orphans] = 2 * spec.rows + np.arange(ext_orphans.sum())
+
+    external = pd.DataFrame({"customer_id": [f"C{i:09d}" for i in ext_ids], "status": rng.choice(STATUSES, n)})
+    velaris = pd.DataFrame({"account_id": [f"C{i:09d}" for i in vel_ids], "state": external["status"].to_numpy()[order]})
+    mismatched_column = np.where(rng.random(n) < spec.mismatch_rate, rng.integers(0, max(spec.columns, 1), n), -1)
+    for i in range(spec.columns):
+        kind = i % 3
+        if kind == 1:
+            values = np.round(rng.random(n) * 10_000, 2)
+        else:
+            values = _text(rng, n, spec.value_width)
+        external[f"value_{i}"] = values
+        theirs = values[order].copy()
+        differ = mismatched_column[order] == i
+        if kind == 1:
+            theirs[differ] += 1
+        else:
+            theirs[differ] = _text(rng, int(differ.sum()), spec.value_width)
+        if spec.transform_heavy:
+            if kind == 0:
+                theirs = np.char.add(np.char.add("  ", np.char.upper(theirs.astype(str))), " ").astype(object)
+            elif kind == 2:
+                theirs = np.char.add(" ", np.char.upper(theirs.astype(str))).astype(object)
+                theirs[::7] = np.char.add(theirs[::7].astype(str), "-").astype(object)
+        velaris[f"field_{i}"] = theirs
+    if spec.transform_heavy:
+        velaris["account_id"] = (" ACC-" + velaris["account_id"]).to_numpy(dtype=object)
+    return external, velaris, mapping_config(spec)
+
+def write(spec, directory):
+    """Write external.csv, velaris.csv and mapping.json under directory; returns their paths."""
+    os.makedirs(directory, exist_ok=True)
+    external, velaris, mapping = generate(spec)
+    paths = {
+        "external": os.path.join(directory, "external.csv"),
+        "velaris": os.path.join(directory, "velaris.csv"),
+        "mapping": os.path.join(directory, "mapping.json"),
+    }
+    external.to_csv(paths["external"], index=False)
+    velaris.to_csv(paths["velaris"], index=False)
+    with open(paths["mapping"], "w") as f:
+        json.dump(mapping, f, indent=2)
+    return paths
+
+def add_arguments(parser):
+    """DataSpec options as command line flags (shared with the benchmark suite)."""
+    defaults = DataSpec()
+    parser.add_argument("--rows", type=int, default=defaults.rows)
+    parser.add_argument("--columns", type=int, default=defaults.columns)
+    parser.add_argument("--value-width", type=int, default=defaults.value_width)
+    parser.add_argument("--key-cardinality", type=int, default=defaults.key_cardinality)
+    parser.add_argument("--duplicate-rate", type=float, default=defaults.duplicate_rate)
+    parser.add_argument("--mismatch-rate", type=float, default=defaults.mismatch_rate)
+    parser.add_argument("--orphan-rate", type=float, default=defaults.orphan_rate)
+    parser.add_argument("--transform-heavy", action="store_true")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+
+def spec_from_args(args):
+    return DataSpec(**{name: getattr(args, name) for name in asdict(DataSpec())})
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    parser.add_argument("--out", required=True, help="directory for external.csv, velaris.csv and mapping.json")
+    args = parser.parse_args()
+    paths = write(spec_from_args(args), args.out)
+    for name, path in paths.items():
+        print(f"{name:>9}: {path}")
+
+if __name__ == "__main__":
+    main()
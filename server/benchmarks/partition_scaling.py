@@ -0,0 +1,82 @@
+"""
+Scaling benchmark for hash-partitioned comparison.
+
+Times apply_mapping + compare_records in one process, then compare_partitioned
+with 1..N partitions on the same synthetic data, and checks every run returns
+the same result.
+
+Run from the server directory:
+    python -m benchmarks.partition_scaling --rows 1000000 --max-partitions 8
+"""
+import argparse
+import contextlib
+import io
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from services.comparison_engine import compare_records
+from services.mapping_engine import apply_mapping_with_stats
+from services.partitioned_compare import compare_partitioned
+
+MAPPING = {
+    "key_fields": {"external_field": "customer_id", "velaris_field": "account_id", "external_custom": "return value.replace('ext_', '')"},
+    "mappings": [
+        {"external_field": "email", "velaris_field": "contact_email", "rule": "equals", "external_custom": "return value.toLowerCase()"},
+        {"external_field": "status", "velaris_field": "status", "rule": "case_insensitive_equals", "external_transforms": ["trim"]},
+        {"external_field": "revenue", "velaris_field": "mrr", "rule": "equals"},
+    ],
+}
+
+def make_frames(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    ids = np.arange(rows)
+    emails = np.char.add(np.char.add("user", ids.astype(str)), "@Example.com")
+    statuses = rng.choice(["active", "Trial ", "churned", "paused"], rows)
+    revenue = rng.integers(0, 10_000, rows)
+    external = pd.DataFrame({
+        "customer_id": np.char.add("ext_", ids.astype(str)),
+        "email": emails,
+        "status": statuses,
+        "revenue": revenue,
+    })
+    keep = rng.random(rows) > 0.02
+    velaris = pd.DataFrame({
+        "account_id": ids.astype(str)[keep],
+        "contact_email": np.char.lower(emails[keep]),
+        "status": np.char.strip(statuses[keep]),
+        "mrr": np.where(rng.random(keep.sum()) > 0.05, revenue[keep], revenue[keep] + 1),
+    })
+    return external, velaris
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--max-partitions", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    external, velaris = make_frames(args.rows)
+    print(f"rows: {args.rows:,}  cpus: {os.cpu_count()}")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        mapped_external, mapped_velaris, _ = apply_mapping_with_stats(external, velaris, MAPPING)
+        expected = compare_records(mapped_external, mapped_velaris, MAPPING)
+        baseline = time.perf_counter() - start
+    print(f"{'single process':>16}: {baseline:8.2f}s")
+
+    partitions = 1
+    while partitions <= args.max_partitions:
+        with contextlib.redirect_stdout(io.StringIO()):
+            compare_partitioned(external.head(1000), velaris.head(1000), MAPPING, partitions, workers=partitions)  # warm up workers
+            start = time.perf_counter()
+            result, _ = compare_partitioned(external, velaris, MAPPING, partitions, workers=partitions)
+            elapsed = time.perf_counter() - start
+        status = "identical" if result == expected else "DIFFERENT"
+        print(f"{partitions:>5} partitions: {elapsed:8.2f}s  speedup x{baseline / elapsed:5.2f}  {status}")
+        partitions *= 2
+
+if __name__ == "__main__":
+    main()
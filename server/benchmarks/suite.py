@@ -0,0 +1,189 @@
+"""
+Throughput benchmarks for each pipeline stage and the full comparison route.
+
+Data comes from benchmarks.datagen (same flags, same seed -> same files). Every
+benchmark runs in a fresh process, so its peak RSS is its own: read_csv,
+apply_filters, apply_mapping and compare_records time one stage on the output
+of the stages before it; route posts both files to /compare/external-velaris
+in-process (the comparison itself runs in a job worker, whose peak RSS is
+included). Results (rows/sec, seconds, peak RSS) are written to a JSON file;
+--compare prints the change against an earlier file and exits with status 1
+if any benchmark lost more than --max-regression of its throughput.
+
+Run from the server directory:
+    python -m benchmarks.suite --rows 200000 --output baseline.json
+    python -m benchmarks.suite --rows 200000 --output new.json --compare baseline.json
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.datagen import add_arguments, spec_from_args, write
+
+BENCHMARKS = ("read_csv", "apply_filters", "apply_mapping", "compare_records", "route")
+
+def _peak_rss_mb(who=resource.RUSAGE_SELF):
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def _load(paths, mapping):
+    from services.csv_loader import read_csv, required_columns
+    return (
+        read_csv(paths["external"], required_columns(mapping, "external")),
+        read_csv(paths["velaris"], required_columns(mapping, "velaris")),
+    )
+
+def _filter(external, velaris, mapping):
+    from services.filter_engine import apply_filters
+    filters = mapping.get("filters", {})
+    return apply_filters(external, filters.get("external"))[0], apply_filters(velaris, filters.get("velaris"))[0]
+
+def _route(paths, mapping):
+    from fastapi.testclient import TestClient
+    from main import app
+    from services.job_manager import job_manager
+
+    client = TestClient(app)
+
+    def post(external, velaris):
+        response = client.post(
+            "/compare/external-velaris",
+            files={"external_csv": external, "velaris_csv": velaris},
+            data={"mapping_config": json.dumps(dict(mapping, result_mode="summary"))},
+        )
+        response.raise_for_status()
+
+    # Start the job worker first: process start-up is not comparison throughput
+    with open(paths["external"], "rb") as f:
+        header = f.readline()
+    with open(paths["velaris"], "rb") as f:
+        other = f.readline()
+    post(header, other)
+    with open(paths["external"], "rb") as external, open(paths["velaris"], "rb") as velaris:
+        start = time.perf_counter()
+        post(external, velaris)
+        elapsed = time.perf_counter() - start
+    job_manager._pool.shutdown(wait=True)
+    return elapsed
+
+def _run(name, paths, queue):
+    """Worker: time one benchmark and report (seconds, rows, peak RSS MB)."""
+    logging.disable(logging.WARNING)
+    from services.comparison_engine import compare_records
+    from services.mapping_engine import apply_mapping
+
+    with open(paths["mapping"]) as f:
+        mapping = json.load(f)
+    if name == "route":
+        seconds = _route(paths, mapping)
+        rows = sum(len(pd.read_csv(paths[side], usecols=[0])) for side in ("external", "velaris"))
+        queue.put((seconds, rows, max(_peak_rss_mb(), _peak_rss_mb(resource.RUSAGE_CHILDREN))))
+        return
+
+    start = time.perf_counter()
+    frames = _load(paths, mapping)
+    if name != "read_csv":
+        start = time.perf_counter()
+        frames = _filter(*frames, mapping)
+    if name not in ("read_csv", "apply_filters"):
+        start = time.perf_counter()
+        frames = apply_mapping(*frames, mapping)
+    if name == "compare_records":
+        start = time.perf_counter()
+        compare_records(*frames, mapping)
+    seconds = time.perf_counter() - start
+    queue.put((seconds, sum(len(f) for f in frames), _peak_rss_mb()))
+
+def run_benchmark(name, paths, repeat=1):
+    """Best of `repeat` fresh-process runs: {"seconds", "rows", "rows_per_sec", "peak_rss_mb"}."""
+    context = multiprocessing.get_context("spawn")
+    runs = []
+    for _ in range(repeat):
+        queue = context.Queue()
+        process = context.Process(target=_run, args=(name, paths, queue))
+        process.start()
+        runs.append(queue.get())
+        process.join()
+    seconds, rows, _ = min(runs)
+    return {
+        "seconds": round(seconds, 4),
+        "rows": rows,
+        "rows_per_sec": round(rows / seconds) if seconds else None,
+        "peak_rss_mb": max(rss for _, _, rss in runs),
+    }
+
+def compare_baselines(previous, current, max_regression):
+    """Print per-benchmark changes; returns the names whose throughput fell by more than max_regression."""
+    regressed = []
+    print(f"{'benchmark':>16} {'rows/sec':>12} {'before':>12} {'change':>8} {'peak RSS MB':>12} {'before':>8}")
+    for name, now in current["benchmarks"].items():
+        then = previous.get("benchmarks", {}).get(name)
+        if then is None or not then.get("rows_per_sec") or not now["rows_per_sec"]:
+            print(f"{name:>16} {now['rows_per_sec'] or 0:>12,} {'-':>12} {'-':>8} {now['peak_rss_mb']:>12} {'-':>8}")
+            continue
+        change = now["rows_per_sec"] / then["rows_per_sec"] - 1
+        if change < -max_regression:
+            regressed.append(name)
+        print(
+            f"{name:>16} {now['rows_per_sec']:>12,} {then['rows_per_sec']:>12,} {change:>+8.1%} "
+            f"{now['peak_rss_mb']:>12} {then['peak_rss_mb']:>8}"
+        )
+    if previous.get("data") != current["data"]:
+        print("note: the baselines were generated from different data parameters")
+    return regressed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    parser.add_argument("--benchmarks", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=3, help="fresh-process runs per benchmark; the fastest counts")
+    parser.add_argument("--output", help="JSON file to write the results to")
+    parser.add_argument("--compare", help="earlier results file to diff against")
+    parser.add_argument("--max-regression", type=float, default=0.1, help="throughput loss (fraction) that fails --compare")
+    args = parser.parse_args()
+
+    spec = spec_from_args(args)
+    with tempfile.TemporaryDirectory(prefix="bench-") as directory:
+        paths = write(spec, directory)
+        results = {
+            "data": asdict(spec),
+            "environment": {
+                "python": platform.python_version(),
+                "pandas": pd.__version__,
+                "numpy": np.__version__,
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+            },
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "benchmarks": {},
+        }
+        for name in args.benchmarks:
+            results["benchmarks"][name] = run_benchmark(name, paths, args.repeat)
+            r = results["benchmarks"][name]
+            print(f"{name:>16}: {r['seconds']:8.3f}s  {r['rows_per_sec'] or 0:>12,} rows/s  peak RSS {r['peak_rss_mb']} MB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        regressed = compare_baselines(previous, results, args.max_regression)
+        if regressed:
+            print(f"throughput regressed by more than {args.max_regression:.0%}: {', '.join(regressed)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -26,4 +26,68 @@ class Config:
     ENABLE_LOGGING = os.getenv("ENABLE_LOGGING", "true").lower() == "true"
     MAX_CSV_SIZE_MB = int(os.getenv("MAX_CSV_SIZE_MB", "50"))
 
+    # Performance Tuning
+    CUSTOM_FUNCTION_CACHE_SIZE = int(os.getenv("CUSTOM_FUNCTION_CACHE_SIZE", "256"))
+    MAPPING_PLAN_CACHE_SIZE = int(os.getenv("MAPPING_PLAN_CACHE_SIZE", "256"))  # validated configs kept by plan id
+    # Transform each distinct value once when distinct/rows is at or below this ratio
+    DISTINCT_TRANSFORM_MAX_RATIO = float(os.getenv("DISTINCT_TRANSFORM_MAX_RATIO", "0.5"))
+    DISTINCT_TRANSFORM_MIN_ROWS = int(os.getenv("DISTINCT_TRANSFORM_MIN_ROWS", "1000"))
+
+    # CSV Ingestion
+    CSV_ENGINE = os.getenv("CSV_ENGINE", "c")  # "c" or "pyarrow" (requires pyarrow)
+    CSV_DTYPE = os.getenv("CSV_DTYPE", "infer")  # "infer", "string" or "category"
+    CSV_PARSE_WORKERS = int(os.getenv("CSV_PARSE_WORKERS", "4"))
+    UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR") or None  # defaults to the system temp dir
+
+    # Comparison Jobs (local process pool, no external broker)
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+    JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "8"))
+    JOB_RESULT_TTL_SECONDS = int(os.getenv("JOB_RESULT_TTL_SECONDS", "3600"))
+    JOB_RESULT_MB = int(os.getenv("JOB_RESULT_MB", "256"))  # retained async and page-mode results, API process
+    JOB_RETRY_AFTER_SECONDS = int(os.getenv("JOB_RETRY_AFTER_SECONDS", "30"))
+
+    # Batch comparison (one external CSV against several velaris CSVs / mapping configs)
+    BATCH_MAX_TARGETS = int(os.getenv("BATCH_MAX_TARGETS", "64"))
+    BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))  # targets compared concurrently within one job
+
+    # Admission control (estimated peak memory of in-flight comparisons, see services/admission.py)
+    ADMISSION_MEMORY_MB = int(os.getenv("ADMISSION_MEMORY_MB", "4096"))  # 0 = no limit
+    ADMISSION_MEMORY_FACTOR = float(os.getenv("ADMISSION_MEMORY_FACTOR", "8"))  # peak bytes per CSV byte of parsed columns
+    ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "16"))  # requests waiting for memory before 503
+    ADMISSION_WAIT_SECONDS = float(os.getenv("ADMISSION_WAIT_SECONDS", "30"))
+
+    # Hash-partitioned comparison (1 = single process)
+    COMPARE_PARTITIONS = int(os.getenv("COMPARE_PARTITIONS", "1"))
+    PARTITION_MIN_ROWS = int(os.getenv("PARTITION_MIN_ROWS", "1000000"))  # external + velaris rows
+
+    # Result Modes (mapping_config "result_mode": full, summary or page)
+    RESULT_PAGE_SIZE = int(os.getenv("RESULT_PAGE_SIZE", "100"))
+    RESULT_HISTOGRAM_SIZE = int(os.getenv("RESULT_HISTOGRAM_SIZE", "10"))  # top value pairs per field in summary mode
+    STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", "10000"))  # records built at a time for NDJSON output
+
+    # Dataset Cache (registered CSVs stored under their content hash)
+    DATASET_DIR = os.getenv("DATASET_DIR") or None  # defaults to <system temp dir>/velaris-datasets
+    DATASET_FORMAT = os.getenv("DATASET_FORMAT", "parquet")  # "parquet" or "feather" (csv without pyarrow), or "csv"
+    DATASET_CACHE_MB = int(os.getenv("DATASET_CACHE_MB", "512"))  # in-memory LRU budget per process
+
+    # Result Cache (results keyed on input content hashes + canonical mapping_config)
+    RESULT_CACHE_MB = int(os.getenv("RESULT_CACHE_MB", "256"))  # whole results, API process
+    RESULT_CACHE_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", "600"))
+    STAGE_CACHE_MB = int(os.getenv("STAGE_CACHE_MB", "512"))  # filtered/mapped frames, per job worker
+
+    # Incremental Reconciliation (mapping_config "incremental": {"snapshot": name})
+    SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR") or None  # defaults to <system temp dir>/velaris-snapshots
+
+    # Out-of-core comparison (chunks spilled to key-hash partitions under UPLOAD_TMP_DIR)
+    OUT_OF_CORE_MEMORY_MB = int(os.getenv("OUT_OF_CORE_MEMORY_MB", "1024"))  # budget for one chunk / partition pair
+    OUT_OF_CORE_MIN_MB = int(os.getenv("OUT_OF_CORE_MIN_MB", "0"))  # combined CSV size that selects it (0 = only on request)
+    OUT_OF_CORE_SCAN_ROWS = int(os.getenv("OUT_OF_CORE_SCAN_ROWS", "100000"))
+
+    # Fuzzy key matching of orphans (mapping_config "fuzzy_keys": true or an object overriding these)
+    FUZZY_THRESHOLD = float(os.getenv("FUZZY_THRESHOLD", "0.85"))  # minimum 1 - edit distance / longer key length
+    FUZZY_NGRAM = int(os.getenv("FUZZY_NGRAM", "3"))
+    FUZZY_WINDOW = int(os.getenv("FUZZY_WINDOW", "4"))  # sorted-neighbourhood window
+    FUZZY_MAX_BLOCK_SIZE = int(os.getenv("FUZZY_MAX_BLOCK_SIZE", "64"))  # n-grams held by more keys are skipped
+    FUZZY_MAX_CANDIDATES = int(os.getenv("FUZZY_MAX_CANDIDATES", "8"))  # n-gram candidates scored per orphan
+
 config = Config()
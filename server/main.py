@@ -1,7 +1,10 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from routes.compare_routes import router as compare_router
+from routes.dataset_routes import router as dataset_router
+from routes.metrics_routes import router as metrics_router
 from routes.test_route import router as test_router
+from services.uploads import UploadLimitMiddleware
 try:
     from config import config
 except ImportError:
@@ -21,10 +24,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Oversized uploads are refused while the body streams in, before it is parsed
+app.add_middleware(UploadLimitMiddleware)
+
 if config.ENABLE_LOGGING:
     import logging
     logging.basicConfig(level=logging.INFO)
 
 # Include routers
 app.include_router(compare_router, prefix="/compare")
+app.include_router(dataset_router, prefix="/datasets")
+app.include_router(metrics_router)
 app.include_router(test_router)
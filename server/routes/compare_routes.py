@@ -1,53 +1,469 @@
-from fastapi import APIRouter, UploadFile, File, Form
-from services.csv_loader import read_csv
-from services.mapping_engine import apply_mapping
-from services.comparison_engine import compare_records
-from services.filter_engine import apply_filters
+from fastapi import APIRouter, UploadFile, File, Form, Header, HTTPException, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from functools import partial
+from typing import List, Optional
+from config import config
+from services.comparison_engine import check_key_fields, check_rule_options, get_result_mode, paginate_results
+from services.job_manager import job_manager, JobQueueFullError
+from services.admission import AdmissionRejectedError, admission, estimate_batch, estimate_comparison
+from services.csv_loader import read_header
+from services.dataset_cache import DatasetNotFoundError, DatasetRef, dataset_cache
+from services.fuzzy_match import fuzzy_options
+from services.pipeline import run_batch, run_comparison, stream_comparison
+from services.result_cache import result_cache, result_key
+from services.incremental import snapshot_path, list_snapshots, delete_snapshot
+from services.mapping_plan import plans, transformed_columns, validate_mapping
+from services.uploads import spool_uploads, spool_file, remove_files, UploadTooLargeError
+import asyncio
+import hashlib
 import json
+import os
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+STREAM_POLL_SECONDS = 0.05
+STREAM_READ_SIZE = 64 * 1024
 
 router = APIRouter()
 
+def check_result_mode(mapping):
+        try:
+                get_result_mode(mapping)
+                check_key_fields(mapping)
+                check_rule_options(mapping)
+                fuzzy_options(mapping)
+                if mapping.get("incremental"):
+                        snapshot_path(mapping["incremental"].get("snapshot"))
+        except (ValueError, AttributeError) as e:
+                raise HTTPException(status_code=400, detail=f"Invalid mapping_config: {e}")
+
+def resolve_plan(mapping):
+        """A mapping_config {"plan_id": id, ...} becomes the registered config, with its other keys
+        (e.g. result_mode, page) overriding the plan's."""
+        if not isinstance(mapping, dict) or "plan_id" not in mapping:
+                return mapping
+        registered = plans.get(mapping["plan_id"])
+        if registered is None:
+                raise HTTPException(status_code=404, detail=f"Mapping plan '{mapping['plan_id']}' not found")
+        registered.update({k: v for k, v in mapping.items() if k != "plan_id"})
+        return registered
+
+def parse_mapping(mapping_config):
+        try:
+                mapping = json.loads(mapping_config)
+        except ValueError as e:
+                raise HTTPException(status_code=400, detail=f"Invalid mapping_config: {e}")
+        if isinstance(mapping, list):
+                return [resolve_plan(m) for m in mapping]
+        return resolve_plan(mapping)
+
+async def upload_inputs(external_csv, velaris_csv):
+        """Spool both uploads to disk, hashing their content on the way.
+        Returns (sources, content_hashes, cleanup) where cleanup removes the spooled files."""
+        digests = [hashlib.sha256(), hashlib.sha256()]
+        try:
+                paths = await spool_uploads([external_csv, velaris_csv], config.MAX_CSV_SIZE_MB * 1024 * 1024, digests)
+        except UploadTooLargeError as e:
+                raise HTTPException(status_code=413, detail=str(e))
+        return paths, tuple(d.hexdigest() for d in digests), partial(remove_files, paths)
+
+def dataset_inputs(external_dataset, velaris_dataset):
+        """Inputs for two registered datasets (see POST /datasets); a dataset id is its content hash."""
+        for dataset_id in (external_dataset, velaris_dataset):
+                if not dataset_cache.exists(dataset_id):
+                        raise HTTPException(status_code=404, detail=f"Dataset '{dataset_id}' not found")
+        return [DatasetRef(external_dataset), DatasetRef(velaris_dataset)], (external_dataset, velaris_dataset), None
+
+def source_header(source):
+        """Column names of a spooled upload or a registered dataset (None if unreadable)."""
+        if isinstance(source, DatasetRef):
+                try:
+                        return dataset_cache.metadata(source.dataset_id)["columns"]
+                except DatasetNotFoundError:
+                        raise HTTPException(status_code=404, detail=f"Dataset '{source.dataset_id}' not found")
+        return read_header(source)
+
+def check_headers(mapping, external_header, velaris_header, cleanup=None, where=""):
+        """Run validate_mapping against the inputs' headers before anything is queued, answering
+        400 with its error list (after running cleanup) instead of failing inside the worker."""
+        errors, _ = validate_mapping(mapping, {"external": external_header, "velaris": velaris_header})
+        if errors:
+                if cleanup is not None:
+                        cleanup()
+                raise HTTPException(status_code=400, detail={"message": f"Invalid mapping_config{where}", "errors": errors})
+
+def checked_inputs(inputs, mapping):
+        """inputs, once check_headers accepts mapping for them."""
+        sources, _, cleanup = inputs
+        check_headers(mapping, source_header(sources[0]), source_header(sources[1]), cleanup)
+        return inputs
+
+def run_all(callbacks):
+        for callback in callbacks:
+                if callback is not None:
+                        callback()
+
+async def reserve_memory(nbytes, label, cleanup=None):
+        """Reserve a comparison's estimated memory (see services/admission.py) and return
+        cleanup extended to release it. Waits while the budget is exhausted, then answers
+        503 with Retry-After (after running cleanup)."""
+        try:
+                reservation = await admission.reserve(nbytes, label)
+        except BaseException as e:
+                if cleanup is not None:
+                        cleanup()
+                if isinstance(e, AdmissionRejectedError):
+                        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(config.JOB_RETRY_AFTER_SECONDS)})
+                raise
+        return partial(run_all, [cleanup, reservation.release])
+
+async def admit(inputs, mapping):
+        """inputs whose cleanup also releases the comparison's memory reservation."""
+        sources, content_hashes, cleanup = inputs
+        label = "compare " + "/".join(h[:12] for h in content_hashes or ())
+        return sources, content_hashes, await reserve_memory(estimate_comparison(sources, mapping), label, cleanup)
+
+def submit_job(fn, *args, cleanup=None, retain=False):
+        """job_manager.submit, answering 503 with Retry-After when the queue is full.
+        cleanup runs once the job finishes (or if it cannot be queued)."""
+        try:
+                return job_manager.submit(fn, *args, cleanup=cleanup, retain=retain)
+        except JobQueueFullError as e:
+                if cleanup is not None:
+                        cleanup()
+                raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(config.JOB_RETRY_AFTER_SECONDS)})
+
+def queue_comparison(inputs, mapping, fn=run_comparison, *args, retain=False):
+        """Queue fn(external_source, velaris_source, mapping, *args, content_hashes) on the job pool.
+        The inputs' cleanup runs once the job finishes (or if it cannot be queued);
+        retain keeps the finished job for GET /compare/jobs/{id}/result."""
+        sources, content_hashes, cleanup = inputs
+        return submit_job(fn, sources[0], sources[1], mapping, *args, content_hashes, cleanup=cleanup, retain=retain)
+
+async def follow_output(job, path):
+        """Yield the job's NDJSON output file as the worker writes it, then remove it.
+        A failure after output has started is reported as a final {"type": "error"} line."""
+        try:
+                with open(path, "rb") as f:
+                        while True:
+                                chunk = f.read(STREAM_READ_SIZE)
+                                if chunk:
+                                        yield chunk
+                                elif job.future.done():
+                                        # The worker closed the file before finishing, so this drains it
+                                        while chunk := f.read(STREAM_READ_SIZE):
+                                                yield chunk
+                                        error = job.future.exception()
+                                        if error is not None:
+                                                yield (json.dumps({"type": "error", "error": f"{type(error).__name__}: {error}"}) + "\n").encode()
+                                        break
+                                else:
+                                        await asyncio.sleep(STREAM_POLL_SECONDS)
+        finally:
+                remove_files([path])
+                job_manager.forget(job.id)
+
+async def stream_comparison_response(inputs, mapping):
+        """Run the comparison as an NDJSON-writing job and stream its output file
+        (the lines of pipeline.stream_comparison, summary last).
+        Errors raised before the first record are returned as a normal HTTP error."""
+        path = spool_file("result-", ".ndjson")
+        try:
+                job = queue_comparison(inputs, mapping, stream_comparison, path)
+        except BaseException:
+                remove_files([path])
+                raise
+        while not os.path.getsize(path) and not job.future.done():
+                await asyncio.sleep(STREAM_POLL_SECONDS)
+        if not os.path.getsize(path) and job.future.exception() is not None:
+                error = job.future.exception()
+                remove_files([path])
+                job_manager.forget(job.id)
+                raise HTTPException(status_code=500, detail=f"{type(error).__name__}: {error}")
+        return StreamingResponse(follow_output(job, path), media_type=NDJSON_MEDIA_TYPE)
+
+async def comparison_response(inputs, mapping, accept):
+        """Compare the inputs and answer in the requested shape: NDJSON stream,
+        first page of a retained result, or the whole result. Results are memoized
+        on the inputs' content hashes plus the canonical mapping_config."""
+        sources, content_hashes, cleanup = inputs
+        incremental = bool(mapping.get("incremental"))
+        if accept and NDJSON_MEDIA_TYPE in accept:
+                if incremental:
+                        if cleanup is not None:
+                                cleanup()
+                        raise HTTPException(status_code=400, detail="Incremental comparisons cannot be streamed")
+                return await stream_comparison_response(await admit(inputs, mapping), mapping)
+        paged = mapping.get("result_mode") == "page"
+        # Incremental results depend on the stored snapshot, not only on the inputs
+        key = None if incremental else result_key(content_hashes, mapping)
+        result = result_cache.get(key) if key else None
+        if result is not None:
+                if cleanup is not None:
+                        cleanup()
+                if not paged:
+                        return result
+                # Retain the cached result as a finished job so it can be paged
+                job = job_manager.add_completed(result)
+        else:
+                job = queue_comparison(await admit(inputs, mapping), mapping, retain=paged)
+                try:
+                        result = await job_manager.wait(job)
+                finally:
+                        if not paged:
+                                job_manager.forget(job.id)
+                if key:
+                        result_cache.put(key, result, tags=content_hashes)
+                if not paged:
+                        return result
+        page = mapping.get("page") or {}
+        return {"result_id": job.id, **paginate_results(result, page.get("offset", 0), page.get("limit"))}
+
 @router.post("/external-velaris")
 async def compare_external_velaris(
         external_csv: UploadFile = File(...),
         velaris_csv: UploadFile = File(...),
-        mapping_config: str = Form(...)
+        mapping_config: str = Form(...),
+        accept: Optional[str] = Header(None)
 ):
         """Compare two CSVs with mapping + optional filters.
 
-        Extended mapping_config schema example:
-        {
-            "key_fields": {"external_field": "ExternalID", "velaris_field": "VelarisID"},
-            "mappings": [
-                {
-                    "external_field": "ExternalName",
-                    "velaris_field": "Name",
-                    "rule": "case_insensitive_equals",
-                    "external_transforms": ["trim","lower"],
-                    "velaris_transforms": ["trim","lower"]
-                }
-            ],
-            "filters": {
-                "external": {"logic": "AND", "conditions": [ {"field": "Amount", "operator": "less_than", "data_type": "number", "value": 1000} ]},
-                "velaris": {"logic": "AND", "conditions": []}
-            }
-        }
+        Runs on the job pool and answers with the whole result, a first page or
+        an NDJSON stream; see COMPARISON_API_GUIDE.md for the mapping_config options.
+        """
+        mapping = parse_mapping(mapping_config)
+        check_result_mode(mapping)
+        return await comparison_response(checked_inputs(await upload_inputs(external_csv, velaris_csv), mapping), mapping, accept)
+
+def batch_targets(velaris_csv, mapping_config):
+        """(velaris upload, mapping) per target. mapping_config is one object shared by
+        every velaris file or a list with one per file; with a single velaris file,
+        a list compares that file under each mapping."""
+        mappings = parse_mapping(mapping_config)
+        if not isinstance(mappings, list):
+                mappings = [mappings]
+        if not mappings or not all(isinstance(m, dict) for m in mappings):
+                raise HTTPException(status_code=400, detail="Invalid mapping_config: expected an object or a non-empty list of objects")
+        if len(velaris_csv) != len(mappings) and 1 not in (len(velaris_csv), len(mappings)):
+                raise HTTPException(status_code=400, detail=f"Got {len(velaris_csv)} velaris files but {len(mappings)} mapping configs")
+        count = max(len(velaris_csv), len(mappings))
+        if count > config.BATCH_MAX_TARGETS:
+                raise HTTPException(status_code=400, detail=f"A batch holds at most {config.BATCH_MAX_TARGETS} targets, got {count}")
+        targets = []
+        for i in range(count):
+                mapping = mappings[i if len(mappings) > 1 else 0]
+                check_result_mode(mapping)
+                if mapping.get("incremental") or mapping.get("out_of_core") or mapping.get("result_mode") == "page":
+                        raise HTTPException(status_code=400, detail="Incremental, out-of-core and page-mode comparisons cannot be batched")
+                targets.append((i if len(velaris_csv) > 1 else 0, mapping))
+        return targets
+
+@router.post("/batch")
+async def compare_batch(
+        external_csv: UploadFile = File(...),
+        velaris_csv: List[UploadFile] = File(...),
+        mapping_config: str = Form(...)
+):
+        """Compare one external CSV with several velaris CSVs and/or mapping configs.
+
+        mapping_config is a single mapping_config (applied to every velaris_csv
+        part) or a JSON list of them, one per velaris_csv part; a list with a
+        single velaris file compares that file under each config.
+
+        Runs as one job: the external file is parsed once, filtered and
+        transformed once per distinct external configuration and its key index
+        is reused, then the targets are compared concurrently (BATCH_WORKERS).
+        Returns {"targets": [{"target", "velaris_csv", "result" | "error"}],
+        "external": {"rows", "variants"}, "timings"}; each result has its own
+        timings for the velaris stages and the comparison. Results are memoized
+        per target like those of /external-velaris; cached targets are not rerun.
+        result_mode "page", incremental and out-of-core runs are not supported.
         """
-        mapping = json.loads(mapping_config)
+        targets = batch_targets(velaris_csv, mapping_config)
+        uploads = [external_csv] + list(velaris_csv)
+        digests = [hashlib.sha256() for _ in uploads]
+        try:
+                paths = await spool_uploads(uploads, config.MAX_CSV_SIZE_MB * 1024 * 1024, digests)
+        except UploadTooLargeError as e:
+                raise HTTPException(status_code=413, detail=str(e))
+        hashes = [d.hexdigest() for d in digests]
+        headers = [read_header(path) for path in paths]
+        for i, (velaris_index, mapping) in enumerate(targets):
+                check_headers(mapping, headers[0], headers[velaris_index + 1], partial(remove_files, paths), f" for target {i}")
+
+        entries = []
+        pending = []
+        for i, (velaris_index, mapping) in enumerate(targets):
+                content_hashes = (hashes[0], hashes[velaris_index + 1])
+                key = result_key(content_hashes, mapping)
+                entries.append({"target": i, "velaris_csv": velaris_csv[velaris_index].filename})
+                result = result_cache.get(key)
+                if result is not None:
+                        entries[i]["result"] = result
+                else:
+                        pending.append((i, key, content_hashes))
+        response = {"targets": entries, "external": None, "timings": None}
+        if not pending:
+                remove_files(paths)
+                return response
+
+        batch_targets_ = [(paths[targets[i][0] + 1], targets[i][1]) for i, _, _ in pending]
+        cleanup = await reserve_memory(
+                estimate_batch(paths[0], batch_targets_), f"batch {hashes[0][:12]} x{len(pending)}", partial(remove_files, paths),
+        )
+        job = submit_job(run_batch, paths[0], batch_targets_, cleanup=cleanup)
+        try:
+                batch = await job_manager.wait(job)
+        finally:
+                job_manager.forget(job.id)
+        for (i, key, content_hashes), result in zip(pending, batch["targets"]):
+                if "error" in result:
+                        entries[i]["error"] = result["error"]
+                else:
+                        result_cache.put(key, result, tags=content_hashes)
+                        entries[i]["result"] = result
+        response["external"] = batch["external"]
+        response["timings"] = batch["timings"]
+        return response
+
+@router.post("/datasets")
+async def compare_datasets(
+        external_dataset: str = Form(...),
+        velaris_dataset: str = Form(...),
+        mapping_config: str = Form(...),
+        accept: Optional[str] = Header(None)
+):
+        """Same as /external-velaris, but for two datasets registered with POST /datasets,
+        so neither file is uploaded or parsed again. Results include the worker's
+        dataset_cache counters."""
+        mapping = parse_mapping(mapping_config)
+        check_result_mode(mapping)
+        return await comparison_response(checked_inputs(dataset_inputs(external_dataset, velaris_dataset), mapping), mapping, accept)
+
+@router.post("/jobs", status_code=202)
+async def submit_comparison_job(
+        external_csv: UploadFile = File(...),
+        velaris_csv: UploadFile = File(...),
+        mapping_config: str = Form(...)
+):
+        """Queue a comparison (same inputs as /external-velaris) and return its job id."""
+        mapping = parse_mapping(mapping_config)
+        check_result_mode(mapping)
+        inputs = await admit(checked_inputs(await upload_inputs(external_csv, velaris_csv), mapping), mapping)
+        job = queue_comparison(inputs, mapping, retain=True)
+        return job.to_dict()
+
+@router.get("/jobs")
+async def list_comparison_jobs():
+        return [job.to_dict() for job in job_manager.all_jobs()]
 
-        external_data = read_csv(await external_csv.read())
-        velaris_data = read_csv(await velaris_csv.read())
+@router.get("/jobs/{job_id}")
+async def get_comparison_job(job_id: str):
+        job = job_manager.get(job_id)
+        if job is None:
+                raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+        return job.to_dict()
 
-        # Apply filters if provided
-        filter_cfg = mapping.get("filters", {})
-        external_data, external_filter_stats = apply_filters(external_data, filter_cfg.get("external"))
-        velaris_data, velaris_filter_stats = apply_filters(velaris_data, filter_cfg.get("velaris"))
+@router.get("/jobs/{job_id}/result")
+async def get_comparison_job_result(
+        job_id: str,
+        offset: Optional[int] = Query(None, ge=0),
+        limit: Optional[int] = Query(None, ge=1),
+        bucket: Optional[str] = None
+):
+        """Fetch a finished job's result. Page-mode results (or any request with
+        offset/limit/bucket) are windowed per bucket; totals give the full sizes."""
+        job = job_manager.get(job_id)
+        if job is None:
+                raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+        if job.status in ("queued", "running"):
+                return JSONResponse(status_code=202, content=job.to_dict())
+        if job.status == "failed":
+                raise HTTPException(status_code=500, detail=job.error)
+        if job.discarded:
+                raise HTTPException(status_code=410, detail=f"Result of job '{job_id}' exceeded JOB_RESULT_MB and was not retained")
+        if job.result.get("result_mode") == "page" or offset is not None or limit is not None or bucket is not None:
+                if "counts" in job.result:
+                        raise HTTPException(status_code=400, detail="Summary results cannot be paged")
+                try:
+                        return paginate_results(job.result, offset or 0, limit, bucket)
+                except ValueError as e:
+                        raise HTTPException(status_code=400, detail=str(e))
+        return job.result
 
-        mapped_external, mapped_velaris = apply_mapping(external_data, velaris_data, mapping)
+@router.post("/plans")
+async def validate_mapping_plan(
+        mapping_config: str = Form(...),
+        external_columns: Optional[str] = Form(None),
+        velaris_columns: Optional[str] = Form(None)
+):
+        """Check a mapping_config before sending any data.
 
-        result = compare_records(mapped_external, mapped_velaris, mapping)
-        result["filter_stats"] = {
-                "external": external_filter_stats,
-                "velaris": velaris_filter_stats
+        external_columns / velaris_columns optionally give a side's CSV header
+        as a JSON list, so missing key and mapped fields are reported too.
+        Returns {"valid", "errors", "warnings", "plan_id", "transformed_columns"}:
+        errors would fail the comparison, warnings name parts it would skip.
+        A valid config is kept under plan_id; the comparison routes then accept
+        mapping_config {"plan_id": "<id>"} (other keys, e.g. result_mode or page,
+        override the plan's).
+        """
+        try:
+                mapping = json.loads(mapping_config)
+                columns = {
+                        side: json.loads(header) if header else None
+                        for side, header in (("external", external_columns), ("velaris", velaris_columns))
+                }
+        except ValueError as e:
+                raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
+        for side, header in columns.items():
+                if header is not None and not (isinstance(header, list) and all(isinstance(c, str) for c in header)):
+                        raise HTTPException(status_code=400, detail=f"{side}_columns must be a JSON list of column names")
+        errors, warnings = validate_mapping(mapping, columns)
+        if errors:
+                return {"valid": False, "errors": errors, "warnings": warnings, "plan_id": None, "transformed_columns": None}
+        return {
+                "valid": True,
+                "errors": [],
+                "warnings": warnings,
+                "plan_id": plans.put(mapping),
+                "transformed_columns": transformed_columns(mapping),
         }
-        return result
+
+@router.get("/plans/{plan_id}")
+async def get_mapping_plan(plan_id: str):
+        """The mapping_config registered under plan_id (see POST /compare/plans)."""
+        mapping = plans.get(plan_id)
+        if mapping is None:
+                raise HTTPException(status_code=404, detail=f"Mapping plan '{plan_id}' not found")
+        return {"plan_id": plan_id, "mapping_config": mapping, "transformed_columns": transformed_columns(mapping)}
+
+@router.get("/cache")
+async def get_result_cache_stats():
+        """Hit/miss/eviction counters of the comparison result cache."""
+        return result_cache.stats()
+
+@router.delete("/cache")
+async def invalidate_result_cache(content_hash: Optional[str] = None):
+        """Drop cached results: all of them, or only those computed from the input
+        with this content hash (a dataset id or the SHA-256 of an uploaded CSV)."""
+        return {"invalidated": result_cache.invalidate(content_hash)}
+
+@router.get("/admission")
+async def get_admission_stats():
+        """Memory budget of the admission control: reservations in flight and requests waiting."""
+        return admission.stats()
+
+@router.get("/snapshots")
+async def get_snapshots():
+        """Snapshots kept for incremental comparisons."""
+        return list_snapshots()
+
+@router.delete("/snapshots/{name}")
+async def remove_snapshot(name: str):
+        """Forget a snapshot; the next incremental run with this name starts from scratch."""
+        try:
+                deleted = delete_snapshot(name)
+        except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        if not deleted:
+                raise HTTPException(status_code=404, detail=f"Snapshot '{name}' not found")
+        return {"deleted": name}
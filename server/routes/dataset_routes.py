@@ -0,0 +1,58 @@
+from fastapi import APIRouter, UploadFile, File, HTTPException
+from functools import partial
+from config import config
+from services.dataset_cache import dataset_cache, store_dataset, DatasetNotFoundError
+from services.job_manager import job_manager, JobQueueFullError
+from services.result_cache import result_cache
+from services.uploads import spool_upload, remove_files, UploadTooLargeError
+import hashlib
+
+router = APIRouter()
+
+@router.post("")
+async def register_dataset(file: UploadFile = File(...)):
+        """Store a parsed CSV under the SHA-256 of its content and return its dataset_id.
+        Re-registering identical content is answered from the store without parsing."""
+        digest = hashlib.sha256()
+        try:
+                path = await spool_upload(file, config.MAX_CSV_SIZE_MB * 1024 * 1024, digest=digest)
+        except UploadTooLargeError as e:
+                raise HTTPException(status_code=413, detail=str(e))
+        dataset_id = digest.hexdigest()
+        if dataset_cache.exists(dataset_id):
+                remove_files([path])
+                dataset_cache.count_registration(deduplicated=True)
+                return {**dataset_cache.metadata(dataset_id), "deduplicated": True}
+        try:
+                job = job_manager.submit(store_dataset, dataset_id, path, file.filename, cleanup=partial(remove_files, [path]))
+        except JobQueueFullError as e:
+                remove_files([path])
+                raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(config.JOB_RETRY_AFTER_SECONDS)})
+        try:
+                meta = await job_manager.wait(job)
+        finally:
+                job_manager.forget(job.id)
+        dataset_cache.count_registration(deduplicated=False)
+        return {**meta, "deduplicated": False}
+
+@router.get("/stats")
+async def dataset_cache_stats():
+        """Registration counters and memory LRU of the API process, plus on-disk usage.
+        Worker-side hit/miss/eviction counters are reported with each dataset comparison."""
+        return {**dataset_cache.stats(), "disk": dataset_cache.disk_usage(), "format": dataset_cache.format}
+
+@router.get("/{dataset_id}")
+async def get_dataset(dataset_id: str):
+        try:
+                return dataset_cache.metadata(dataset_id)
+        except DatasetNotFoundError:
+                raise HTTPException(status_code=404, detail=f"Dataset '{dataset_id}' not found")
+
+@router.delete("/{dataset_id}")
+async def delete_dataset(dataset_id: str):
+        """Delete a dataset and every cached comparison result computed from it."""
+        result_cache.invalidate(dataset_id)
+        try:
+                return dataset_cache.delete(dataset_id)
+        except DatasetNotFoundError:
+                raise HTTPException(status_code=404, detail=f"Dataset '{dataset_id}' not found")
@@ -0,0 +1,14 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from services.metrics import metrics
+
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+router = APIRouter()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+        """Prometheus text exposition: stage latency histograms, bytes parsed, rows
+        compared, rule evaluations, transform failures and warnings by kind.
+        Comparisons run in job workers; their metrics are added here as jobs finish."""
+        return PlainTextResponse(metrics.render(), media_type=PROMETHEUS_MEDIA_TYPE)
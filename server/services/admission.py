@@ -0,0 +1,210 @@
+import asyncio
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import pandas as pd
+
+from config import config
+from services.csv_loader import required_columns
+from services.dataset_cache import DatasetRef, dataset_cache
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Peak memory of a comparison over the size of its parsed frames (mapped copies,
+# join frames, result lists), measured on benchmarks.datagen data
+FRAME_WORKING_SET = 1.6
+
+class AdmissionRejectedError(RuntimeError):
+    """Raised when a comparison cannot be admitted within the memory budget."""
+
+def _column_fraction(header, needed):
+    if needed is None or not len(header):
+        return 1.0
+    return max(len([c for c in header if c in needed]), 1) / len(header)
+
+def _header(path):
+    try:
+        return pd.read_csv(path, nrows=0).columns
+    except (ValueError, UnicodeDecodeError, pd.errors.ParserError):
+        # Unreadable headers fail in the job itself; estimate from the whole file
+        return []
+
+def estimate_source(source, mapping, side):
+    """
+    Estimated peak bytes of comparing one input: a CSV's size scaled by the share
+    of its columns the mapping parses, times ADMISSION_MEMORY_FACTOR; a registered
+    dataset's in-memory size scaled the same way, times FRAME_WORKING_SET.
+    """
+    needed = required_columns(mapping, side)
+    if isinstance(source, DatasetRef):
+        meta = dataset_cache.metadata(source.dataset_id)
+        return int(meta["memory_bytes"] * _column_fraction(meta["columns"], needed) * FRAME_WORKING_SET)
+    if isinstance(source, (str, os.PathLike)):
+        size = os.path.getsize(source)
+        header = _header(source) if needed is not None else []
+    else:
+        size = len(source)
+        header = []
+    return int(size * _column_fraction(header, needed) * config.ADMISSION_MEMORY_FACTOR)
+
+def estimate_comparison(sources, mapping):
+    """Estimated peak bytes of one external / velaris comparison while it runs (its retained result is not included)."""
+    from services.pipeline import use_out_of_core
+
+    if use_out_of_core(sources[0], sources[1], mapping):
+        # Chunks and partition pairs are sized to stay within this budget
+        return config.OUT_OF_CORE_MEMORY_MB * 1024 * 1024
+    return sum(estimate_source(source, mapping, side) for source, side in zip(sources, ("external", "velaris")))
+
+def estimate_batch(external_source, targets):
+    """Estimated peak bytes of a batch job: the external side once, plus the BATCH_WORKERS largest targets."""
+    external = max(estimate_source(external_source, mapping, "external") for _, mapping in targets)
+    velaris = sorted((estimate_source(source, mapping, "velaris") for source, mapping in targets), reverse=True)
+    return external + sum(velaris[:config.BATCH_WORKERS])
+
+class Reservation:
+    def __init__(self, controller, reservation_id, nbytes, label):
+        self.controller = controller
+        self.id = reservation_id
+        self.bytes = nbytes
+        self.label = label
+        self.granted_at = time.time()
+
+    def release(self):
+        """Return the reserved bytes to the budget (idempotent; callable from any thread)."""
+        self.controller._release(self)
+
+    def to_dict(self):
+        return {"id": self.id, "bytes": self.bytes, "label": self.label, "granted_at": self.granted_at}
+
+class AdmissionController:
+    """
+    Memory budget shared by the comparisons in flight.
+    Each comparison reserves its estimated peak memory before it is queued and
+    releases it when its job finishes. A request that does not fit waits, in
+    arrival order, for up to `wait_seconds`; it is rejected right away when
+    `max_queue` requests are already waiting, or once its wait runs out.
+    An estimate above the whole budget is capped to it, so such a request runs
+    alone instead of never. A budget of 0 (or less) means no limit.
+    Reservations may be released from any thread.
+
+    The budget only covers comparisons while they run. What outlives them is
+    not counted: results retained for paging and jobs (JOB_RESULT_MB), memoized
+    results (RESULT_CACHE_MB) and the dataset and stage caches
+    (DATASET_CACHE_MB, STAGE_CACHE_MB per process). Each of those is bounded
+    by its own setting, so steady-state memory is this budget plus theirs.
+    """
+
+    def __init__(self, budget_bytes, max_queue, wait_seconds):
+        self.budget = budget_bytes
+        self.max_queue = max_queue
+        self.wait_seconds = wait_seconds
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._reservations = {}
+        self._reserved = 0
+        self._waiters = deque()
+        self.rejected = 0
+
+    def _publish(self):
+        metrics.set("admission_reserved_bytes", self._reserved)
+        metrics.set("admission_in_flight", len(self._reservations))
+        metrics.set("admission_queue_depth", len(self._waiters))
+
+    def _grant(self, nbytes, label):
+        reservation = Reservation(self, next(self._ids), nbytes, label)
+        self._reservations[reservation.id] = reservation
+        self._reserved += nbytes
+        return reservation
+
+    def _fits(self, nbytes):
+        return self._reserved + nbytes <= self.budget
+
+    def _reject(self, message):
+        self.rejected += 1
+        metrics.inc("admission_rejections_total")
+        self._publish()
+        raise AdmissionRejectedError(message)
+
+    async def reserve(self, nbytes, label=""):
+        """Reserve nbytes, waiting for room if needed; raises AdmissionRejectedError."""
+        if self.budget <= 0:
+            # No limit: admitted at once, only tracked for stats
+            with self._lock:
+                reservation = self._grant(int(nbytes), label)
+                self._publish()
+            return reservation
+        if nbytes > self.budget:
+            logger.warning(f"Estimated {nbytes / 2**20:.0f} MB for {label or 'a comparison'} exceeds the whole budget; it will run alone")
+        nbytes = min(int(nbytes), self.budget)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if not self._waiters and self._fits(nbytes):
+                reservation = self._grant(nbytes, label)
+                self._publish()
+                return reservation
+            if len(self._waiters) >= self.max_queue:
+                self._reject(f"Memory budget exhausted and {len(self._waiters)} comparisons are already waiting")
+            waiter = {"bytes": nbytes, "label": label, "loop": loop, "future": loop.create_future(), "reservation": None}
+            self._waiters.append(waiter)
+            self._publish()
+        try:
+            await asyncio.wait({waiter["future"]}, timeout=self.wait_seconds)
+        except BaseException:
+            # Cancelled (e.g. the client went away): hand back a grant that raced the cancellation
+            reservation = self._withdraw(waiter)
+            if reservation is not None:
+                reservation.release()
+            raise
+        reservation = self._withdraw(waiter)
+        if reservation is None:
+            with self._lock:
+                self._reject(f"Memory budget exhausted; waited {self.wait_seconds:g}s for {nbytes / 2**20:.0f} MB")
+        return reservation
+
+    def _withdraw(self, waiter):
+        """Stop waiting: returns the reservation granted meanwhile, or None after leaving the queue."""
+        with self._lock:
+            if waiter["reservation"] is None:
+                self._waiters.remove(waiter)
+                # Waiters queued behind a large one may fit now
+                self._drain()
+                self._publish()
+            return waiter["reservation"]
+
+    def _drain(self):
+        # First come, first served: a large head waiter is not overtaken by smaller ones
+        while self._waiters and self._fits(self._waiters[0]["bytes"]):
+            waiter = self._waiters.popleft()
+            waiter["reservation"] = self._grant(waiter["bytes"], waiter["label"])
+            waiter["loop"].call_soon_threadsafe(_wake, waiter["future"])
+
+    def _release(self, reservation):
+        with self._lock:
+            if self._reservations.pop(reservation.id, None) is None:
+                return
+            self._reserved -= reservation.bytes
+            self._drain()
+            self._publish()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "budget_bytes": self.budget,
+                "reserved_bytes": self._reserved,
+                "in_flight": [r.to_dict() for r in self._reservations.values()],
+                "queue_depth": len(self._waiters),
+                "queued_bytes": sum(w["bytes"] for w in self._waiters),
+                "rejected": self.rejected,
+            }
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+admission = AdmissionController(config.ADMISSION_MEMORY_MB * 1024 * 1024, config.ADMISSION_MAX_QUEUE, config.ADMISSION_WAIT_SECONDS)
@@ -1,3 +1,18 @@
+import logging
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from config import config as app_config
+from services.fuzzy_match import fuzzy_options, probable_matches
+from services.mapping_engine import key_columns, key_customs, stringify
+from services.metrics import metrics, warn
+
+logger = logging.getLogger(__name__)
+
 # Dynamic comparison rules registry - add new rules here
 COMPARISON_REGISTRY = {
     "equals": lambda a, b: a == b,
@@ -8,6 +23,11 @@ COMPARISON_REGISTRY = {
     "not_equals": lambda a, b: a != b,
     "greater_than": lambda a, b: float(a) > float(b) if str(a).replace('.','',1).isdigit() and str(b).replace('.','',1).isdigit() else False,
     "less_than": lambda a, b: float(a) < float(b) if str(a).replace('.','',1).isdigit() and str(b).replace('.','',1).isdigit() else False,
+    # Typed rules (see TYPED_COMPARISON_REGISTRY), here with default rule_options
+    "numeric_equals": lambda a, b: _typed_scalar("numeric_equals", a, b),
+    "numeric_greater_than": lambda a, b: _typed_scalar("numeric_greater_than", a, b),
+    "numeric_less_than": lambda a, b: _typed_scalar("numeric_less_than", a, b),
+    "date_equals": lambda a, b: _typed_scalar("date_equals", a, b),
 }
 
 def compare_values(a, b, rule):
@@ -19,87 +39,974 @@ def compare_values(a, b, rule):
         try:
             return COMPARISON_REGISTRY[rule](a, b)
         except Exception as e:
-            print(f"Warning: Error in comparison rule '{rule}': {e}")
+            # Called per cell: errors are counted, not logged one by one
+            metrics.inc("warnings_total", warning="rule_error")
+            logger.debug(f"Error in comparison rule '{rule}': {e}")
             return False
     else:
-        print(f"Warning: Unknown rule '{rule}', defaulting to 'equals'")
+        _warn_unknown_rule(rule)
         return a == b
 
-def compare_records(external, velaris, config):
-    key_e = config["key_fields"]["external_field"]
-    key_v = config["key_fields"]["velaris_field"]
-    compare_only_mapped = config.get("compare_only_mapped", True)
+@lru_cache(maxsize=None)
+def _warn_unknown_rule(rule):
+    """compare_values runs per cell, so an unknown rule is reported once per rule."""
+    warn(logger, "unknown_rule", f"Unknown comparison rule '{rule}', comparing values with ==")
 
-    # Validate key fields exist
-    if key_e not in external.columns:
-        raise ValueError(f"Key field '{key_e}' not found in external CSV")
-    if key_v not in velaris.columns:
-        raise ValueError(f"Key field '{key_v}' not found in velaris CSV")
+# Column-level helpers used by the vectorized rules
 
-    external = external.set_index(key_e)
-    velaris = velaris.set_index(key_v)
+def _as_object(values):
+    """Return the values as a numpy object array (Python scalars, like the per-cell rules see)."""
+    return np.asarray(values, dtype=object)
 
-    results = {
-        "matched": [],
-        "mismatched": [],
-        "missing_in_velaris": [],
-        "missing_in_external": [],
-        "compare_mode": "mapped_fields_only" if compare_only_mapped else "all_fields"
-    }
+def _elementwise(test, a, b):
+    """
+    Apply test(str(x), str(y)) to every aligned pair of cells. Works on object
+    arrays: fixed-width numpy strings would drop trailing NULs and size every
+    cell to the column's longest value.
+    """
+    return np.fromiter(map(test, stringify(a), stringify(b)), dtype=bool, count=len(a))
+
+def _digit_floats(values):
+    """Parse values the way the scalar ordering rules do: digits with at most one '.'."""
+    text = pd.Series(stringify(values), dtype=object)
+    valid = text.str.replace('.', '', n=1, regex=False).str.isdigit().to_numpy(dtype=bool)
+    numbers = pd.to_numeric(text.where(valid), errors="coerce").to_numpy(dtype=float)
+    return numbers, valid
+
+def _vec_equals(a, b):
+    if a.dtype == b.dtype and a.dtype.kind in "biufcmM":
+        return a.to_numpy() == b.to_numpy()
+    return _as_object(a) == _as_object(b)
+
+def _vec_not_equals(a, b):
+    return ~_vec_equals(a, b)
+
+def _vec_case_insensitive_equals(a, b):
+    return (pd.Series(stringify(a)).str.lower() == pd.Series(stringify(b)).str.lower()).to_numpy(dtype=bool)
+
+def _vec_greater_than(a, b):
+    fa, valid_a = _digit_floats(a)
+    fb, valid_b = _digit_floats(b)
+    return valid_a & valid_b & (fa > fb)
+
+def _vec_less_than(a, b):
+    fa, valid_a = _digit_floats(a)
+    fb, valid_b = _digit_floats(b)
+    return valid_a & valid_b & (fa < fb)
+
+# Vectorized counterparts of COMPARISON_REGISTRY.
+# Each entry receives two aligned Series and returns a boolean numpy array.
+# Rules without an entry here fall back to compare_values cell by cell.
+VECTORIZED_COMPARISON_REGISTRY = {
+    "equals": _vec_equals,
+    "case_insensitive_equals": _vec_case_insensitive_equals,
+    "contains": lambda a, b: _elementwise(lambda x, y: x in y, a, b),
+    "starts_with": lambda a, b: _elementwise(lambda x, y: y.startswith(x), a, b),
+    "ends_with": lambda a, b: _elementwise(lambda x, y: y.endswith(x), a, b),
+    "not_equals": _vec_not_equals,
+    "greater_than": _vec_greater_than,
+    "less_than": _vec_less_than,
+}
+
+# Typed rules
+#
+# Each side's column is parsed once (distinct values only) into float64 or UTC
+# timestamps and the rule is evaluated on the arrays. A cell that is present
+# but does not parse fails the check and is reported as unparseable; two
+# missing cells are equal, one missing cell is a mismatch. Options come from
+# the mapping's "rule_options"; any option may be given per side by prefixing
+# it with "external_" / "velaris_" (e.g. "velaris_format").
+#
+#   numeric_*:   thousands (","), decimal ("."),
+#                abs_tol (0) and rel_tol (0) for numeric_equals
+#   date_equals: format (strftime, default: any ISO-like / mixed format),
+#                timezone for values without an offset ("UTC"), dayfirst (false),
+#                tolerance_seconds (0)
+
+SIDES = ("external", "velaris")
+
+TZ_SUFFIX_PATTERN = r"(?:Z|[+-]\d{2}:?\d{2})$"
+# Year-first dates (ISO 8601 and the like), which dayfirst must not turn into Y-D-M
+YEAR_FIRST_PATTERN = r"\d{4}[-/.]\d{1,2}[-/.]\d{1,2}(?:$|[T ])"
+
+def _side_option(options, side, name, default=None):
+    return options.get(f"{side}_{name}", options.get(name, default))
+
+def _missing_cells(values):
+    """Missing values and blank strings, which typed rules treat as empty rather than unparseable."""
+    missing = pd.isna(values).to_numpy(dtype=bool, copy=True)
+    if values.dtype == object or pd.api.types.is_string_dtype(values.dtype):
+        blank = np.array([isinstance(x, str) and not x.strip() for x in _as_object(values)], dtype=bool)
+        missing |= blank
+    return missing
+
+def _parse_distinct(values, missing, parse):
+    """Run parse over the distinct present values once; returns (parsed values per cell, distinct parsed)."""
+    codes, uniques = pd.factorize(pd.Series(_as_object(values)[~missing], dtype=object))
+    parsed = parse(pd.Series(uniques, dtype=object).map(str).str.strip())
+    return codes, parsed
+
+def parse_numbers(values, thousands=",", decimal="."):
+    """
+    Parse a column into float64 once: negatives, scientific notation and
+    thousands separators are understood. Returns (numbers, missing, unparseable).
+    """
+    if thousands == decimal:
+        raise ValueError("rule_options 'thousands' and 'decimal' must differ")
+    values = values.reset_index(drop=True)
+    if pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+        numbers = values.to_numpy(dtype=np.float64, na_value=np.nan)
+        missing = np.isnan(numbers)
+        return numbers, missing, np.zeros(len(numbers), dtype=bool)
+
+    def parse(text):
+        if thousands:
+            text = text.str.replace(thousands, "", regex=False)
+        if decimal != ".":
+            text = text.str.replace(decimal, ".", regex=False)
+        return pd.to_numeric(text, errors="coerce").to_numpy(dtype=np.float64)
+
+    missing = _missing_cells(values)
+    codes, parsed = _parse_distinct(values, missing, parse)
+    numbers = np.full(len(values), np.nan)
+    numbers[~missing] = parsed[codes]
+    unparseable = np.zeros(len(values), dtype=bool)
+    unparseable[~missing] = np.isnan(numbers[~missing])
+    return numbers, missing, unparseable
+
+def _to_utc(timestamps, timezone):
+    """Naive timestamps are taken to be in `timezone`; aware ones are converted. Returns int64 ns (NaT as NaT)."""
+    index = pd.DatetimeIndex(timestamps)
+    if index.tz is None:
+        index = index.tz_localize(timezone, ambiguous="NaT", nonexistent="NaT")
+    return index.tz_convert("UTC").as_unit("ns").asi8
+
+def parse_dates(values, fmt=None, timezone="UTC", dayfirst=False):
+    """
+    Parse a column into UTC nanoseconds once. Strings with an offset are
+    converted to UTC, the rest are read as local time in `timezone`. dayfirst
+    (D/M/Y rather than M/D/Y) does not apply to year-first dates such as 2024-01-02.
+    Returns (ns as int64, missing, unparseable); unusable cells hold NaT's value.
+    """
+    values = values.reset_index(drop=True)
+    nat = np.iinfo(np.int64).min
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        nanos = _to_utc(values, timezone)
+        missing = nanos == nat
+        return nanos, missing, np.zeros(len(nanos), dtype=bool)
+
+    def parse(text):
+        nanos = np.full(len(text), nat, dtype=np.int64)
+        aware = text.str.contains(TZ_SUFFIX_PATTERN, regex=True).to_numpy(dtype=bool)
+        if dayfirst and not fmt:
+            year_first = text.str.match(YEAR_FIRST_PATTERN).to_numpy(dtype=bool)
+        else:
+            year_first = np.zeros(len(text), dtype=bool)
+        for utc in (True, False):
+            for first in (True, False):
+                cells = (aware == utc) & (year_first == first)
+                if cells.any():
+                    parsed = pd.to_datetime(
+                        text[cells], format=fmt or "mixed", dayfirst=dayfirst and not first, utc=utc, errors="coerce",
+                    )
+                    nanos[cells] = _to_utc(parsed, timezone)
+        return nanos
+
+    missing = _missing_cells(values)
+    codes, parsed = _parse_distinct(values, missing, parse)
+    nanos = np.full(len(values), nat, dtype=np.int64)
+    nanos[~missing] = parsed[codes]
+    unparseable = ~missing & (nanos == nat)
+    return nanos, missing, unparseable
+
+def _parsed_numbers(a, b, options):
+    return [
+        parse_numbers(values, _side_option(options, side, "thousands", ","), _side_option(options, side, "decimal", "."))
+        for side, values in zip(SIDES, (a, b))
+    ]
+
+def _typed_outcome(passed, parsed):
+    """Apply the missing/unparseable conventions to a rule's outcome on parsed cells."""
+    (_, missing_a, bad_a), (_, missing_b, bad_b) = parsed
+    passed = passed & ~missing_a & ~missing_b & ~bad_a & ~bad_b
+    return passed, bad_a, bad_b
+
+def _numeric_equals(a, b, options):
+    parsed = _parsed_numbers(a, b, options)
+    (x, missing_a, _), (y, missing_b, _) = parsed
+    abs_tol = float(options.get("abs_tol", 0))
+    rel_tol = float(options.get("rel_tol", 0))
+    with np.errstate(invalid="ignore"):
+        close = np.abs(x - y) <= np.maximum(abs_tol, rel_tol * np.maximum(np.abs(x), np.abs(y)))
+    passed, bad_a, bad_b = _typed_outcome(close | (x == y), parsed)
+    return passed | (missing_a & missing_b), bad_a, bad_b
+
+def _numeric_greater_than(a, b, options):
+    parsed = _parsed_numbers(a, b, options)
+    with np.errstate(invalid="ignore"):
+        return _typed_outcome(parsed[0][0] > parsed[1][0], parsed)
+
+def _numeric_less_than(a, b, options):
+    parsed = _parsed_numbers(a, b, options)
+    with np.errstate(invalid="ignore"):
+        return _typed_outcome(parsed[0][0] < parsed[1][0], parsed)
 
-    for key in external.index:
-        if key not in velaris.index:
-            results["missing_in_velaris"].append(str(key))
+def _date_equals(a, b, options):
+    parsed = [
+        parse_dates(
+            values,
+            _side_option(options, side, "format"),
+            _side_option(options, side, "timezone", "UTC"),
+            bool(_side_option(options, side, "dayfirst", False)),
+        )
+        for side, values in zip(SIDES, (a, b))
+    ]
+    (x, missing_a, _), (y, missing_b, _) = parsed
+    tolerance = int(float(options.get("tolerance_seconds", 0)) * 1_000_000_000)
+    # Both sides are valid wherever the outcome counts, so the difference cannot involve NaT
+    close = np.abs(x.astype(np.float64) - y.astype(np.float64)) <= tolerance
+    passed, bad_a, bad_b = _typed_outcome(close, parsed)
+    return passed | (missing_a & missing_b), bad_a, bad_b
+
+# Each entry receives two aligned Series and the rule_options dict and returns
+# (passed, unparseable external cells, unparseable velaris cells) as boolean arrays.
+TYPED_COMPARISON_REGISTRY = {
+    "numeric_equals": _numeric_equals,
+    "numeric_greater_than": _numeric_greater_than,
+    "numeric_less_than": _numeric_less_than,
+    "date_equals": _date_equals,
+}
+
+RULE_OPTION_NAMES = {
+    "numeric_equals": ("thousands", "decimal", "abs_tol", "rel_tol"),
+    "numeric_greater_than": ("thousands", "decimal"),
+    "numeric_less_than": ("thousands", "decimal"),
+    "date_equals": ("format", "timezone", "dayfirst", "tolerance_seconds"),
+}
+
+def _typed_scalar(rule, a, b):
+    passed, _, _ = TYPED_COMPARISON_REGISTRY[rule](pd.Series([a], dtype=object), pd.Series([b], dtype=object), {})
+    return bool(passed[0])
+
+def check_rule_options(config):
+    """Validate rule_options of every mapping up front; raises ValueError."""
+    for m in config.get("mappings", []):
+        options = m.get("rule_options")
+        if not options:
             continue
+        rule = m.get("rule")
+        if not isinstance(options, dict):
+            raise ValueError(f"rule_options of '{m.get('external_field')}' must be an object")
+        allowed = RULE_OPTION_NAMES.get(rule, ())
+        for name, value in options.items():
+            base = name.split("_", 1)[1] if name.startswith(("external_", "velaris_")) else name
+            if base not in allowed:
+                raise ValueError(f"Unknown rule_options '{name}' for rule '{rule}'")
+            if base in ("abs_tol", "rel_tol", "tolerance_seconds"):
+                try:
+                    if float(value) < 0:
+                        raise ValueError
+                except (TypeError, ValueError):
+                    raise ValueError(f"rule_options '{name}' must be a non-negative number")
+            elif base == "timezone":
+                try:
+                    pd.Timestamp("2000-01-01").tz_localize(value)
+                except Exception:
+                    raise ValueError(f"Unknown timezone '{value}' in rule_options '{name}'")
+        for side in SIDES:
+            if _side_option(options, side, "thousands", ",") == _side_option(options, side, "decimal", "."):
+                raise ValueError("rule_options 'thousands' and 'decimal' must differ")
+
+def evaluate_rule(a, b, rule, options=None):
+    """
+    Evaluate a rule over two aligned Series at once. Returns (passed, unparsed)
+    where unparsed is None for untyped rules, else a pair of boolean arrays
+    marking external / velaris cells that could not be parsed.
+    """
+    typed = TYPED_COMPARISON_REGISTRY.get(rule)
+    if typed is None:
+        return compare_columns(a, b, rule), None
+    a = a.reset_index(drop=True)
+    b = b.reset_index(drop=True)
+    passed, bad_a, bad_b = typed(a, b, options or {})
+    return np.asarray(passed, dtype=bool), (bad_a, bad_b)
+
+def compare_columns(a, b, rule):
+    """
+    Vectorized compare_values: evaluate a rule over two aligned Series at once.
+    Returns a boolean numpy array with one entry per row.
+    """
+    a = a.reset_index(drop=True)
+    b = b.reset_index(drop=True)
+    if rule in TYPED_COMPARISON_REGISTRY:
+        return evaluate_rule(a, b, rule)[0]
+    if rule not in COMPARISON_REGISTRY:
+        warn(logger, "unknown_rule", f"Unknown rule '{rule}', defaulting to 'equals'")
+        rule = "equals"
+    vectorized = VECTORIZED_COMPARISON_REGISTRY.get(rule)
+    if vectorized is not None:
+        try:
+            return np.asarray(vectorized(a, b), dtype=bool)
+        except Exception as e:
+            warn(logger, "vectorized_rule_fallback", f"Vectorized rule '{rule}' failed ({e}), comparing cell by cell")
+    return np.array([bool(compare_values(x, y, rule)) for x, y in zip(_as_object(a), _as_object(b))], dtype=bool)
+
+@dataclass(frozen=True)
+class BoolKey:
+    """A boolean key value; unlike True and False themselves it never equals (or hashes like) 1 or 0."""
+    value: bool
+
+    # Merges sort mixed object keys, so order BoolKeys before any other value
+    def __lt__(self, other):
+        return not isinstance(other, BoolKey) or self.value < other.value
+
+    def __gt__(self, other):
+        return isinstance(other, BoolKey) and self.value > other.value
+
+def _numeric_key(dtype):
+    return pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+
+def key_objects(keys):
+    """
+    Key values as an object array for the join, booleans wrapped in BoolKey:
+    Index lookups never find True under 1 (or 1 under True), so neither does the join.
+    """
+    values = _as_object(keys)
+    if pd.api.types.infer_dtype(values, skipna=True) in ("string", "empty", "integer", "floating", "mixed-integer-float"):
+        return values
+    flags = np.fromiter((isinstance(v, (bool, np.bool_)) for v in values), dtype=bool, count=len(values))
+    if flags.any():
+        values = values.copy()
+        values[flags] = [BoolKey(bool(v)) for v in values[flags]]
+    return values
+
+def align_key_dtypes(ext_keys, vel_keys):
+    """
+    Merge refuses e.g. int64 vs object keys; fall back to object (hash/eq) semantics like
+    Index lookups, where booleans only ever match booleans (see key_objects).
+    """
+    if ext_keys.dtype == vel_keys.dtype != object or (_numeric_key(ext_keys.dtype) and _numeric_key(vel_keys.dtype)):
+        return ext_keys, vel_keys
+    return tuple(pd.Series(key_objects(keys), index=keys.index, name=keys.name, dtype=object) for keys in (ext_keys, vel_keys))
+
+def _key_frame(keys):
+    keys = keys.reset_index(drop=True)
+    return pd.DataFrame({
+        "key": keys,
+        "occurrence": keys.groupby(keys, sort=False, dropna=False).cumcount(),
+        "position": np.arange(len(keys), dtype=np.int64),
+    })
+
+# Composite keys
+#
+# key_fields[<side>_field] may list several columns. Composite keys are joined
+# through a precomputed index: each row's key columns are hashed into one
+# uint64, and the single-column join runs on those hashes. Paired keys are then
+# verified column by column; on a hash collision (or for columns whose hashes
+# would not agree with ==, like mixed objects) the index is rebuilt exactly by
+# grouping on the key columns themselves.
+
+KEY_SEPARATOR = "|"
+
+def check_key_fields(config):
+    """Validate the shape of key_fields; raises ValueError."""
+    columns = {side: key_columns(config, side) for side in SIDES}
+    if not columns["external"] or not columns["velaris"]:
+        raise ValueError("key_fields must name a key column for both sides")
+    if len(columns["external"]) != len(columns["velaris"]):
+        raise ValueError("key_fields must list the same number of external and velaris columns")
+    for side in SIDES:
+        if not all(isinstance(c, str) for c in columns[side]):
+            raise ValueError(f"key_fields.{side}_field must be a column name or a list of column names")
+        if len(key_customs(config, side)) != len(columns[side]):
+            raise ValueError(f"key_fields.{side}_custom lists more transforms than there are key columns")
+
+def key_values(external, velaris, config):
+    """
+    Both sides' keys: Series for a single key column, DataFrames for composite
+    keys. Raises ValueError when key_fields is malformed or names a missing column.
+    """
+    check_key_fields(config)
+    keys = []
+    for side, df in zip(SIDES, (external, velaris)):
+        columns = key_columns(config, side)
+        # Validate key fields exist
+        for column in columns:
+            if column not in df.columns:
+                raise ValueError(f"Key field '{column}' not found in {side} CSV")
+        keys.append(df[columns[0]] if len(columns) == 1 else df[columns])
+    return keys
 
-        diff = {}
-        has_field_mappings = False
-        
-        if compare_only_mapped:
-            # Compare only the mapped fields
-            for m in config["mappings"]:
-                e = m["external_field"]
-                v = m["velaris_field"]
-                rule = m["rule"]
-
-                # Skip if the field is the key field (it's now the index, not a column)
-                if e == key_e or v == key_v:
-                    continue
-
-                # Check if fields exist in the dataframe
-                if e not in external.columns:
-                    raise ValueError(f"Field '{e}' not found in external CSV")
-                if v not in velaris.columns:
-                    raise ValueError(f"Field '{v}' not found in velaris CSV")
-
-                has_field_mappings = True
-                a = external.loc[key][e]
-                b = velaris.loc[key][v]
-
-                if not compare_values(a, b, rule):
-                    diff[e] = {"external": str(a), "velaris": str(b)}
+def _hashable_columns(ext_keys, vel_keys):
+    """Aligned key columns as arrays whose hashes agree with ==, or None if some column has no such form."""
+    ext_columns, vel_columns = [], []
+    for i in range(ext_keys.shape[1]):
+        a, b = align_key_dtypes(ext_keys.iloc[:, i], vel_keys.iloc[:, i])
+        if pd.api.types.is_numeric_dtype(a.dtype) and pd.api.types.is_numeric_dtype(b.dtype):
+            # 1 and 1.0 join as equal (as do 0.0 and -0.0), so hash numbers as normalized float64;
+            # bool columns only get here paired with another bool column
+            ext_columns.append(a.to_numpy(dtype=np.float64, na_value=np.nan) + 0.0)
+            vel_columns.append(b.to_numpy(dtype=np.float64, na_value=np.nan) + 0.0)
+        elif all(pd.api.types.infer_dtype(_as_object(k), skipna=True) in ("string", "empty") for k in (a, b)):
+            ext_columns.append(_as_object(a))
+            vel_columns.append(_as_object(b))
         else:
-            # Compare ALL fields (original behavior - match columns by name)
-            common_columns = set(external.columns) & set(velaris.columns)
-            for col in common_columns:
-                has_field_mappings = True
-                a = external.loc[key][col]
-                b = velaris.loc[key][col]
-                
-                # Use equals by default for all-field comparison
-                if not compare_values(a, b, "equals"):
-                    diff[col] = {"external": str(a), "velaris": str(b)}
-
-        # If no field mappings were checked, consider it a match (key-only matching)
-        if not has_field_mappings:
-            results["matched"].append(str(key))
-        elif diff:
-            results["mismatched"].append({"id": str(key), "differences": diff})
+            return None
+    return ext_columns, vel_columns
+
+def _row_hashes(columns):
+    return pd.Series(pd.util.hash_pandas_object(pd.DataFrame(dict(enumerate(columns))), index=False).to_numpy())
+
+def _exact_codes(ext_keys, vel_keys):
+    """One integer per distinct composite key, shared by both sides (pandas == semantics)."""
+    frames = []
+    for keys in (ext_keys, vel_keys):
+        frames.append(pd.DataFrame({i: key_objects(keys.iloc[:, i]) for i in range(keys.shape[1])}))
+    both = pd.concat(frames, ignore_index=True)
+    codes = both.groupby(list(both.columns), sort=False, dropna=False).ngroup().to_numpy()
+    return pd.Series(codes[:len(ext_keys)]), pd.Series(codes[len(ext_keys):])
+
+def _same_keys(ext_keys, vel_keys, ext_pos, vel_pos):
+    """Whether every paired row has equal key values in every column."""
+    for i in range(ext_keys.shape[1]):
+        a = _as_object(ext_keys.iloc[:, i])[ext_pos]
+        b = _as_object(vel_keys.iloc[:, i])[vel_pos]
+        if not ((a == b) | (pd.isna(a) & pd.isna(b))).all():
+            return False
+    return True
+
+class KeyIndex:
+    """
+    External side of the key join, kept for a frame that is compared against
+    several velaris frames (see pipeline.run_batch): its join codes and their
+    (key, occurrence, position) frame are built once. Both depend on the dtype
+    the keys are aligned to for the other side, so one entry is kept per
+    signature. Exact-grouped composite keys depend on both sides and are not kept.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, signature, build):
+        """(codes, join frame) for signature, calling build() for the codes the first time."""
+        with self._lock:
+            if signature not in self._entries:
+                codes = build()
+                self._entries[signature] = (codes, _key_frame(codes))
+            return self._entries[signature]
+
+def indexed_pairs(ext_keys, vel_keys, ext_index=None):
+    """
+    index_keys plus _pair_codes of the result, reusing the pairs the hash index was verified on.
+    ext_index (a KeyIndex of ext_keys) supplies the external codes and join frame when it can.
+    """
+    if not isinstance(ext_keys, pd.DataFrame):
+        codes = align_key_dtypes(ext_keys.reset_index(drop=True), vel_keys.reset_index(drop=True))
+        if ext_index is None:
+            return codes, _pair_codes(*codes)
+        _, ext_frame = ext_index.get(("key", codes[0].dtype), lambda: codes[0])
+        return codes, _pair_codes(*codes, ext_frame=ext_frame)
+    ext_keys = ext_keys.reset_index(drop=True)
+    vel_keys = vel_keys.reset_index(drop=True)
+    hashable = _hashable_columns(ext_keys, vel_keys)
+    if hashable is not None:
+        if ext_index is None:
+            ext_codes, ext_frame = _row_hashes(hashable[0]), None
         else:
-            results["matched"].append(str(key))
+            # Which hash form a column takes is fixed by its aligned dtype
+            signature = ("hash",) + tuple(c.dtype for c in hashable[0])
+            ext_codes, ext_frame = ext_index.get(signature, lambda: _row_hashes(hashable[0]))
+        codes = ext_codes, _row_hashes(hashable[1])
+        pairs = _pair_codes(*codes, ext_frame=ext_frame)
+        if _same_keys(ext_keys, vel_keys, pairs[0], pairs[1]):
+            return codes, pairs
+    codes = _exact_codes(ext_keys, vel_keys)
+    return codes, _pair_codes(*codes)
+
+def index_keys(ext_keys, vel_keys):
+    """
+    Join-ready key codes for both sides: the aligned key columns themselves for a
+    single key, one uint64 hash (or exact group id) per row for composite keys.
+    """
+    return indexed_pairs(ext_keys, vel_keys)[0]
+
+def _pair_codes(ext_codes, vel_codes, ext_frame=None):
+    pairs = (_key_frame(ext_codes) if ext_frame is None else ext_frame).merge(
+        _key_frame(vel_codes),
+        on=["key", "occurrence"],
+        how="outer",
+        suffixes=("_external", "_velaris"),
+        indicator=True,
+        sort=False,
+    )
+    side = pairs["_merge"]
+    both = pairs.loc[side == "both"].sort_values("position_external")
+    ext_only = pairs.loc[side == "left_only", "position_external"].sort_values()
+    vel_only = pairs.loc[side == "right_only", "position_velaris"].sort_values()
+    return (
+        both["position_external"].to_numpy(dtype=np.int64),
+        both["position_velaris"].to_numpy(dtype=np.int64),
+        ext_only.to_numpy(dtype=np.int64),
+        vel_only.to_numpy(dtype=np.int64),
+    )
+
+def pair_keys(ext_keys, vel_keys):
+    """
+    Outer-join two key columns (or composite key frames) and return row positions
+    for each bucket: (matched external positions, matched velaris positions,
+     external-only positions, velaris-only positions).
+
+    Duplicate keys are paired by occurrence: the n-th external row with a given
+    key is paired with the n-th velaris row with that key; surplus occurrences
+    end up in the missing buckets. All buckets keep the input row order.
+    """
+    return indexed_pairs(ext_keys, vel_keys)[1]
+
+def duplicate_order(duplicates):
+    """Indices sorting duplicate-key rows by first appearance: external rows by position, then velaris-only keys."""
+    ext_first, vel_first = duplicates[:, 0], duplicates[:, 1]
+    return np.lexsort((vel_first, ext_first, ext_first < 0))
+
+def order_duplicates(duplicates):
+    return duplicates[duplicate_order(duplicates)]
+
+def remap_duplicates(duplicates, ext_rows, vel_rows):
+    """Map duplicate_codes rows of a subset (e.g. one partition) back to the full frames' row positions."""
+    duplicates = duplicates.copy()
+    for column, rows in ((0, ext_rows), (1, vel_rows)):
+        present = duplicates[:, column] >= 0
+        duplicates[present, column] = rows[duplicates[present, column]]
+    return duplicates
+
+def _key_counts(codes):
+    frame = pd.DataFrame({"key": codes.reset_index(drop=True), "position": np.arange(len(codes), dtype=np.int64)})
+    counts = frame.groupby("key", sort=False, dropna=False)["position"].agg(["min", "size"]).reset_index()
+    # groupby re-infers an object key's dtype (e.g. to str or int64); keep both sides mergeable
+    counts["key"] = counts["key"].astype(codes.dtype)
+    return counts
+
+def duplicate_codes(ext_codes, vel_codes):
+    """
+    Keys occurring more than once on either side, as int64 rows of
+    (external first position, velaris first position, external count, velaris count)
+    with -1 / 0 where a side lacks the key, in first-appearance order.
+    """
+    if ext_codes.is_unique and vel_codes.is_unique:
+        return np.empty((0, 4), dtype=np.int64)
+    merged = _key_counts(ext_codes).merge(_key_counts(vel_codes), on="key", how="outer", suffixes=("_external", "_velaris"), sort=False)
+    counts = merged[["size_external", "size_velaris"]].fillna(0)
+    repeated = ((counts["size_external"] > 1) | (counts["size_velaris"] > 1)).to_numpy()
+    duplicates = np.column_stack([
+        merged["min_external"].fillna(-1).to_numpy(dtype=np.int64)[repeated],
+        merged["min_velaris"].fillna(-1).to_numpy(dtype=np.int64)[repeated],
+        counts["size_external"].to_numpy(dtype=np.int64)[repeated],
+        counts["size_velaris"].to_numpy(dtype=np.int64)[repeated],
+    ])
+    return order_duplicates(duplicates)
+
+def key_labels(keys, positions):
+    """Display ids of the keys at positions: str(key), or a composite key's values joined by KEY_SEPARATOR."""
+    if isinstance(keys, pd.DataFrame):
+        parts = [_as_object(keys.iloc[:, i])[positions] for i in range(keys.shape[1])]
+        return [KEY_SEPARATOR.join(str(v) for v in values) for values in zip(*parts)]
+    return [str(k) for k in _as_object(keys)[positions]]
+
+def duplicate_records(ext_keys, vel_keys, duplicates):
+    """duplicate_codes output as {"id", "external", "velaris"} records (occurrences per side)."""
+    from_external = duplicates[:, 0] >= 0
+    labels = np.empty(len(duplicates), dtype=object)
+    labels[from_external] = key_labels(ext_keys, duplicates[from_external, 0])
+    labels[~from_external] = key_labels(vel_keys, duplicates[~from_external, 1])
+    return [
+        {"id": label, "external": int(e), "velaris": int(v)}
+        for label, e, v in zip(labels, duplicates[:, 2], duplicates[:, 3])
+    ]
+
+def orphan_matches(ext_labels, vel_labels, config):
+    """
+    probable_matches bucket: near-miss pairs among the missing_in_velaris and
+    missing_in_external key labels when mapping_config "fuzzy_keys" is set
+    (see fuzzy_match.match_orphans), else []. Orphans keep their missing_* entries.
+    """
+    options = fuzzy_options(config)
+    if options is None:
+        return []
+    return probable_matches(ext_labels, vel_labels, options)
+
+def add_probable_matches(positions, ext_keys, vel_keys, config):
+    """Set positions["probable_matches"] from the global missing_* positions (after any partition merge)."""
+    if fuzzy_options(config) is None:
+        positions["probable_matches"] = []
+    else:
+        positions["probable_matches"] = orphan_matches(
+            key_labels(ext_keys, positions["missing_in_velaris"]),
+            key_labels(vel_keys, positions["missing_in_external"]),
+            config,
+        )
+    return positions
+
+def _field_checks(external, velaris, config, key_e, key_v, compare_only_mapped):
+    """Resolve the (label, external column, velaris column, rule, rule_options) checks to run."""
+    checks = []
+    if compare_only_mapped:
+        for m in config["mappings"]:
+            e = m["external_field"]
+            v = m["velaris_field"]
+
+            # Skip if the field is a key field
+            if e in key_e or v in key_v:
+                continue
+
+            if e not in external.columns:
+                raise ValueError(f"Field '{e}' not found in external CSV")
+            if v not in velaris.columns:
+                raise ValueError(f"Field '{v}' not found in velaris CSV")
+            checks.append((e, e, v, m["rule"], m.get("rule_options") or {}))
+    else:
+        # Compare ALL fields (match columns by name), using equals by default
+        velaris_columns = set(velaris.columns) - set(key_v)
+        for col in external.columns:
+            if col not in key_e and col in velaris_columns:
+                checks.append((col, col, col, "equals", {}))
+    return checks
+
+# Response shapes selected by mapping_config["result_mode"]:
+#   full    - every key and difference (default)
+#   summary - bucket counts and per-field mismatch histograms only; no per-key lists are built
+#   page    - the full result is retained and served in offset/limit windows
+RESULT_MODES = ("full", "summary", "page")
+RESULT_BUCKETS = ("matched", "mismatched", "missing_in_velaris", "missing_in_external", "duplicate_keys", "probable_matches")
+
+def get_result_mode(config):
+    mode = config.get("result_mode", "full")
+    if mode not in RESULT_MODES:
+        raise ValueError(f"Unknown result_mode '{mode}', expected one of {', '.join(RESULT_MODES)}")
+    return mode
+
+def _evaluate_checks(external, velaris, config, keys, ext_index=None):
+    """
+    Pair both key columns (keys, from key_values) and run every field check as a column mask.
+    Returns (ext_pos, vel_pos, ext_only, vel_only, failing, duplicates) where
+    duplicates is duplicate_codes output and failing holds
+    (label, paired external values, paired velaris values, sorted bad pair indices,
+    unparsed) for each check with at least one mismatch; unparsed is None for
+    untyped rules, else the (external, velaris) masks of cells that did not parse.
+    """
+    compare_only_mapped = config.get("compare_only_mapped", True)
+    (ext_codes, vel_codes), (ext_pos, vel_pos, ext_only, vel_only) = indexed_pairs(*keys, ext_index)
+    duplicates = duplicate_codes(ext_codes, vel_codes)
+    failing = []
+    if len(ext_pos):
+        key_e, key_v = key_columns(config, "external"), key_columns(config, "velaris")
+        checks = _field_checks(external, velaris, config, key_e, key_v, compare_only_mapped)
+        for label, e, v, rule, options in checks:
+            a = external[e].iloc[ext_pos]
+            b = velaris[v].iloc[vel_pos]
+            metrics.inc("rule_evaluations_total", len(ext_pos), rule=rule)
+            passed, unparsed = evaluate_rule(a, b, rule, options)
+            bad = np.flatnonzero(~passed)
+            if len(bad):
+                failing.append((label, a, b, bad, unparsed))
+    return ext_pos, vel_pos, ext_only, vel_only, failing, duplicates
+
+def _failed_mask(pairs, failing):
+    failed = np.zeros(pairs, dtype=bool)
+    for _, _, _, bad, _ in failing:
+        failed[bad] = True
+    return failed
+
+def _difference(x, y, unparsed, i):
+    """One field's entry in a mismatch's differences; typed rules flag the sides that did not parse."""
+    diff = {"external": str(x), "velaris": str(y)}
+    if unparsed is not None:
+        sides = [side for side, mask in zip(SIDES, unparsed) if mask[i]]
+        if sides:
+            diff["unparseable"] = sides
+    return diff
+
+def _unparseable_counts(failing):
+    """{field: {side: {value: cells}}} for cells that typed rules could not parse."""
+    counts = {}
+    for label, a, b, _, unparsed in failing:
+        if unparsed is None:
+            continue
+        for side, values, mask in zip(SIDES, (a, b), unparsed):
+            if mask.any():
+                histogram = pd.Series(stringify(values.iloc[np.flatnonzero(mask)])).value_counts(sort=False)
+                counts.setdefault(label, {})[side] = {value: int(n) for value, n in histogram.items()}
+    return counts
+
+def unparseable_from_differences(differences):
+    """_unparseable_counts rebuilt from difference dicts (e.g. carried forward by incremental runs)."""
+    counts = {}
+    for diff in differences:
+        for label, pair in diff.items():
+            for side in pair.get("unparseable", ()):
+                histogram = counts.setdefault(label, {}).setdefault(side, {})
+                histogram[pair[side]] = histogram.get(pair[side], 0) + 1
+    return counts
 
-    for key in velaris.index:
-        if key not in external.index:
-            results["missing_in_external"].append(str(key))
+def merge_unparseable(total, counts):
+    """Add one partition's unparseable counts into total (in place)."""
+    for label, sides in counts.items():
+        for side, histogram in sides.items():
+            merged = total.setdefault(label, {}).setdefault(side, {})
+            for value, n in histogram.items():
+                merged[value] = merged.get(value, 0) + n
+    return total
 
-    return results
+def unparseable_report(counts, top_values=None):
+    """Response block for unparseable counts: cells, distinct values and the most frequent ones per field and side."""
+    top_values = app_config.RESULT_HISTOGRAM_SIZE if top_values is None else top_values
+    report = {}
+    for label, sides in counts.items():
+        report[label] = {}
+        for side in SIDES:
+            histogram = sides.get(side)
+            if not histogram:
+                continue
+            ranked = sorted(histogram.items(), key=lambda item: (-item[1], item[0]))
+            report[label][side] = {
+                "cells": sum(histogram.values()),
+                "distinct": len(histogram),
+                "top_values": [{"value": v, "count": n} for v, n in ranked[:top_values]],
+            }
+    return report
+
+def compare_positions(external, velaris, config, detail=True, ext_index=None, keys=None):
+    """
+    Positional core of compare_records: buckets hold row positions instead of key strings.
+    Returns {"matched": external positions, "mismatched": external positions,
+             "differences": one dict per mismatched row (None unless detail),
+             "field_mismatches": {field: {(external str, velaris str): count}} (only without detail),
+             "unparseable": {field: {side: {value str: cells}}} (typed rules only),
+             "missing_in_velaris": external positions, "missing_in_external": velaris positions,
+             "duplicate_keys": duplicate_codes rows}
+    ext_index is an optional KeyIndex of the external keys; keys, the key_values
+    of both frames when the caller already holds them.
+    """
+    if keys is None:
+        keys = key_values(external, velaris, config)
+    ext_pos, vel_pos, ext_only, vel_only, failing, duplicates = _evaluate_checks(external, velaris, config, keys, ext_index)
+    differences = {}
+    field_mismatches = {}
+    for label, a, b, bad, unparsed in failing:
+        if detail:
+            for i, x, y in zip(bad, _as_object(a)[bad], _as_object(b)[bad]):
+                differences.setdefault(i, {})[label] = _difference(x, y, unparsed, i)
+        else:
+            pairs = pd.DataFrame({"external": stringify(a.iloc[bad]), "velaris": stringify(b.iloc[bad])})
+            counts = pairs.value_counts(sort=False)
+            histogram = field_mismatches.setdefault(label, {})
+            for pair, count in counts.items():
+                histogram[pair] = histogram.get(pair, 0) + int(count)
+
+    # If no field checks ran, every paired key is a match (key-only matching)
+    failed = _failed_mask(len(ext_pos), failing)
+    mismatched = np.flatnonzero(failed)
+    return {
+        "matched": ext_pos[~failed],
+        "mismatched": ext_pos[mismatched],
+        "differences": [differences[i] for i in mismatched] if detail else None,
+        "field_mismatches": None if detail else field_mismatches,
+        "unparseable": _unparseable_counts(failing),
+        "missing_in_velaris": ext_only,
+        "missing_in_external": vel_only,
+        "duplicate_keys": duplicates,
+    }
+
+class RecordTally:
+    """
+    What the summary line of a record stream needs, folded over the partitions
+    it was produced from: bucket counts, unparseable cells and, with fuzzy_keys,
+    the orphan key labels with their input row positions (orphans pair up
+    across partitions, so they are matched once every partition is done).
+    """
+
+    def __init__(self, config):
+        self.counts = dict.fromkeys(RESULT_BUCKETS, 0)
+        self.unparseable = {}
+        self.orphans = {side: [] for side in SIDES} if fuzzy_options(config) is not None else None
+        self.compare_mode = "mapped_fields_only" if config.get("compare_only_mapped", True) else "all_fields"
+
+    def merge(self, other):
+        """Add another tally (e.g. one computed in a worker process) into this one."""
+        for bucket, n in other.counts.items():
+            self.counts[bucket] += n
+        merge_unparseable(self.unparseable, other.unparseable)
+        if self.orphans is not None:
+            for side in SIDES:
+                self.orphans[side].extend(other.orphans[side])
+
+    def finish(self, config):
+        """Yield the probable_matches records, then the summary line."""
+        matches = []
+        if self.orphans is not None:
+            labels = []
+            for side in SIDES:
+                parts = self.orphans[side]
+                rows = np.concatenate([r for r, _ in parts]) if parts else np.empty(0, dtype=np.int64)
+                values = [v for _, vs in parts for v in vs]
+                labels.append([values[i] for i in np.argsort(rows, kind="stable")])
+            matches = orphan_matches(*labels, config)
+        for record in matches:
+            yield {"type": "probable_matches", **record}
+        summary = {
+            "type": "summary",
+            "counts": {**self.counts, "probable_matches": len(matches)},
+            "compare_mode": self.compare_mode,
+        }
+        if self.unparseable:
+            summary["unparseable"] = unparseable_report(self.unparseable)
+        yield summary
+
+def bucket_records(external, velaris, config, tally, chunk_size=None, rows=None):
+    """
+    The mismatched, missing_* and duplicate_keys records of iter_records for
+    one pair of frames (e.g. one partition), adding them to tally.
+    rows gives the frames' (external, velaris) row positions in the whole
+    input, which orders fuzzy_keys orphans across partitions.
+    Difference dicts are only built chunk_size rows at a time, so memory does
+    not grow with the number of mismatches.
+    """
+    chunk_size = chunk_size or app_config.STREAM_CHUNK_ROWS
+    ext_keys, vel_keys = key_values(external, velaris, config)
+    ext_pos, vel_pos, ext_only, vel_only, failing, duplicates = _evaluate_checks(external, velaris, config, (ext_keys, vel_keys))
+
+    failed = _failed_mask(len(ext_pos), failing)
+    mismatched = np.flatnonzero(failed)
+    for bucket, n in (
+        ("matched", len(ext_pos) - len(mismatched)), ("mismatched", len(mismatched)),
+        ("missing_in_velaris", len(ext_only)), ("missing_in_external", len(vel_only)), ("duplicate_keys", len(duplicates)),
+    ):
+        tally.counts[bucket] += int(n)
+    merge_unparseable(tally.unparseable, _unparseable_counts(failing))
+    if tally.orphans is not None:
+        ext_rows, vel_rows = rows if rows is not None else (np.arange(len(external)), np.arange(len(velaris)))
+        tally.orphans["external"].append((ext_rows[ext_only], key_labels(ext_keys, ext_only)))
+        tally.orphans["velaris"].append((vel_rows[vel_only], key_labels(vel_keys, vel_only)))
+
+    for start in range(0, len(mismatched), chunk_size):
+        chunk = mismatched[start:start + chunk_size]
+        differences = {}
+        for label, a, b, bad, unparsed in failing:
+            # bad is sorted, so this chunk's cells are one contiguous slice of it
+            cells = bad[np.searchsorted(bad, chunk[0]):np.searchsorted(bad, chunk[-1], side="right")]
+            for i, x, y in zip(cells, _as_object(a.iloc[cells]), _as_object(b.iloc[cells])):
+                differences.setdefault(i, {})[label] = _difference(x, y, unparsed, i)
+        for i, key in zip(chunk, key_labels(ext_keys, ext_pos[chunk])):
+            yield {"type": "mismatched", "id": key, "differences": differences[i]}
+
+    for bucket, keys, positions in (("missing_in_velaris", ext_keys, ext_only), ("missing_in_external", vel_keys, vel_only)):
+        for start in range(0, len(positions), chunk_size):
+            for key in key_labels(keys, positions[start:start + chunk_size]):
+                yield {"type": bucket, "id": key}
+
+    for start in range(0, len(duplicates), chunk_size):
+        for record in duplicate_records(ext_keys, vel_keys, duplicates[start:start + chunk_size]):
+            yield {"type": "duplicate_keys", **record}
+
+def iter_records(external, velaris, config, chunk_size=None):
+    """
+    Stream the comparison as one dict per record instead of a single result:
+    {"type": "mismatched", "id", "differences"} per mismatched key, then
+    {"type": "missing_in_velaris" | "missing_in_external", "id"} per missing key,
+    {"type": "duplicate_keys", "id", "external", "velaris"} per repeated key,
+    {"type": "probable_matches", "external_id", "velaris_id", "score"} per
+    near-miss orphan pair (fuzzy_keys only), and a final {"type": "summary", "counts", "compare_mode"} (plus "unparseable"
+    when typed rules met cells they could not parse).
+    Difference dicts are only built chunk_size rows at a time, so memory does
+    not grow with the number of mismatches.
+    """
+    tally = RecordTally(config)
+    yield from bucket_records(external, velaris, config, tally, chunk_size)
+    yield from tally.finish(config)
+
+def build_results(external_keys, velaris_keys, positions, compare_only_mapped=True):
+    """
+    Turn compare_positions output (completed by add_probable_matches) into the
+    compare_records response, given both sides' keys (see key_values).
+    """
+    result = {
+        "matched": key_labels(external_keys, positions["matched"]),
+        "mismatched": [
+            {"id": k, "differences": d}
+            for k, d in zip(key_labels(external_keys, positions["mismatched"]), positions["differences"])
+        ],
+        "missing_in_velaris": key_labels(external_keys, positions["missing_in_velaris"]),
+        "missing_in_external": key_labels(velaris_keys, positions["missing_in_external"]),
+        "duplicate_keys": duplicate_records(external_keys, velaris_keys, positions["duplicate_keys"]),
+        "probable_matches": positions["probable_matches"],
+        "compare_mode": "mapped_fields_only" if compare_only_mapped else "all_fields"
+    }
+    if positions.get("unparseable"):
+        result["unparseable"] = unparseable_report(positions["unparseable"])
+    return result
+
+def build_summary(positions, compare_only_mapped=True, top_values=None, counts=None):
+    """
+    Summary response from compare_positions(detail=False) output (completed by
+    add_probable_matches): bucket counts plus,
+    per field, the number of mismatching rows and the most frequent value pairs.
+    counts gives the bucket sizes instead when positions holds no buckets
+    (out-of-core summaries only count them).
+    """
+    top_values = app_config.RESULT_HISTOGRAM_SIZE if top_values is None else top_values
+    fields = {}
+    for label, histogram in positions["field_mismatches"].items():
+        ranked = sorted(histogram.items(), key=lambda item: (-item[1], item[0]))
+        fields[label] = {
+            "mismatches": sum(histogram.values()),
+            "distinct_pairs": len(histogram),
+            "top_values": [{"external": e, "velaris": v, "count": n} for (e, v), n in ranked[:top_values]],
+        }
+    summary = {
+        "result_mode": "summary",
+        "counts": {bucket: int(counts[bucket] if counts else len(positions[bucket])) for bucket in RESULT_BUCKETS},
+        "field_mismatches": fields,
+        "compare_mode": "mapped_fields_only" if compare_only_mapped else "all_fields"
+    }
+    if positions.get("unparseable"):
+        summary["unparseable"] = unparseable_report(positions["unparseable"], top_values)
+    return summary
+
+def paginate_results(result, offset=0, limit=None, bucket=None):
+    """
+    Window a retained full result: each bucket (or only `bucket`) is sliced to
+    [offset, offset + limit). Non-bucket keys such as filter_stats are passed through.
+    """
+    limit = app_config.RESULT_PAGE_SIZE if limit is None else limit
+    buckets = RESULT_BUCKETS if bucket is None else (bucket,)
+    if bucket is not None and bucket not in RESULT_BUCKETS:
+        raise ValueError(f"Unknown bucket '{bucket}', expected one of {', '.join(RESULT_BUCKETS)}")
+    page = {k: v for k, v in result.items() if k not in RESULT_BUCKETS}
+    page.update({
+        "result_mode": "page",
+        "offset": offset,
+        "limit": limit,
+        "totals": {b: len(result[b]) for b in RESULT_BUCKETS},
+    })
+    for b in buckets:
+        page[b] = result[b][offset:offset + limit]
+    return page
+
+def compare_records(external, velaris, config, ext_index=None):
+    """
+    Compare two mapped DataFrames on their key fields (one column or a composite key).
+    Keys are paired with a single outer join and every field check is evaluated
+    as a whole-column mask; only mismatching cells are stringified.
+    In summary result_mode no per-key lists are built at all.
+    ext_index (a KeyIndex) lets an external frame compared repeatedly reuse its side of the join.
+    """
+    mode = get_result_mode(config)
+    compare_only_mapped = config.get("compare_only_mapped", True)
+    ext_keys, vel_keys = key_values(external, velaris, config)
+    positions = compare_positions(external, velaris, config, detail=mode != "summary", ext_index=ext_index, keys=(ext_keys, vel_keys))
+    add_probable_matches(positions, ext_keys, vel_keys, config)
+    if mode == "summary":
+        return build_summary(positions, compare_only_mapped)
+    result = build_results(ext_keys, vel_keys, positions, compare_only_mapped)
+    if mode == "page":
+        result["result_mode"] = "page"
+    return result
@@ -1,14 +1,145 @@
+import numpy as np
 import pandas as pd
 
-async def compare_csv_files(file1, file2):
-    df1 = pd.read_csv(file1.file)
-    df2 = pd.read_csv(file2.file)
+DIFF_CHUNK_ROWS = 250_000
 
-    # Find unmatched rows
-    only_in_1 = df1.merge(df2, indicator=True, how="left").query('_merge == "left_only"')
-    only_in_2 = df2.merge(df1, indicator=True, how="left").query('_merge == "left_only"')
+def _source(f):
+    """UploadFile -> its underlying file; paths and file objects pass through."""
+    return getattr(f, "file", f)
 
-    return {
-        "rows_in_file1_not_in_file2": len(only_in_1),
-        "rows_in_file2_not_in_file1": len(only_in_2),
-    }
+def _rewind(source):
+    if hasattr(source, "seek"):
+        source.seek(0)
+    return source
+
+def common_columns(columns1, columns2):
+    """Columns both files share, in file1's order (what a plain merge would join on)."""
+    shared = set(columns2)
+    common = [c for c in columns1 if c in shared]
+    if not common:
+        raise ValueError("The two CSV files have no columns in common")
+    return common
+
+def _align_dtypes(df1, df2, columns):
+    """Make values a merge would join hash equally (e.g. 1 and 1.0 hash differently)."""
+    for c in columns:
+        a, b = df1[c].dtype, df2[c].dtype
+        if a == b:
+            continue
+        if pd.api.types.is_numeric_dtype(a) and pd.api.types.is_numeric_dtype(b):
+            df1[c] = df1[c].astype(np.float64)
+            df2[c] = df2[c].astype(np.float64)
+        else:
+            df1[c] = df1[c].astype(object)
+            df2[c] = df2[c].astype(object)
+
+def hash_rows(df, columns):
+    """One 64-bit hash per row over the given columns."""
+    return pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+
+def _matched_counts(hashes, other_values, other_counts):
+    """For each hash, how often it occurs in the other file (other_* from np.unique)."""
+    at = np.searchsorted(other_values, hashes)
+    found = at < len(other_values)
+    found[found] = other_values[at[found]] == hashes[found]
+    matched = np.zeros(len(hashes), dtype=np.int64)
+    matched[found] = other_counts[at[found]]
+    return matched
+
+def surplus_counts(hashes, other_hashes):
+    """
+    Multiset difference on row hashes: (distinct hashes, surplus per hash), where
+    surplus is how many occurrences the other file does not match.
+    """
+    values, counts = np.unique(hashes, return_counts=True)
+    other_values, other_counts = np.unique(other_hashes, return_counts=True)
+    return values, np.maximum(counts - _matched_counts(values, other_values, other_counts), 0)
+
+def _records(df):
+    """JSON-safe row dicts (missing values become None)."""
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+def _sample_positions(hashes, other_hashes, sample_size):
+    """
+    Positions of up to sample_size surplus rows. When a row occurs n times here
+    and m < n times in the other file, its occurrences after the first m are surplus.
+    """
+    other_values, other_counts = np.unique(other_hashes, return_counts=True)
+    occurrence = pd.Series(hashes).groupby(hashes, sort=False).cumcount().to_numpy()
+    return np.flatnonzero(occurrence >= _matched_counts(hashes, other_values, other_counts))[:sample_size]
+
+def diff_frames(df1, df2, sample_size=0):
+    """Multiset row diff of two DataFrames over their common columns."""
+    columns = common_columns(df1.columns, df2.columns)
+    df1, df2 = df1[columns].copy(), df2[columns].copy()
+    _align_dtypes(df1, df2, columns)
+    h1, h2 = hash_rows(df1, columns), hash_rows(df2, columns)
+    result = {"compared_columns": columns, "rows_in_file1": len(df1), "rows_in_file2": len(df2)}
+    for name, df, hashes, other in (("file1_not_in_file2", df1, h1, h2), ("file2_not_in_file1", df2, h2, h1)):
+        result[f"rows_in_{name}"] = int(surplus_counts(hashes, other)[1].sum())
+        if sample_size:
+            result[f"sample_rows_in_{name}"] = _records(df.iloc[_sample_positions(hashes, other, sample_size)])
+    return result
+
+def _chunks(source, columns, chunksize):
+    # Everything is read as text, so every chunk hashes a value the same way
+    # whatever types pandas would have inferred for it
+    return pd.read_csv(_rewind(source), usecols=columns, dtype=str, keep_default_na=False, chunksize=chunksize)
+
+def _chunked_hashes(source, columns, chunksize):
+    hashes = [hash_rows(chunk, columns) for chunk in _chunks(source, columns, chunksize)]
+    return np.concatenate(hashes) if hashes else np.empty(0, dtype=np.uint64)
+
+def _chunked_samples(source, columns, chunksize, values, surplus, other_hashes, sample_size):
+    """Second pass over a file collecting up to sample_size surplus rows."""
+    offending = values[surplus > 0]
+    if not len(offending) or not sample_size:
+        return []
+    other_values, other_counts = np.unique(other_hashes, return_counts=True)
+    allowed = dict(zip(offending.tolist(), _matched_counts(offending, other_values, other_counts).tolist()))
+    seen = {}
+    samples = []
+    for chunk in _chunks(source, columns, chunksize):
+        hashes = hash_rows(chunk, columns)
+        for i in np.flatnonzero(np.isin(hashes, offending)):
+            h = int(hashes[i])
+            seen[h] = seen.get(h, 0) + 1
+            if seen[h] > allowed[h]:
+                samples.append(chunk.iloc[i][columns].to_dict())
+                if len(samples) == sample_size:
+                    return samples
+    return samples
+
+def diff_csv_chunked(source1, source2, sample_size=0, chunksize=DIFF_CHUNK_ROWS):
+    """
+    diff_frames for files larger than memory: rows are streamed in chunks and
+    only their 64-bit hashes are kept (8 bytes per row). Values are compared as
+    text, so e.g. "1" and "1.0" differ. Samples take a second pass over the files.
+    """
+    columns = common_columns(
+        pd.read_csv(_rewind(source1), nrows=0).columns,
+        pd.read_csv(_rewind(source2), nrows=0).columns,
+    )
+    h1 = _chunked_hashes(source1, columns, chunksize)
+    h2 = _chunked_hashes(source2, columns, chunksize)
+    result = {"compared_columns": columns, "rows_in_file1": len(h1), "rows_in_file2": len(h2)}
+    for name, source, hashes, other in (("file1_not_in_file2", source1, h1, h2), ("file2_not_in_file1", source2, h2, h1)):
+        values, surplus = surplus_counts(hashes, other)
+        result[f"rows_in_{name}"] = int(surplus.sum())
+        if sample_size:
+            result[f"sample_rows_in_{name}"] = _chunked_samples(source, columns, chunksize, values, surplus, other, sample_size)
+    return result
+
+async def compare_csv_files(file1, file2, sample_size=0, chunked=False, chunksize=DIFF_CHUNK_ROWS):
+    """
+    Count the rows of each file that have no counterpart in the other, comparing
+    the columns both files share. Rows are reduced to 64-bit hashes and diffed
+    as multisets, so a row present 3 times in file1 and once in file2 counts as
+    2 extra rows. sample_size > 0 also returns that many offending rows per side;
+    chunked streams both files instead of loading them (see diff_csv_chunked).
+    file1/file2 are UploadFiles, paths or file objects.
+    """
+    source1, source2 = _source(file1), _source(file2)
+    if chunked:
+        return diff_csv_chunked(source1, source2, sample_size, chunksize)
+    return diff_frames(pd.read_csv(_rewind(source1)), pd.read_csv(_rewind(source2)), sample_size)
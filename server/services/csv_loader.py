@@ -1,8 +1,89 @@
-import pandas as pd
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from io import BytesIO
 
-def read_csv(raw_bytes):
+import pandas as pd
+
+from config import config
+from services.mapping_engine import key_columns
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# How parsed columns are typed: "infer" (pandas default), "string" or "category"
+CSV_DTYPES = {
+    "infer": None,
+    "string": str,
+    "category": "category",
+}
+
+def _resolve_engine(engine):
+    if engine == "pyarrow":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            logger.warning("pyarrow is not installed, falling back to the C CSV engine")
+            return "c"
+    return engine
+
+def required_columns(mapping_config, side):
+    """
+    Columns of one side ("external" or "velaris") that a mapping_config references:
+    the key field(s), mapped fields and filter condition fields.
+    Returns None when every column is needed (compare_only_mapped = false).
+    """
+    if not mapping_config.get("compare_only_mapped", True):
+        return None
+    field = f"{side}_field"
+    needed = set(key_columns(mapping_config, side))
+    for m in mapping_config.get("mappings", []):
+        if m.get(field):
+            needed.add(m[field])
+    group = (mapping_config.get("filters") or {}).get(side) or {}
+    for condition in group.get("conditions", []):
+        if condition.get("field"):
+            needed.add(condition["field"])
+    return needed
+
+def read_csv(source, columns=None, dtype=None, engine=None):
+    """
+    Reads a CSV file from bytes or a file path and returns a Pandas DataFrame.
+    Paths are memory-mapped by the C engine instead of being loaded into memory.
+    If columns is given, only those columns (that exist in the header) are parsed.
+    dtype is one of CSV_DTYPES and engine "c" or "pyarrow"; both default to config.
+    """
+    dtype = CSV_DTYPES[dtype or config.CSV_DTYPE]
+    engine = _resolve_engine(engine or config.CSV_ENGINE)
+    is_path = isinstance(source, (str, os.PathLike))
+    buffer = source if is_path else BytesIO(source)
+    metrics.inc("bytes_parsed_total", os.path.getsize(source) if is_path else len(source))
+
+    usecols = None
+    if columns is not None:
+        header = pd.read_csv(buffer, nrows=0).columns
+        usecols = [c for c in header if c in columns]
+        if not is_path:
+            buffer.seek(0)
+
+    options = {"memory_map": True} if is_path and engine == "c" else {}
+    return pd.read_csv(buffer, usecols=usecols, dtype=dtype, engine=engine, **options)
+
+def read_header(source):
+    """The column names of a CSV file path or bytes, or None if it has no parsable header."""
+    try:
+        return [str(c) for c in pd.read_csv(source if isinstance(source, (str, os.PathLike)) else BytesIO(source), nrows=0).columns]
+    except (pd.errors.EmptyDataError, pd.errors.ParserError, UnicodeDecodeError):
+        return None
+
+# Shared pool so concurrent requests cannot spawn unbounded parser threads
+_parse_pool = ThreadPoolExecutor(max_workers=config.CSV_PARSE_WORKERS, thread_name_prefix="csv-parse")
+
+def read_csvs(sources):
     """
-    Reads a CSV file from bytes and returns a Pandas DataFrame
+    Parse several CSVs in parallel on the parser pool.
+    sources is a list of (source, columns) pairs; frames are returned in the same order.
     """
-    return pd.read_csv(BytesIO(raw_bytes))
+    futures = [_parse_pool.submit(partial(read_csv, source, columns=columns)) for source, columns in sources]
+    return [f.result() for f in futures]
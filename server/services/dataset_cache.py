@@ -0,0 +1,291 @@
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from config import config
+from services.csv_loader import read_csv
+from services.storage import private_directory
+
+logger = logging.getLogger(__name__)
+
+DATASET_ID_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+class DatasetNotFoundError(KeyError):
+    """Raised when a dataset id has not been registered (or was deleted)."""
+
+@dataclass(frozen=True)
+class DatasetRef:
+    """A registered dataset used in place of an uploaded CSV (see pipeline.load_filtered)."""
+    dataset_id: str
+
+# Storage formats by name: file suffix, writer and reader. None of them can run
+# code when loaded; csv keeps each column's dtype in the metadata sidecar.
+DATASET_FORMATS = {
+    "parquet": (".parquet", lambda df, path: df.to_parquet(path, index=False), lambda path, meta: pd.read_parquet(path)),
+    "feather": (".feather", lambda df, path: df.to_feather(path), lambda path, meta: pd.read_feather(path)),
+    "csv": (".csv", lambda df, path: df.to_csv(path, index=False), lambda path, meta: _read_stored_csv(path, meta["dtypes"], meta.get("empty_strings", {}))),
+}
+
+# dtypes entry of an object column of booleans (read_csv's type for True/False with gaps)
+BOOL_OBJECT = "object:bool"
+
+def _stored_dtypes(df):
+    """Column dtypes as strings, for reading a csv-format dataset back without inference."""
+    return {
+        str(c): BOOL_OBJECT if t == object and pd.api.types.infer_dtype(df[c], skipna=True) == "boolean" else str(t)
+        for c, t in df.dtypes.items()
+    }
+
+def _empty_strings(df):
+    """Rows holding "" per text column; csv writes them like missing values."""
+    empty = {}
+    for c in df.columns:
+        if df[c].dtype.kind == "O":
+            rows = np.flatnonzero(df[c].to_numpy(dtype=object) == "")
+            if len(rows):
+                empty[str(c)] = rows.tolist()
+    return empty
+
+def _read_stored_csv(path, dtypes, empty_strings):
+    # Only empty fields are missing, so text such as "NA" reads back as written
+    df = pd.read_csv(path, dtype={c: object if t == BOOL_OBJECT else t for c, t in dtypes.items()}, keep_default_na=False, na_values=[""])
+    for column in [c for c, t in dtypes.items() if t == BOOL_OBJECT]:
+        df[column] = df[column].map({"True": True, "False": False})
+    for column, rows in empty_strings.items():
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].cat.add_categories([""])
+        df.loc[rows, column] = ""
+    return df
+
+def _resolve_format(fmt):
+    if fmt not in DATASET_FORMATS:
+        raise ValueError(f"Unknown DATASET_FORMAT '{fmt}', expected one of {', '.join(DATASET_FORMATS)}")
+    if fmt in ("parquet", "feather"):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            logger.warning(f"pyarrow is not installed, storing datasets as csv instead of {fmt}")
+            return "csv"
+    return fmt
+
+def _frame_bytes(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+class DatasetCache:
+    """
+    Parsed CSVs stored under the SHA-256 of their raw content.
+    Every dataset is written once to `directory` (a private 0700 directory, see
+    storage.private_directory) in one of DATASET_FORMATS (parquet or feather
+    need pyarrow, else csv is used) with a JSON metadata sidecar; recently used
+    frames are also kept in an in-process LRU bounded by `memory_budget` bytes.
+    Each process (API and job workers) has its own LRU, while the on-disk store is shared.
+    """
+
+    def __init__(self, directory: str, memory_budget: int, fmt: str = "parquet"):
+        self.directory = directory
+        self.memory_budget = memory_budget
+        self.format = _resolve_format(fmt)
+        self._frames = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.registrations_stored = 0
+        self.registrations_deduplicated = 0
+
+    def _path(self, dataset_id, suffix):
+        if not DATASET_ID_PATTERN.match(dataset_id):
+            raise DatasetNotFoundError(dataset_id)
+        return os.path.join(private_directory(self.directory), dataset_id + suffix)
+
+    def _data_path(self, dataset_id, fmt):
+        return self._path(dataset_id, DATASET_FORMATS[fmt][0])
+
+    def metadata(self, dataset_id):
+        """Stored metadata of a dataset; raises DatasetNotFoundError."""
+        try:
+            with open(self._path(dataset_id, ".json")) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            raise DatasetNotFoundError(dataset_id)
+        # Datasets stored as pickle by earlier versions are never loaded; register them again
+        if meta.get("format") not in DATASET_FORMATS:
+            raise DatasetNotFoundError(dataset_id)
+        return meta
+
+    def exists(self, dataset_id):
+        try:
+            self.metadata(dataset_id)
+            return True
+        except DatasetNotFoundError:
+            return False
+
+    def _write_atomic(self, path, write):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            write(tmp)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def store(self, dataset_id, csv_path, filename=None):
+        """Parse csv_path and persist it as dataset_id; returns its metadata."""
+        df = read_csv(csv_path)
+        write = DATASET_FORMATS[self.format][1]
+        self._write_atomic(self._data_path(dataset_id, self.format), lambda p: write(df, p))
+        meta = {
+            "dataset_id": dataset_id,
+            "filename": filename,
+            "rows": len(df),
+            "columns": [str(c) for c in df.columns],
+            "memory_bytes": _frame_bytes(df),
+            "format": self.format,
+            "dtypes": _stored_dtypes(df),
+            "created_at": time.time(),
+        }
+        # The sidecar is written last, so a dataset only "exists" once its data is complete
+        self._write_atomic(self._path(dataset_id, ".json"), lambda p: _dump_json(meta, p))
+        self._remember(dataset_id, df)
+        return meta
+
+    def _remember(self, dataset_id, df):
+        size = _frame_bytes(df)
+        if size > self.memory_budget:
+            return
+        with self._lock:
+            if dataset_id in self._frames:
+                return
+            self._frames[dataset_id] = (df, size)
+            self._bytes += size
+            while self._bytes > self.memory_budget:
+                _, (_, evicted) = self._frames.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def load(self, dataset_id, columns=None):
+        """
+        Return a registered dataset, from memory when possible.
+        If columns is given, only those columns (that exist) are returned.
+        """
+        # Checked even on a memory hit, so deleting a dataset takes effect in every process
+        try:
+            meta = self.metadata(dataset_id)
+        except DatasetNotFoundError:
+            with self._lock:
+                entry = self._frames.pop(dataset_id, None)
+                if entry is not None:
+                    self._bytes -= entry[1]
+            raise
+        with self._lock:
+            entry = self._frames.get(dataset_id)
+            if entry is not None:
+                self._frames.move_to_end(dataset_id)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if entry is not None:
+            df = entry[0]
+        else:
+            path = self._data_path(dataset_id, meta["format"])
+            if not os.path.exists(path):
+                raise DatasetNotFoundError(dataset_id)
+            df = DATASET_FORMATS[meta["format"]][2](path, meta)
+            self._remember(dataset_id, df)
+        if columns is not None:
+            df = df[[c for c in df.columns if c in columns]]
+        return df
+
+    def delete(self, dataset_id):
+        """Remove a dataset from disk and from this process's memory cache."""
+        meta = self.metadata(dataset_id)
+        with self._lock:
+            entry = self._frames.pop(dataset_id, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+        for path in (self._path(dataset_id, ".json"), self._data_path(dataset_id, meta["format"])):
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        return meta
+
+    def count_registration(self, deduplicated):
+        with self._lock:
+            if deduplicated:
+                self.registrations_deduplicated += 1
+            else:
+                self.registrations_stored += 1
+
+    def disk_usage(self):
+        """Number of stored datasets and their total size on disk."""
+        datasets, size = 0, 0
+        if os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".tmp"):
+                    continue
+                datasets += entry.name.endswith(".json")
+                size += entry.stat().st_size
+        return {"datasets": datasets, "bytes": size}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "registrations_stored": self.registrations_stored,
+                "registrations_deduplicated": self.registrations_deduplicated,
+                "entries": len(self._frames),
+                "memory_bytes": self._bytes,
+                "memory_budget_bytes": self.memory_budget,
+            }
+
+def _dump_json(obj, path):
+    with open(path, "w") as f:
+        json.dump(obj, f)
+
+def save_frame(df, stem):
+    """
+    Write a working frame (e.g. a spilled partition) to stem plus the suffix of
+    the dataset store's format, with its dtypes in a stem.json sidecar; the
+    index is dropped. Pickle is never used, so load_frame cannot run code.
+    """
+    fmt = dataset_cache.format
+    suffix, write, _ = DATASET_FORMATS[fmt]
+    df = df.reset_index(drop=True)
+    meta = {"format": fmt, "dtypes": _stored_dtypes(df)}
+    if fmt == "csv":
+        meta["empty_strings"] = _empty_strings(df)
+    write(df, stem + suffix)
+    _dump_json(meta, stem + ".json")
+
+def load_frame(stem):
+    """Read back a frame written by save_frame; raises FileNotFoundError if there is none."""
+    with open(stem + ".json") as f:
+        meta = json.load(f)
+    suffix, _, read = DATASET_FORMATS[meta["format"]]
+    return read(stem + suffix, meta)
+
+def store_dataset(dataset_id, csv_path, filename=None):
+    """Job-pool entry point: parse and persist an uploaded CSV into the shared store."""
+    if dataset_cache.exists(dataset_id):
+        return dataset_cache.metadata(dataset_id)
+    return dataset_cache.store(dataset_id, csv_path, filename)
+
+dataset_cache = DatasetCache(
+    config.DATASET_DIR or os.path.join(tempfile.gettempdir(), "velaris-datasets"),
+    config.DATASET_CACHE_MB * 1024 * 1024,
+    config.DATASET_FORMAT,
+)
@@ -3,6 +3,7 @@ from pydantic import BaseModel, Field
 from datetime import datetime
 import re
 import logging
+import numpy as np
 import pandas as pd
 
 logger = logging.getLogger(__name__)
@@ -24,28 +25,33 @@ class FilterGroup(BaseModel):
 
 # Coercion helper
 
+def _coerce(value: Any, target_type: DataType) -> Any:
+    """Coerce a non-None value, raising ValueError/TypeError when it cannot be converted."""
+    if target_type == 'string':
+        return str(value)
+    elif target_type == 'number':
+        if isinstance(value, (int, float)):
+            return value
+        return float(value)
+    elif target_type == 'boolean':
+        if isinstance(value, bool):
+            return value
+        return str(value).lower() == 'true'
+    elif target_type == 'date':
+        if isinstance(value, datetime):
+            return value
+        return datetime.fromisoformat(str(value))
+    return value
+
+
 def coerce_value(value: Any, target_type: DataType) -> Any:
     if value is None:
         return None
     try:
-        if target_type == 'string':
-            return str(value)
-        elif target_type == 'number':
-            if isinstance(value, (int, float)):
-                return value
-            return float(value)
-        elif target_type == 'boolean':
-            if isinstance(value, bool):
-                return value
-            return str(value).lower() == 'true'
-        elif target_type == 'date':
-            if isinstance(value, datetime):
-                return value
-            return datetime.fromisoformat(str(value))
+        return _coerce(value, target_type)
     except (ValueError, TypeError):
         logger.warning(f"Failed to coerce value '{value}' to type '{target_type}'")
         return None
-    return value
 
 
 def evaluate_condition(record: Dict[str, Any], condition: FilterCondition) -> bool:
@@ -104,6 +110,133 @@ def evaluate_group(record: Dict[str, Any], group: FilterGroup) -> bool:
     return any(results)
 
 
+# Vectorized filter compiler
+#
+# Each referenced column is coerced once per DataType into a (values, failed)
+# pair, where `failed` marks cells that coerce_value would turn into None.
+# Conditions then become whole-column masks with the same outcomes as
+# evaluate_condition: failed cells only satisfy `not_equals`.
+
+def _try_coerce(value: Any, target_type: DataType) -> Any:
+    """Like coerce_value, but failures are left to the caller to report in aggregate."""
+    if value is None:
+        return None
+    try:
+        return _coerce(value, target_type)
+    except (ValueError, TypeError):
+        return None
+
+
+def _coerce_distinct(raw: np.ndarray, target_type: DataType, field: str) -> np.ndarray:
+    """Coerce each distinct value once and broadcast back; NA cells (None/NaN) map to None."""
+    codes, uniques = pd.factorize(raw)
+    parsed = [_try_coerce(u, target_type) for u in uniques]
+    failures = sum(p is None for p in parsed)
+    if failures:
+        logger.warning(f"Failed to coerce {failures} distinct value(s) in '{field}' to type '{target_type}'")
+    return np.array(parsed + [None], dtype=object)[codes]
+
+
+def _record_values(series: pd.Series) -> np.ndarray:
+    """Cells as row.to_dict() yields them: missing cells of nullable (pd.NA) dtypes become None."""
+    if getattr(series.dtype, 'na_value', None) is pd.NA:
+        return series.to_numpy(dtype=object, na_value=None)
+    return np.asarray(series, dtype=object)
+
+
+def _coerce_column(series: pd.Series, target_type: DataType) -> Tuple[np.ndarray, np.ndarray]:
+    """Coerce a whole column once; returns (values, failed) where failed marks cells coerce_value maps to None."""
+    raw = _record_values(series)
+    failed = raw == None  # noqa: E711 - elementwise identity test against None
+    if target_type == 'string':
+        values = np.array(['' if f else str(x) for x, f in zip(raw, failed)], dtype=object)
+        return pd.Series(values, dtype=object).str.lower().to_numpy(dtype=object), failed
+    if target_type == 'number':
+        numbers = pd.to_numeric(pd.Series(raw, dtype=object), errors='coerce').to_numpy(dtype=float, copy=True)
+        # to_numeric is stricter than float() (e.g. '1_000'); retry the leftovers with float()
+        retry = np.isnan(numbers) & ~pd.isna(raw)
+        if retry.any():
+            parsed = _coerce_distinct(raw[retry], 'number', series.name)
+            numbers[retry] = [np.nan if p is None else p for p in parsed]
+        # NaN compares exactly like a failed coercion for every operator
+        return numbers, np.isnan(numbers)
+    if target_type == 'boolean':
+        if pd.api.types.is_bool_dtype(series.dtype):
+            return series.to_numpy(dtype=bool, na_value=False), failed
+        values = np.array([x if isinstance(x, bool) else str(x).lower() == 'true' for x in raw], dtype=bool)
+        return values, failed
+    # date: NaN stringifies to 'nan', which never parses, so every NA cell fails
+    values = _coerce_distinct(raw, 'date', series.name)
+    return values, values == None  # noqa: E711
+
+
+def _compare(op: str, left: Any, right: Any) -> Any:
+    try:
+        if op == 'equals':
+            return left == right
+        if op == 'not_equals':
+            return left != right
+        if op == 'greater_than':
+            return left > right
+        if op == 'less_than':
+            return left < right
+    except TypeError:
+        logger.warning(f"Type error comparing {left if np.ndim(left) == 0 else 'column'} {op} {right}")
+    return False
+
+
+def _condition_mask(df: pd.DataFrame, condition: FilterCondition, cache: Dict[Tuple[str, str], Tuple[np.ndarray, np.ndarray]]) -> np.ndarray:
+    n = len(df)
+    if condition.field not in df.columns:
+        # Missing field -> fail condition (not_null included, as record.get() yields None)
+        return np.zeros(n, dtype=bool)
+    if condition.operator == 'not_null':
+        return _record_values(df[condition.field]) != None  # noqa: E711
+
+    op = condition.operator
+    target = coerce_value(condition.value, condition.data_type)
+    if target is None:
+        return np.full(n, op == 'not_equals', dtype=bool)
+    if condition.data_type == 'string' and isinstance(target, str):
+        target = target.lower()
+
+    key = (condition.field, condition.data_type)
+    if key not in cache:
+        cache[key] = _coerce_column(df[condition.field], condition.data_type)
+    values, failed = cache[key]
+
+    valid = ~failed
+    result = np.zeros(n, dtype=bool)
+    if op in ('contains', 'regex'):
+        if condition.data_type == 'string':
+            text = pd.Series(values[valid], dtype=object)
+            if op == 'contains':
+                hits = text.str.contains(str(target), regex=False)
+            else:
+                hits = text.str.match(re.compile(str(target)))
+            result[valid] = hits.to_numpy(dtype=bool)
+    elif condition.data_type == 'date':
+        # Parsed datetimes may mix naive and aware values; compare once per distinct value
+        codes, uniques = pd.factorize(values[valid])
+        outcome = np.array([bool(_compare(op, u, target)) for u in uniques] + [False], dtype=bool)
+        result[valid] = outcome[codes]
+    else:
+        result[valid] = _compare(op, values[valid], target)
+    if op == 'not_equals':
+        result[failed] = True
+    return result
+
+
+def compile_filter_mask(df: pd.DataFrame, group: FilterGroup) -> pd.Series:
+    """Compile a FilterGroup into one boolean Series aligned with df (same outcome as evaluate_group per row)."""
+    if not group.conditions:
+        return pd.Series(True, index=df.index)
+    cache: Dict[Tuple[str, str], Tuple[np.ndarray, np.ndarray]] = {}
+    masks = [_condition_mask(df, c, cache) for c in group.conditions]
+    combine = np.logical_and if group.logic == 'AND' else np.logical_or
+    return pd.Series(combine.reduce(masks), index=df.index)
+
+
 def apply_filters(df: pd.DataFrame, group_data: Optional[Dict[str, Any]]) -> Tuple[pd.DataFrame, Dict[str, int]]:
     """Apply filters to DataFrame and return filtered DataFrame plus stats."""
     if not group_data:
@@ -128,10 +261,6 @@ def apply_filters(df: pd.DataFrame, group_data: Optional[Dict[str, Any]]) -> Tup
     if dropped_incomplete:
         logger.info(f"Sanitized filter group: removed {dropped_incomplete} incomplete conditions")
 
-    mask = []
-    for _, row in df.iterrows():
-        record = row.to_dict()
-        mask.append(evaluate_group(record, group))
-    filtered = df[mask]
+    filtered = df[compile_filter_mask(df, group)]
     stats = {"original": len(df), "kept": len(filtered), "dropped": len(df) - len(filtered), "incomplete_conditions_removed": dropped_incomplete}
     return filtered, stats
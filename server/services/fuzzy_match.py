@@ -0,0 +1,217 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Options of mapping_config["fuzzy_keys"] and where their defaults come from
+FUZZY_OPTIONS = {
+    "threshold": "FUZZY_THRESHOLD",
+    "ngram": "FUZZY_NGRAM",
+    "window": "FUZZY_WINDOW",
+    "max_block_size": "FUZZY_MAX_BLOCK_SIZE",
+    "max_candidates": "FUZZY_MAX_CANDIDATES",
+}
+
+# Pairs scored per numpy batch by edit_distances
+DISTANCE_BATCH = 100_000
+
+def fuzzy_options(mapping):
+    """
+    Resolved mapping_config["fuzzy_keys"] options, or None when fuzzy matching is off.
+    fuzzy_keys is true (all defaults) or an object overriding some of FUZZY_OPTIONS.
+    Raises ValueError for malformed options.
+    """
+    raw = mapping.get("fuzzy_keys")
+    if not raw:
+        return None
+    if raw is not True and not isinstance(raw, dict):
+        raise ValueError("fuzzy_keys must be true or an object of options")
+    options = {name: getattr(config, setting) for name, setting in FUZZY_OPTIONS.items()}
+    if isinstance(raw, dict):
+        unknown = sorted(set(raw) - set(FUZZY_OPTIONS))
+        if unknown:
+            raise ValueError(f"Unknown fuzzy_keys option(s): {', '.join(unknown)}")
+        options.update(raw)
+    try:
+        threshold = float(options["threshold"])
+        integers = {name: int(options[name]) for name in ("ngram", "window", "max_block_size", "max_candidates")}
+    except (TypeError, ValueError):
+        raise ValueError("fuzzy_keys options must be numbers")
+    if not 0 < threshold <= 1:
+        raise ValueError("fuzzy_keys threshold must be in (0, 1]")
+    if integers["ngram"] < 1 or integers["window"] < 0 or integers["max_block_size"] < 2 or integers["max_candidates"] < 1:
+        raise ValueError("fuzzy_keys needs ngram >= 1, window >= 0, max_block_size >= 2 and max_candidates >= 1")
+    return {"threshold": threshold, **integers}
+
+def normalize_keys(labels):
+    """
+    Formatting-insensitive form of key labels: case-folded, punctuation and
+    whitespace removed, leading zeros of digit runs dropped ("INV-00123" -> "inv123").
+    """
+    text = pd.Series(labels, dtype=object).astype(str).str.casefold()
+    text = text.str.replace(r"[\W_]+", "", regex=True)
+    text = text.str.replace(r"(?<![0-9])0+(?=[0-9])", "", regex=True)
+    return text.to_numpy(dtype=object)
+
+def _code_points(strings, width):
+    """Fixed-width (n, width) uint32 code points, zero padded."""
+    return np.array(strings, dtype=f"<U{width}").view(np.uint32).reshape(len(strings), width)
+
+def _distance_batch(a, b, la, lb):
+    width_a, width_b = max(int(la.max()), 1), max(int(lb.max()), 1)
+    codes_a, codes_b = _code_points(a, width_a), _code_points(b, width_b)
+    steps = np.arange(width_b + 1, dtype=np.int32)
+    prev = np.broadcast_to(steps, (len(a), width_b + 1)).copy()
+    distances = lb.astype(np.int64)  # distance to an empty string
+    rows = np.arange(len(a))
+    for i in range(1, width_a + 1):
+        # Substitutions and deletions come from the previous row ...
+        best = np.empty_like(prev)
+        best[:, 0] = i
+        best[:, 1:] = np.minimum(prev[:, :-1] + (codes_a[:, i - 1:i] != codes_b), prev[:, 1:] + 1)
+        # ... insertions chain along the row: cur[j] = min over k <= j of best[k] + (j - k)
+        prev = np.minimum.accumulate(best - steps, axis=1) + steps
+        done = la == i
+        distances[done] = prev[rows[done], lb[done]]
+    return distances
+
+def edit_distances(a, b):
+    """Levenshtein distance of every (a[k], b[k]) pair, computed a batch of pairs at a time."""
+    n = len(a)
+    distances = np.empty(n, dtype=np.int64)
+    if not n:
+        return distances
+    la = np.fromiter(map(len, a), dtype=np.int64, count=n)
+    lb = np.fromiter(map(len, b), dtype=np.int64, count=n)
+    # Batches of similar lengths keep the padded width (and the work) small
+    order = np.argsort(np.maximum(la, lb), kind="stable")
+    for start in range(0, n, DISTANCE_BATCH):
+        batch = order[start:start + DISTANCE_BATCH]
+        distances[batch] = _distance_batch([a[k] for k in batch], [b[k] for k in batch], la[batch], lb[batch])
+    return distances
+
+# Candidate blocking
+#
+# Scoring every external orphan against every velaris orphan is quadratic, so
+# candidates come from three cheap sources, each linear (or n log n) in the
+# number of orphans:
+#   - equal normalized keys, paired by occurrence;
+#   - sorted neighbourhood: both sides' normalized keys (and their reversals,
+#     to catch differences near the start) are sorted together and every
+#     external / velaris key within `window` positions becomes a candidate;
+#   - n-gram blocks: keys sharing a padded n-gram, skipping n-grams held by more
+#     than max_block_size keys (they say little and would make blocks quadratic);
+#     only the max_candidates keys sharing the most n-grams are kept per orphan.
+
+def _equal_pairs(ext_norm, vel_norm):
+    def frame(values):
+        keys = pd.Series(values, dtype=object)
+        return pd.DataFrame({"key": keys, "occurrence": keys.groupby(keys, sort=False).cumcount(), "row": np.arange(len(keys))})
+    pairs = frame(ext_norm).merge(frame(vel_norm), on=["key", "occurrence"], suffixes=("_external", "_velaris"))
+    return pairs["row_external"].to_numpy(dtype=np.int64), pairs["row_velaris"].to_numpy(dtype=np.int64)
+
+def _neighbour_pairs(ext_norm, vel_norm, window):
+    keys = np.concatenate([ext_norm, vel_norm])
+    external = np.arange(len(keys)) < len(ext_norm)
+    rows = np.concatenate([np.arange(len(ext_norm)), np.arange(len(vel_norm))])
+    order = np.argsort(keys.astype(str), kind="stable")
+    ext_rows, vel_rows = [], []
+    for offset in range(1, min(window, len(keys) - 1) + 1):
+        first, second = order[:-offset], order[offset:]
+        mixed = external[first] != external[second]
+        first, second = first[mixed], second[mixed]
+        ext_side = np.where(external[first], first, second)
+        vel_side = np.where(external[first], second, first)
+        ext_rows.append(rows[ext_side])
+        vel_rows.append(rows[vel_side])
+    if not ext_rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(ext_rows), np.concatenate(vel_rows)
+
+def _grams(values, n):
+    pad = "\x00" * (n - 1)
+    rows, grams = [], []
+    for row, value in enumerate(values):
+        padded = pad + value + pad
+        unique = {padded[k:k + n] for k in range(len(padded) - n + 1)}
+        rows.extend([row] * len(unique))
+        grams.extend(unique)
+    return pd.DataFrame({"gram": grams, "row": np.array(rows, dtype=np.int64)})
+
+def _gram_pairs(ext_norm, vel_norm, n, max_block_size, max_candidates):
+    ext_grams, vel_grams = _grams(ext_norm, n), _grams(vel_norm, n)
+    sizes = ext_grams["gram"].value_counts().add(vel_grams["gram"].value_counts(), fill_value=0)
+    informative = sizes.index[sizes <= max_block_size]
+    pairs = ext_grams[ext_grams["gram"].isin(informative)].merge(
+        vel_grams[vel_grams["gram"].isin(informative)], on="gram", suffixes=("_external", "_velaris"),
+    )
+    shared = pairs.groupby(["row_external", "row_velaris"]).size().rename("shared").reset_index()
+    shared = shared.sort_values(["row_external", "shared", "row_velaris"], ascending=[True, False, True], kind="stable")
+    shared = shared[shared.groupby("row_external").cumcount() < max_candidates]
+    return shared["row_external"].to_numpy(dtype=np.int64), shared["row_velaris"].to_numpy(dtype=np.int64)
+
+def _candidates(ext_norm, vel_norm, options):
+    sources = [
+        _equal_pairs(ext_norm, vel_norm),
+        _neighbour_pairs(ext_norm, vel_norm, options["window"]),
+        _neighbour_pairs(
+            np.array([s[::-1] for s in ext_norm], dtype=object),
+            np.array([s[::-1] for s in vel_norm], dtype=object),
+            options["window"],
+        ),
+        _gram_pairs(ext_norm, vel_norm, options["ngram"], options["max_block_size"], options["max_candidates"]),
+    ]
+    ext_rows = np.concatenate([e for e, _ in sources])
+    vel_rows = np.concatenate([v for _, v in sources])
+    pairs = np.unique(ext_rows * len(vel_norm) + vel_rows)
+    ext_rows, vel_rows = pairs // len(vel_norm), pairs % len(vel_norm)
+    # Keys normalized to nothing (e.g. "---") carry no signal
+    usable = (ext_norm[ext_rows] != "") & (vel_norm[vel_rows] != "")
+    return ext_rows[usable], vel_rows[usable]
+
+def match_orphans(ext_labels, vel_labels, options):
+    """
+    One-to-one probable matches between two lists of unmatched key labels.
+    Candidates come from the blocking index above; each is scored as
+    1 - edit distance / longer length on the normalized keys, pairs scoring at
+    least options["threshold"] are kept, and every key is used at most once
+    (best score first). Returns [(external index, velaris index, score)] in
+    external order.
+    """
+    if not len(ext_labels) or not len(vel_labels):
+        return []
+    ext_norm, vel_norm = normalize_keys(ext_labels), normalize_keys(vel_labels)
+    ext_rows, vel_rows = _candidates(ext_norm, vel_norm, options)
+    a, b = ext_norm[ext_rows], vel_norm[vel_rows]
+    la = np.fromiter(map(len, a), dtype=np.int64, count=len(a))
+    lb = np.fromiter(map(len, b), dtype=np.int64, count=len(b))
+    longer, shorter = np.maximum(la, lb), np.minimum(la, lb)
+    # The length difference alone bounds the score from above
+    feasible = 1 - (longer - shorter) / longer >= options["threshold"]
+    ext_rows, vel_rows, longer = ext_rows[feasible], vel_rows[feasible], longer[feasible]
+    scores = 1 - edit_distances(list(a[feasible]), list(b[feasible])) / longer
+    keep = scores >= options["threshold"]
+    ext_rows, vel_rows, scores = ext_rows[keep], vel_rows[keep], scores[keep]
+    logger.info(f"Fuzzy key matching: {len(feasible)} candidate pairs, {len(scores)} above threshold")
+
+    used_external = np.zeros(len(ext_labels), dtype=bool)
+    used_velaris = np.zeros(len(vel_labels), dtype=bool)
+    matches = []
+    for k in np.lexsort((vel_rows, ext_rows, -scores)):
+        i, j = ext_rows[k], vel_rows[k]
+        if not used_external[i] and not used_velaris[j]:
+            used_external[i] = used_velaris[j] = True
+            matches.append((int(i), int(j), float(scores[k])))
+    matches.sort()
+    return matches
+
+def probable_matches(ext_labels, vel_labels, options):
+    """probable_matches records for the missing_in_velaris / missing_in_external key labels."""
+    return [
+        {"external_id": str(ext_labels[i]), "velaris_id": str(vel_labels[j]), "score": round(score, 4)}
+        for i, j, score in match_orphans(ext_labels, vel_labels, options)
+    ]
@@ -0,0 +1,305 @@
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from config import config
+from services.comparison_engine import (
+    add_probable_matches, build_results, build_summary, compare_positions, duplicate_codes, get_result_mode, indexed_pairs,
+    key_labels, key_values, stringify, unparseable_from_differences,
+)
+from services.mapping_engine import key_columns
+from services.mapping_engine import apply_mapping_with_stats, combine_side_stats
+from services.result_cache import canonical_mapping, digest
+from services.storage import private_directory
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_.-]{1,100}$")
+
+def snapshot_dir():
+    return config.SNAPSHOT_DIR or os.path.join(tempfile.gettempdir(), "velaris-snapshots")
+
+def snapshot_path(name, suffix=".npz"):
+    if not SNAPSHOT_NAME_PATTERN.match(name or ""):
+        raise ValueError(f"Invalid snapshot name '{name}' (letters, digits, '_', '-' and '.' only)")
+    return os.path.join(snapshot_dir(), name + suffix)
+
+# Snapshots are stored as .npz archives read with allow_pickle=False: numeric
+# columns as arrays, the key strings of each key column as one UTF-8 buffer
+# plus character end offsets, and everything else (mismatch differences, open
+# keys) as JSON. A small .json sidecar holds what list_snapshots reports.
+
+def _pack_keys(arrays, prefix, keys):
+    keys = list(keys)
+    width = len(keys[0]) if keys and isinstance(keys[0], tuple) else 0
+    parts = [keys] if width == 0 else [[k[i] for k in keys] for i in range(width)]
+    for i, part in enumerate(parts):
+        arrays[f"{prefix}.{i}.data"] = np.frombuffer("".join(part).encode("utf-8", "surrogatepass"), dtype=np.uint8)
+        arrays[f"{prefix}.{i}.ends"] = np.cumsum(np.fromiter(map(len, part), dtype=np.int64, count=len(part)))
+    arrays[f"{prefix}.width"] = np.array(width)
+
+def _unpack_keys(arrays, prefix):
+    width = int(arrays[f"{prefix}.width"])
+    parts = []
+    for i in range(max(width, 1)):
+        text = arrays[f"{prefix}.{i}.data"].tobytes().decode("utf-8", "surrogatepass")
+        ends = arrays[f"{prefix}.{i}.ends"].tolist()
+        parts.append([text[start:end] for start, end in zip([0] + ends[:-1], ends)])
+    return pd.Series(parts[0] if width == 0 else list(zip(*parts)), dtype=object)
+
+def _write_atomic(path, write):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+def load_snapshot(name):
+    """The stored snapshot dict, or None if there is none yet."""
+    path = snapshot_path(name)
+    private_directory(snapshot_dir())
+    try:
+        archive = np.load(path, allow_pickle=False)
+    except FileNotFoundError:
+        return None
+    with archive:
+        meta = json.loads(archive["meta"].tobytes())
+        tables = {}
+        for table in ("external", "velaris"):
+            tables[table] = pd.DataFrame({
+                "key": _unpack_keys(archive, f"{table}.key"),
+                "occurrence": archive[f"{table}.occurrence"],
+                "fingerprint": archive[f"{table}.fingerprint"],
+            })
+        mismatched = archive["pairs.mismatched"]
+        differences = np.full(len(mismatched), None, dtype=object)
+        differences[np.flatnonzero(mismatched)] = meta.pop("differences")
+        pairs = pd.DataFrame({
+            "key": _unpack_keys(archive, "pairs.key"),
+            "occurrence": archive["pairs.occurrence"],
+            "velaris_key": _unpack_keys(archive, "pairs.velaris_key"),
+            "velaris_occurrence": archive["pairs.velaris_occurrence"],
+            "mismatched": mismatched,
+            "differences": differences,
+        })
+    return {**meta, **tables, "pairs": pairs}
+
+def save_snapshot(name, snapshot):
+    path = snapshot_path(name)
+    private_directory(snapshot_dir())
+    arrays = {}
+    for table in ("external", "velaris"):
+        rows = snapshot[table]
+        _pack_keys(arrays, f"{table}.key", rows["key"])
+        arrays[f"{table}.occurrence"] = rows["occurrence"].to_numpy(dtype=np.int64)
+        arrays[f"{table}.fingerprint"] = rows["fingerprint"].to_numpy(dtype=np.uint64)
+    pairs = snapshot["pairs"]
+    mismatched = pairs["mismatched"].to_numpy(dtype=bool)
+    _pack_keys(arrays, "pairs.key", pairs["key"])
+    _pack_keys(arrays, "pairs.velaris_key", pairs["velaris_key"])
+    arrays["pairs.occurrence"] = pairs["occurrence"].to_numpy(dtype=np.int64)
+    arrays["pairs.velaris_occurrence"] = pairs["velaris_occurrence"].to_numpy(dtype=np.int64)
+    arrays["pairs.mismatched"] = mismatched
+    meta = {
+        "mapping_digest": snapshot["mapping_digest"],
+        "created_at": snapshot["created_at"],
+        "open": snapshot["open"],
+        "differences": list(pairs["differences"].to_numpy()[mismatched]),
+    }
+    arrays["meta"] = np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8)
+    _write_atomic(path, lambda f: np.savez(f, **arrays))
+    sidecar = {"snapshot": name, "created_at": snapshot["created_at"]}
+    _write_atomic(snapshot_path(name, ".json"), lambda f: f.write(json.dumps(sidecar).encode()))
+
+def list_snapshots():
+    if not os.path.isdir(snapshot_dir()):
+        return []
+    snapshots = []
+    for filename in sorted(os.listdir(private_directory(snapshot_dir()))):
+        if filename.endswith(".json"):
+            with open(os.path.join(snapshot_dir(), filename)) as f:
+                snapshots.append(json.load(f))
+    return snapshots
+
+def delete_snapshot(name):
+    path = snapshot_path(name)
+    private_directory(snapshot_dir())
+    try:
+        os.unlink(snapshot_path(name, ".json"))
+    except FileNotFoundError:
+        pass
+    try:
+        os.unlink(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+def _fingerprint_columns(df, mapping, side):
+    """Raw columns whose values feed this side's field checks."""
+    keys = set(key_columns(mapping, side))
+    if mapping.get("compare_only_mapped", True):
+        fields = {m.get(f"{side}_field") for m in mapping.get("mappings", [])}
+        return sorted(c for c in df.columns if c in fields and c not in keys)
+    return sorted(c for c in df.columns if c not in keys)
+
+def _key_ids(keys):
+    """Stable identity of every row's key: str(key), or a tuple of strings for composite keys."""
+    if isinstance(keys, pd.DataFrame):
+        return pd.Series(list(zip(*(stringify(keys.iloc[:, i]) for i in range(keys.shape[1])))), dtype=object)
+    return pd.Series(stringify(keys), dtype=object)
+
+def _row_table(keys, df, columns):
+    """(key, occurrence, fingerprint) per row; fingerprints hash the row's field values."""
+    ids = _key_ids(keys)
+    if columns:
+        fingerprints = pd.util.hash_pandas_object(df[columns].reset_index(drop=True), index=False).to_numpy()
+    else:
+        fingerprints = np.zeros(len(df), dtype=np.uint64)
+    return pd.DataFrame({
+        "key": ids,
+        "occurrence": ids.groupby(ids, sort=False).cumcount(),
+        "fingerprint": fingerprints,
+    })
+
+def _unchanged_rows(current, previous):
+    """Whether each current row's (key, occurrence) existed last run with the same fingerprint."""
+    # Merge on row numbers rather than fingerprints: a left merge turns uint64 columns into float64
+    rows = previous[["key", "occurrence"]].assign(row=np.arange(len(previous)))
+    merged = current[["key", "occurrence"]].merge(rows, on=["key", "occurrence"], how="left", sort=False)
+    known = merged["row"].notna().to_numpy()
+    unchanged = np.zeros(len(current), dtype=bool)
+    previous_fingerprints = previous["fingerprint"].to_numpy()[merged["row"].to_numpy()[known].astype(np.int64)]
+    unchanged[known] = previous_fingerprints == current["fingerprint"].to_numpy()[known]
+    return unchanged
+
+def _histograms(differences):
+    field_mismatches = {}
+    for diff in differences:
+        for label, pair in diff.items():
+            histogram = field_mismatches.setdefault(label, {})
+            key = (pair["external"], pair["velaris"])
+            histogram[key] = histogram.get(key, 0) + 1
+    return field_mismatches
+
+def compare_incremental(external, velaris, mapping):
+    """
+    apply_mapping + compare_records against the snapshot of the previous run
+    named by mapping["incremental"]["snapshot"].
+
+    Every row is fingerprinted by hashing the raw values of the fields it is
+    compared on; with the mapping unchanged, equal raw values map to equal
+    values, so only pairs where either row's fingerprint changed (or that were
+    not paired last time) are mapped and compared again. All other pairs carry
+    their previous outcome forward. Keys are always re-mapped and re-paired, so
+    the missing buckets are exact. The snapshot is replaced with this run's.
+
+    Returns (result, transform_stats); result holds the usual buckets plus an
+    "incremental" block with new, resolved and still-open mismatched keys.
+    """
+    name = mapping["incremental"].get("snapshot")
+    mode = get_result_mode(mapping)
+    compare_only_mapped = mapping.get("compare_only_mapped", True)
+
+    # Snapshots are only valid for the exact mapping that produced them
+    canonical = canonical_mapping(mapping)
+    canonical.pop("result_mode")
+    # Probable matches are recomputed from the orphans on every run
+    canonical.pop("fuzzy_keys")
+    mapping_digest = digest(canonical)
+    previous = load_snapshot(name)
+    if previous is not None and previous["mapping_digest"] != mapping_digest:
+        logger.info(f"Snapshot '{name}' was taken with a different mapping_config, re-evaluating every key")
+        previous = None
+
+    external, velaris, stats = apply_mapping_with_stats(external, velaris, mapping, fields=False)
+    ext_keys, vel_keys = key_values(external, velaris, mapping)
+
+    ext_rows = _row_table(ext_keys, external, _fingerprint_columns(external, mapping, "external"))
+    vel_rows = _row_table(vel_keys, velaris, _fingerprint_columns(velaris, mapping, "velaris"))
+    (ext_codes, vel_codes), (ext_pos, vel_pos, ext_only, vel_only) = indexed_pairs(ext_keys, vel_keys)
+
+    pairs = pd.DataFrame({
+        "key": ext_rows["key"].to_numpy()[ext_pos],
+        "occurrence": ext_rows["occurrence"].to_numpy()[ext_pos],
+        "velaris_key": vel_rows["key"].to_numpy()[vel_pos],
+        "velaris_occurrence": vel_rows["occurrence"].to_numpy()[vel_pos],
+    })
+    changed = np.ones(len(pairs), dtype=bool)
+    mismatched = np.zeros(len(pairs), dtype=bool)
+    differences = np.full(len(pairs), None, dtype=object)
+    if previous is not None:
+        same_ext = _unchanged_rows(ext_rows, previous["external"])
+        same_vel = _unchanged_rows(vel_rows, previous["velaris"])
+        prior = pairs.merge(previous["pairs"], on=["key", "occurrence", "velaris_key", "velaris_occurrence"], how="left", sort=False)
+        known = prior["mismatched"].notna().to_numpy()
+        changed = ~(known & same_ext[ext_pos] & same_vel[vel_pos])
+        carried = ~changed
+        mismatched[carried] = prior["mismatched"].to_numpy()[carried].astype(bool)
+        differences[carried] = prior["differences"].to_numpy()[carried]
+
+    # Map and compare only the changed pairs; both rows of every pair are taken,
+    # so pairing by occurrence inside the subset reproduces the same pairs
+    reevaluate = np.flatnonzero(changed)
+    field_stats = None
+    if len(reevaluate):
+        sub_external, sub_velaris, field_stats = apply_mapping_with_stats(
+            external.iloc[ext_pos[reevaluate]], velaris.iloc[vel_pos[reevaluate]], mapping, keys=False,
+        )
+        positions = compare_positions(sub_external, sub_velaris, mapping)
+        bad = reevaluate[positions["mismatched"]]
+        mismatched[bad] = True
+        differences[bad] = positions["differences"]
+    if field_stats is not None:
+        for side in ("external", "velaris"):
+            stats[side] = combine_side_stats(stats[side], field_stats[side])
+
+    previous_open_keys = previous["open"] if previous is not None else []
+    previous_open = set(previous_open_keys)
+    open_now = key_labels(ext_keys, ext_pos[mismatched])
+    open_set = set(open_now)
+
+    save_snapshot(name, {
+        "mapping_digest": mapping_digest,
+        "created_at": time.time(),
+        "external": ext_rows,
+        "velaris": vel_rows,
+        "pairs": pairs.assign(mismatched=mismatched, differences=differences),
+        "open": open_now,
+    })
+
+    positions = {
+        "matched": ext_pos[~mismatched],
+        "mismatched": ext_pos[mismatched],
+        "differences": list(differences[mismatched]),
+        "missing_in_velaris": ext_only,
+        "missing_in_external": vel_only,
+        "duplicate_keys": duplicate_codes(ext_codes, vel_codes),
+    }
+    positions["unparseable"] = unparseable_from_differences(positions["differences"])
+    add_probable_matches(positions, ext_keys, vel_keys, mapping)
+    if mode == "summary":
+        positions["field_mismatches"] = _histograms(positions["differences"])
+        result = build_summary(positions, compare_only_mapped)
+    else:
+        result = build_results(ext_keys, vel_keys, positions, compare_only_mapped)
+        if mode == "page":
+            result["result_mode"] = "page"
+    result["incremental"] = {
+        "snapshot": name,
+        "previous_run_at": previous["created_at"] if previous is not None else None,
+        "reevaluated_pairs": int(len(reevaluate)),
+        "carried_forward_pairs": int(len(pairs) - len(reevaluate)),
+        "new_mismatches": [k for k in dict.fromkeys(open_now) if k not in previous_open],
+        "resolved_mismatches": [k for k in dict.fromkeys(previous_open_keys) if k not in open_set],
+        "still_open_mismatches": [k for k in dict.fromkeys(open_now) if k in previous_open],
+    }
+    return result, stats
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import multiprocessing
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any, Callable, List, Optional
+
+from config import config
+from services.metrics import metrics, recorded
+from services.result_cache import TTLCache, json_size
+
+logger = logging.getLogger(__name__)
+
+class JobQueueFullError(RuntimeError):
+    """Raised when the job queue is at capacity."""
+
+@dataclass
+class Job:
+    id: str
+    submitted_at: float
+    future: Any = None
+    finished_at: Optional[float] = None
+    result: Any = None
+    error: Optional[str] = None
+    cleanup: Optional[Callable[[], None]] = field(default=None, repr=False)
+    retain: bool = False
+    # Set when the result was too large to retain (see JobManager)
+    discarded: bool = False
+
+    @property
+    def status(self) -> str:
+        if self.finished_at is not None:
+            return "failed" if self.error is not None else "completed"
+        if self.future.running():
+            return "running"
+        return "queued"
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "submitted_at": self.submitted_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+
+# Bytes charged for a retained job besides its result's JSON size
+JOB_RECORD_BYTES = 512
+
+def _retained_size(job: Job) -> int:
+    return JOB_RECORD_BYTES + json_size(job.result) + len(job.error or "")
+
+class JobManager:
+    """
+    Local job runner for CPU-bound comparisons.
+    Jobs run in a process pool of `workers` processes; at most `queue_size`
+    further jobs may wait for a worker. Finished jobs submitted with
+    retain=True are kept so their results can be fetched, for up to
+    `result_ttl` seconds in an LRU bounded by `result_bytes` (results counted
+    by their JSON size); a result larger than that is discarded and only the
+    job's status kept. Other jobs are dropped when they finish. What a job
+    records in its worker's metrics registry is merged into this process's
+    when it finishes.
+    """
+
+    def __init__(self, workers: int, queue_size: int, result_ttl: int, result_bytes: int):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.result_ttl = result_ttl
+        self._jobs = {}  # queued and running jobs
+        self._finished = TTLCache(result_bytes, result_ttl, _retained_size)
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a process that already runs threads (event loop, parser pool) is unsafe
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def _retain(self, job: Job):
+        if _retained_size(job) > self._finished.max_bytes:
+            logger.warning(f"Result of job {job.id} exceeds the retained results budget and is discarded")
+            job.result, job.discarded = None, True
+        self._finished.put(job.id, job)
+
+    def submit(self, fn: Callable, *args, cleanup: Optional[Callable[[], None]] = None, retain: bool = False) -> Job:
+        """
+        Queue fn(*args) on the process pool; raises JobQueueFullError when at capacity.
+        retain keeps the finished job (see the class docstring) for get() and all_jobs().
+        """
+        with self._lock:
+            active = len(self._jobs)
+            if active >= self.workers + self.queue_size:
+                raise JobQueueFullError(f"Job queue is full ({active} jobs in progress)")
+            job = Job(id=uuid.uuid4().hex, submitted_at=time.time(), cleanup=cleanup, retain=retain)
+            try:
+                job.future = self._executor().submit(recorded, fn, *args)
+            except BrokenProcessPool:
+                logger.warning("Job process pool was broken, starting a new one")
+                self._pool = None
+                job.future = self._executor().submit(recorded, fn, *args)
+            self._jobs[job.id] = job
+        job.future.add_done_callback(partial(self._finish, job))
+        return job
+
+    def add_completed(self, result: Any) -> Job:
+        """Record an already available result (e.g. from a cache) as a finished job."""
+        now = time.time()
+        job = Job(id=uuid.uuid4().hex, submitted_at=now, finished_at=now, result=result, retain=True)
+        self._retain(job)
+        return job
+
+    def _finish(self, job: Job, future):
+        try:
+            job.result, recorded_metrics = future.result()
+            metrics.merge(recorded_metrics)
+        except BrokenProcessPool as e:
+            # A worker died (e.g. OOM); the pool cannot be reused
+            job.error = f"Worker process died: {e}"
+            with self._lock:
+                self._pool = None
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+        job.finished_at = time.time()
+        metrics.inc("jobs_total", status=job.status)
+        with self._lock:
+            if self._jobs.pop(job.id, None) is not None and job.retain:
+                self._retain(job)
+        if job.cleanup is not None:
+            job.cleanup()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job if job is not None else self._finished.get(job_id)
+
+    def all_jobs(self) -> List[Job]:
+        with self._lock:
+            active = list(self._jobs.values())
+        return active + self._finished.values()
+
+    def forget(self, job_id: str):
+        """Drop a job record (e.g. once a caller has its result)."""
+        with self._lock:
+            self._jobs.pop(job_id, None)
+        self._finished.discard(job_id)
+
+    async def wait(self, job: Job) -> Any:
+        """Await a job's result without blocking the event loop; re-raises the job's exception."""
+        result, _ = await asyncio.wrap_future(job.future)
+        return result
+
+job_manager = JobManager(
+    config.JOB_WORKERS, config.JOB_QUEUE_SIZE, config.JOB_RESULT_TTL_SECONDS, config.JOB_RESULT_MB * 1024 * 1024,
+)
@@ -1,79 +1,154 @@
 import json
+import logging
 import re
+import time
+from functools import lru_cache, partial
+
+import numpy as np
+import pandas as pd
+
+from config import config
+from services.metrics import metrics, warn
+
+logger = logging.getLogger(__name__)
 
 # JavaScript-to-Python translation for custom functions
+CUSTOM_FUNCTION_BUILTINS = {
+    'str': str,
+    'int': int,
+    'float': float,
+    'len': len,
+    'range': range,
+    'True': True,
+    'False': False,
+    'None': None,
+}
+
+def translate_custom_function(js_code):
+    """
+    Translate user-provided JavaScript-like code into the Python source of
+    a `transform_fn(value)` definition.
+    """
+    # Clean up the code
+    code = js_code.strip()
+
+    # Remove comments
+    code = re.sub(r'//.*$', '', code, flags=re.MULTILINE)
+    code = re.sub(r'/\*.*?\*/', '', code, flags=re.DOTALL)
+
+    # Translate common JS to Python
+    # Handle value.replace() - convert single quotes to double quotes for Python
+    code = re.sub(r"'", '"', code)
+
+    translations = [
+        (r'value\.toString\(\)', 'str(value)'),
+        (r'value\.trim\(\)', 'str(value).strip()'),
+        (r'value\.toLowerCase\(\)', 'str(value).lower()'),
+        (r'value\.toUpperCase\(\)', 'str(value).upper()'),
+        (r'parseInt\(([^)]+)\)', r'int(\1)'),
+        (r'parseFloat\(([^)]+)\)', r'float(\1)'),
+        (r'\.split\(([^)]+)\)', r'.split(\1)'),
+        (r'\.join\(([^)]+)\)', r'.join(\1)'),
+        (r'\.substring\(([^)]+)\)', r'[\1]'),
+    ]
+
+    for pattern, replacement in translations:
+        code = re.sub(pattern, replacement, code)
+
+    # Handle simple return statements
+    if 'return' not in code:
+        # If no explicit return and it's a single expression, add return
+        has_multiple_statements = ';' in code or code.count('\n') > 0
+        has_control_flow = any(kw in code for kw in ['if ', 'for ', 'while ', 'def '])
+
+        if not has_multiple_statements and not has_control_flow:
+            code = f'return {code}'
+
+    return f"def transform_fn(value):\n    {code.replace(chr(10), chr(10) + '    ')}"
+
+@lru_cache(maxsize=config.CUSTOM_FUNCTION_CACHE_SIZE)
+def compile_custom_function(js_code):
+    """
+    Translate and compile a custom function once.
+    Compiled callables are kept in a process-wide LRU cache keyed by the snippet
+    text, so repeated cells and repeated requests skip translation and exec.
+    Raises if the translated code does not compile.
+    """
+    # Create a safe execution environment
+    safe_globals = {'__builtins__': dict(CUSTOM_FUNCTION_BUILTINS)}
+    namespace = {}
+    exec(translate_custom_function(js_code), safe_globals, namespace)
+    return namespace['transform_fn']
+
 def execute_custom_function(value, js_code):
     """
-    Execute user-provided JavaScript-like transformation code safely.
+    Execute user-provided JavaScript-like transformation code safely on one value.
     Translates common JS patterns to Python.
     """
     if not js_code or not js_code.strip():
         return value
-    
+
     try:
-        # Clean up the code
-        code = js_code.strip()
-        
-        # Remove comments
-        code = re.sub(r'//.*$', '', code, flags=re.MULTILINE)
-        code = re.sub(r'/\*.*?\*/', '', code, flags=re.DOTALL)
-        
-        # Translate common JS to Python
-        # Handle value.replace() - convert single quotes to double quotes for Python
-        code = re.sub(r"'", '"', code)
-        
-        translations = [
-            (r'value\.toString\(\)', 'str(value)'),
-            (r'value\.trim\(\)', 'str(value).strip()'),
-            (r'value\.toLowerCase\(\)', 'str(value).lower()'),
-            (r'value\.toUpperCase\(\)', 'str(value).upper()'),
-            (r'parseInt\(([^)]+)\)', r'int(\1)'),
-            (r'parseFloat\(([^)]+)\)', r'float(\1)'),
-            (r'\.split\(([^)]+)\)', r'.split(\1)'),
-            (r'\.join\(([^)]+)\)', r'.join(\1)'),
-            (r'\.substring\(([^)]+)\)', r'[\1]'),
-        ]
-        
-        for pattern, replacement in translations:
-            code = re.sub(pattern, replacement, code)
-        
-        # Handle simple return statements
-        if 'return' not in code:
-            # If no explicit return and it's a single expression, add return
-            has_multiple_statements = ';' in code or code.count('\n') > 0
-            has_control_flow = any(kw in code for kw in ['if ', 'for ', 'while ', 'def '])
-            
-            if not has_multiple_statements and not has_control_flow:
-                code = f'return {code}'
-        
-        # Create a safe execution environment
-        safe_globals = {
-            '__builtins__': {
-                'str': str,
-                'int': int,
-                'float': float,
-                'len': len,
-                'range': range,
-                'True': True,
-                'False': False,
-                'None': None,
-            }
-        }
-        safe_locals = {'value': value}
-        
-        # Execute the code
-        final_code = f"def transform_fn(value):\n    {code.replace(chr(10), chr(10) + '    ')}"
-        exec(final_code, safe_globals, safe_locals)
-        result = safe_locals['transform_fn'](value)
-        
+        result = compile_custom_function(js_code)(value)
         return result if result is not None else value
-        
     except Exception as e:
-        print(f"Warning: Custom function execution failed for value '{value}': {e}")
-        print(f"  Original JS code: {js_code}")
-        print(f"  Translated Python code: {code}")
+        # Called per cell: failures are counted, not logged one by one
+        metrics.inc("transform_failures_total", transform="custom_function")
+        logger.debug(f"Custom function execution failed for value '{value}': {e}")
         return value
 
+def _safe_translation(js_code):
+    try:
+        return translate_custom_function(js_code)
+    except Exception as e:
+        return f"<translation failed: {e}>"
+
+def apply_custom_function(series, js_code):
+    """
+    Run a custom function over a whole column with a single compiled callable.
+    Values that raise are left unchanged and reported in one aggregated warning.
+    """
+    if not js_code or not js_code.strip():
+        return series
+
+    if series.empty:
+        return series.apply(lambda x: x)
+
+    try:
+        transform_fn = compile_custom_function(js_code)
+    except Exception as e:
+        transform_fn = None
+        compile_error = e
+
+    values = series.to_numpy(dtype=object)
+    failures = 0
+    first_error = None
+    out = []
+    if transform_fn is None:
+        failures = len(values)
+        first_error = (values[0], compile_error)
+        out = list(values)
+    else:
+        for value in values:
+            try:
+                result = transform_fn(value)
+                out.append(result if result is not None else value)
+            except Exception as e:
+                failures += 1
+                if first_error is None:
+                    first_error = (value, e)
+                out.append(value)
+
+    if failures:
+        value, e = first_error
+        metrics.inc("transform_failures_total", failures, transform="custom_function")
+        logger.warning(
+            f"Custom function failed for {failures} of {len(values)} value(s); first failure on '{value}': {e}\n"
+            f"  Original JS code: {js_code}\n"
+            f"  Translated Python code: {_safe_translation(js_code)}"
+        )
+    return pd.Series(out, index=series.index, name=series.name)
+
 # Dynamic transform registry - add new transforms here (simple, no-arg)
 TRANSFORM_REGISTRY = {
     "trim": lambda x: str(x).strip(),
@@ -96,6 +171,61 @@ PIPELINE_OPERATIONS = {
 
 PIPELINE_SAFE_BUILTINS = {"True": True, "False": False, "None": None}
 
+# Column-level counterparts of TRANSFORM_REGISTRY.
+# Each entry receives an object Series of str (the values after str()) and returns a Series.
+# Transforms without an entry here run cell by cell.
+VECTORIZED_TRANSFORMS = {
+    "trim": lambda s: s.str.strip(),
+    "lower": lambda s: s.str.lower(),
+    "upper": lambda s: s.str.upper(),
+    "strip_spaces": lambda s: s.str.replace(" ", "", regex=False),
+    "capitalize": lambda s: s.str.capitalize(),
+    "title": lambda s: s.str.title(),
+}
+
+def stringify(values):
+    """Return an object array holding str(x) for every element."""
+    arr = np.asarray(values, dtype=object)
+    if pd.api.types.infer_dtype(arr, skipna=False) == "string":
+        return arr
+    return np.array([str(x) for x in arr], dtype=object)
+
+def _vec_replace(values, old, new):
+    return pd.Series(stringify(values), dtype=object).str.replace(old, new, regex=False).to_numpy(dtype=object)
+
+def _vec_substring(values, start, end=None):
+    stop = int(end) if end is not None else None
+    return pd.Series(stringify(values), dtype=object).str.slice(int(start), stop).to_numpy(dtype=object)
+
+def _vec_map(values, mapping):
+    if not isinstance(mapping, dict):
+        raise TypeError("map() argument must be a JSON object")
+    text = stringify(values)
+    out = values.copy()
+    for i in np.flatnonzero(pd.Series(text, dtype=object).isin(list(mapping)).to_numpy(dtype=bool)):
+        out[i] = mapping[text[i]]
+    return out
+
+def _vec_number(values, dtype):
+    """to_int / to_float: parse non-blank str(v) with int()/float() semantics, leave blanks unchanged."""
+    text = stringify(values)
+    filled = ~pd.Series(text, dtype=object).str.strip().eq('').to_numpy(dtype=bool)
+    out = values.copy()
+    # numpy's object casts call int()/float(); any failure falls back to the per-cell path
+    out[filled] = text[filled].astype(dtype).astype(object)
+    return out
+
+# Column-level counterparts of PIPELINE_OPERATIONS.
+# Each entry receives (object ndarray, *args) and returns an object ndarray; if it
+# raises, the step is re-run cell by cell so per-value failures are reported exactly.
+VECTORIZED_PIPELINE_OPERATIONS = {
+    "replace": _vec_replace,
+    "substring": _vec_substring,
+    "to_int": lambda values: _vec_number(values, np.int64),
+    "to_float": lambda values: _vec_number(values, float),
+    "map": _vec_map,
+}
+
 def apply_transform(val, transforms):
     """
     Apply transforms dynamically from the registry.
@@ -107,8 +237,8 @@ def apply_transform(val, transforms):
         if t in TRANSFORM_REGISTRY:
             val = TRANSFORM_REGISTRY[t](val)
         else:
-            # Skip unknown transforms or log warning
-            print(f"Warning: Unknown transform '{t}' skipped")
+            # Skip unknown transforms; called per cell, so only counted
+            metrics.inc("warnings_total", warning="unknown_transform")
     return val
 
 def parse_pipeline(pipeline_str):
@@ -124,7 +254,7 @@ def parse_pipeline(pipeline_str):
     for token in tokens:
         m = re.match(r'^(\w+)(\((.*)\))?$', token)
         if not m:
-            print(f"Warning: Invalid pipeline token '{token}' skipped")
+            warn(logger, "invalid_pipeline_token", f"Invalid pipeline token '{token}' skipped")
             continue
         op = m.group(1)
         arg_str = m.group(3)
@@ -135,7 +265,7 @@ def parse_pipeline(pipeline_str):
                 try:
                     args.append(json.loads(arg_str))
                 except Exception as e:
-                    print(f"Warning: map() JSON parse failed for '{arg_str}': {e}")
+                    warn(logger, "invalid_pipeline_token", f"map() JSON parse failed for '{arg_str}': {e}")
                     continue
             else:
                 raw_args = [a.strip() for a in arg_str.split(',')]
@@ -147,26 +277,308 @@ def apply_custom_pipeline(val, pipeline_str):
     """Apply a parsed pipeline of operations to a single value."""
     if val is None:
         return val
-    steps = parse_pipeline(pipeline_str)
+    steps = compile_pipeline(pipeline_str)
     for op, args in steps:
         # First check simple TRANSFORM_REGISTRY (no args)
         if op in TRANSFORM_REGISTRY and not args:
             try:
                 val = TRANSFORM_REGISTRY[op](val)
-            except Exception as e:
-                print(f"Warning: transform '{op}' failed: {e}")
+            except Exception:
+                metrics.inc("transform_failures_total", transform=op)
             continue
         # Then pipeline operations with args
         if op in PIPELINE_OPERATIONS:
             handler = PIPELINE_OPERATIONS[op]
             try:
                 val = handler(val, *args)
-            except Exception as e:
-                print(f"Warning: pipeline op '{op}' failed: {e}")
+            except Exception:
+                metrics.inc("transform_failures_total", transform=op)
         else:
-            print(f"Warning: unknown pipeline op '{op}'")
+            metrics.inc("warnings_total", warning="unknown_pipeline_op")
     return val
 
+@lru_cache(maxsize=config.CUSTOM_FUNCTION_CACHE_SIZE)
+def compile_pipeline(pipeline_str):
+    """Parse a pipeline string once; plans are cached per pipeline text."""
+    return tuple((op, tuple(args)) for op, args in parse_pipeline(pipeline_str))
+
+def _run_cells(values, handler, args, label, name):
+    """Per-cell fallback: failing cells keep their value and are reported once (and counted under name)."""
+    out = np.empty(len(values), dtype=object)
+    failures = 0
+    first_error = None
+    for i, v in enumerate(values):
+        try:
+            out[i] = handler(v, *args)
+        except Exception as e:
+            out[i] = v
+            failures += 1
+            if first_error is None:
+                first_error = e
+    if failures:
+        metrics.inc("transform_failures_total", failures, transform=name)
+        logger.warning(f"{label} failed for {failures} of {len(values)} value(s): {first_error}")
+    return out
+
+def _run_transform(values, name):
+    vectorized = VECTORIZED_TRANSFORMS.get(name)
+    if vectorized is not None:
+        try:
+            return vectorized(pd.Series(stringify(values), dtype=object)).to_numpy(dtype=object)
+        except Exception:
+            pass
+    return _run_cells(values, TRANSFORM_REGISTRY[name], (), f"transform '{name}'", name)
+
+def _run_pipeline_op(values, op, args):
+    vectorized = VECTORIZED_PIPELINE_OPERATIONS.get(op)
+    if vectorized is not None:
+        try:
+            return vectorized(values, *args)
+        except Exception:
+            pass
+    return _run_cells(values, PIPELINE_OPERATIONS[op], args, f"pipeline op '{op}'", op)
+
+def _to_series(values, like):
+    # Build from a list so dtype inference matches Series.apply
+    return pd.Series(list(values), index=like.index, name=like.name)
+
+def apply_transform_column(series, transforms):
+    """Column-level apply_transform: each registry transform runs once over the whole column."""
+    if not transforms:
+        return series
+    for t in transforms:
+        if t not in TRANSFORM_REGISTRY:
+            warn(logger, "unknown_transform", f"Unknown transform '{t}' skipped")
+    return _transforms_column(series, [t for t in transforms if t in TRANSFORM_REGISTRY])
+
+def _transforms_column(series, names):
+    """Run registry transforms (names already checked) over a column."""
+    if series.empty:
+        return series.apply(lambda x: x)
+    values = series.to_numpy(dtype=object)
+    for t in names:
+        values = _run_transform(values, t)
+    return _to_series(values, series)
+
+def apply_custom_pipeline_column(series, pipeline_str):
+    """
+    Column-level apply_custom_pipeline: the pipeline is parsed once and each
+    step runs over the whole column, falling back to cells only when needed.
+    """
+    return _pipeline_column(series, compile_pipeline(pipeline_str))
+
+def _pipeline_column(series, steps):
+    """Run parsed pipeline steps ((op, args) pairs, see compile_pipeline) over a column."""
+    if series.empty:
+        return series.apply(lambda x: x)
+    values = series.to_numpy(dtype=object)
+    # None cells are passed through untouched, like the scalar pipeline does
+    active = values != None  # noqa: E711
+    current = values[active]
+    for op, args in steps:
+        if op in TRANSFORM_REGISTRY and not args:
+            current = _run_transform(current, op)
+        elif op in PIPELINE_OPERATIONS:
+            current = _run_pipeline_op(current, op, args)
+        else:
+            warn(logger, "unknown_pipeline_op", f"Unknown pipeline op '{op}' skipped")
+    out = values.copy()
+    for i, v in zip(np.flatnonzero(active), current):
+        out[i] = v
+    return _to_series(out, series)
+
+def is_pipeline(custom):
+    # Check if it's a pipeline (contains |) or custom JS function
+    return '|' in custom or any(op in custom for op in ['trim', 'lower', 'upper', 'replace(', 'map('])
+
+def _column_steps(transforms=None, custom=""):
+    """
+    Column functions for a field: registry transforms first, then the custom pipeline / JS function.
+    Everything is resolved here, once: unknown transforms and pipeline ops are
+    dropped with a warning, pipelines are parsed and custom functions compiled.
+    """
+    steps = []
+    if transforms:
+        unknown = [t for t in transforms if t not in TRANSFORM_REGISTRY]
+        if unknown:
+            warn(logger, "unknown_transform", f"Unknown transform(s) {', '.join(map(repr, unknown))} skipped")
+        steps.append(partial(_transforms_column, names=tuple(t for t in transforms if t in TRANSFORM_REGISTRY)))
+    if custom:
+        if is_pipeline(custom):
+            ops = compile_pipeline(custom)
+            unknown = [op for op, args in ops if not (op in TRANSFORM_REGISTRY and not args) and op not in PIPELINE_OPERATIONS]
+            if unknown:
+                warn(logger, "unknown_pipeline_op", f"Unknown pipeline op(s) {', '.join(map(repr, unknown))} skipped")
+            steps.append(partial(_pipeline_column, steps=tuple((op, args) for op, args in ops if op not in unknown)))
+        else:
+            try:
+                compile_custom_function(custom)
+            except Exception:
+                # Reported (per column) when the function is applied
+                pass
+            steps.append(partial(apply_custom_function, js_code=custom))
+    return tuple(steps)
+
+# Compiled transform plans
+#
+# A mapping_config is resolved once into, per side, the key columns and mapped
+# columns to transform with their column functions (see _column_steps). Plans
+# are cached on the parts of the config they depend on, so repeated requests
+# and partitions skip the resolution. Applying a plan replaces only the
+# transformed columns; the others keep sharing the input frame's data.
+
+def compile_transforms(config):
+    """{"external": (key plans, field plans), "velaris": ...}; each plan is a (column, steps) pair, in application order."""
+    spec = json.dumps([config.get("key_fields") or {}, config.get("mappings", [])], sort_keys=True, default=str)
+    return _compile_transforms(spec)
+
+@lru_cache(maxsize=config.CUSTOM_FUNCTION_CACHE_SIZE)
+def _compile_transforms(spec):
+    key_fields, mappings = json.loads(spec)
+    parsed = {"key_fields": key_fields, "mappings": mappings}
+    plans = {}
+    for side in ("external", "velaris"):
+        keys = tuple(
+            (column, _column_steps(custom=custom))
+            for column, custom in zip(key_columns(parsed, side), key_customs(parsed, side))
+            if custom
+        )
+        fields = []
+        for m in mappings:
+            steps = _column_steps(m.get(f"{side}_transforms", []), m.get(f"{side}_custom", ""))
+            if m.get(f"{side}_field") and steps:
+                fields.append((m[f"{side}_field"], steps))
+        plans[side] = (keys, tuple(fields))
+    return plans
+
+def _factorize_distinct(values):
+    """
+    Factorize an object array into (codes, representatives) without merging
+    different kinds of missing value: None and NaN transform differently, so
+    each NA type gets its own representative.
+    """
+    codes, uniques = pd.factorize(values)
+    representatives = list(uniques)
+    na = np.flatnonzero(codes == -1)
+    if len(na):
+        kinds = {}
+        na_codes = np.empty(len(na), dtype=codes.dtype)
+        for j, v in enumerate(values[na]):
+            kind = type(v)
+            if kind not in kinds:
+                kinds[kind] = len(representatives)
+                representatives.append(v)
+            na_codes[j] = kinds[kind]
+        codes = codes.copy()
+        codes[na] = na_codes
+    return codes, representatives
+
+def transform_column(series, steps, stats=None):
+    """
+    Run column steps over a Series.
+    Low-cardinality columns (distinct/rows <= DISTINCT_TRANSFORM_MAX_RATIO) are
+    transformed once per distinct value and broadcast back through the codes.
+    If a stats dict is given, the chosen path and the time taken are recorded
+    under the column name.
+    """
+    if not steps:
+        return series
+    start = time.perf_counter()
+    n = len(series)
+    memoized = False
+    distinct = None
+    if n and n >= config.DISTINCT_TRANSFORM_MIN_ROWS:
+        codes, representatives = _factorize_distinct(series.to_numpy(dtype=object))
+        distinct = len(representatives)
+        memoized = distinct <= n * config.DISTINCT_TRANSFORM_MAX_RATIO
+
+    if memoized:
+        result = pd.Series(representatives, dtype=object, name=series.name)
+        for step in steps:
+            result = step(result)
+        # Every distinct value appears in the column, so the small result already has the final dtype
+        result = result.take(codes)
+        result.index = series.index
+    else:
+        result = series
+        for step in steps:
+            result = step(result)
+
+    if stats is not None:
+        stats[series.name] = {"rows": n, "distinct": distinct, "memoized": memoized, "seconds": round(time.perf_counter() - start, 6)}
+    return result
+
+# A column can be both a key and a mapped field, so its transforms are reported per role
+TRANSFORM_ROLES = ("keys", "fields")
+
+def map_side_with_stats(df, config, side, keys=True, fields=True):
+    """
+    One side ("external" or "velaris") of apply_mapping_with_stats:
+    (mapped frame, {"keys": {column: stats}, "fields": {column: stats}}).
+    The mapped frame is a shallow copy of df with only the transformed columns replaced.
+    """
+    key_plans, field_plans = compile_transforms(config)[side]
+    mapped = df.copy(deep=False)
+    stats = {role: {} for role in TRANSFORM_ROLES}
+    if keys:
+        _apply_key_transforms(mapped, key_plans, side, stats["keys"])
+    if fields:
+        _apply_field_transforms(mapped, field_plans, stats["fields"])
+    return mapped, stats
+
+def combine_side_stats(*stats):
+    """One side's stats of separately run key and field stages (see map_side_with_stats), as one."""
+    return {role: {column: s for side_stats in stats for column, s in side_stats[role].items()} for role in TRANSFORM_ROLES}
+
+def apply_mapping_with_stats(external_df, velaris_df, config, keys=True, fields=True):
+    """
+    apply_mapping that also returns per-column transform stats:
+    {"external": {"keys": {column: {"rows", "distinct", "memoized", "seconds"}}, "fields": {...}}, "velaris": {...}}
+    keys / fields select the key field or mapped field transformations, so
+    callers can apply them in separate stages (e.g. partitioning on keys first).
+    """
+    external, external_stats = map_side_with_stats(external_df, config, "external", keys, fields)
+    velaris, velaris_stats = map_side_with_stats(velaris_df, config, "velaris", keys, fields)
+    return external, velaris, {"external": external_stats, "velaris": velaris_stats}
+
+def key_columns(config, side):
+    """
+    Key column(s) of one side ("external" or "velaris"): key_fields[<side>_field]
+    is a column name or, for a composite key, a list of column names.
+    """
+    field = (config.get("key_fields") or {}).get(f"{side}_field")
+    if isinstance(field, (list, tuple)):
+        return list(field)
+    return [field] if field else []
+
+def key_customs(config, side):
+    """
+    Key transforms of one side, one per key column: key_fields[<side>_custom] is
+    either a list aligned with the key columns or one pipeline / JS function
+    applied to every key column.
+    """
+    columns = key_columns(config, side)
+    custom = (config.get("key_fields") or {}).get(f"{side}_custom") or ""
+    if isinstance(custom, (list, tuple)):
+        return [c or "" for c in custom] + [""] * (len(columns) - len(custom))
+    return [custom] * len(columns)
+
+def _apply_key_transforms(df, plans, side, stats):
+    # Key field transformations run first so keys can be joined (or partitioned) on
+    for column, steps in plans:
+        if column in df.columns:
+            logger.debug(f"Applying {side} key transformation on '{column}'")
+            original_sample = df[column].iloc[0] if len(df) > 0 else None
+            df[column] = transform_column(df[column], steps, stats)
+            transformed_sample = df[column].iloc[0] if len(df) > 0 else None
+            logger.debug(f"{side.capitalize()} key transformation result: {original_sample} -> {transformed_sample}")
+
+def _apply_field_transforms(df, plans, stats):
+    # Apply field mapping transformations
+    for column, steps in plans:
+        if column in df.columns:
+            df[column] = transform_column(df[column], steps, stats)
+
 def apply_mapping(external_df, velaris_df, config):
     """
     Apply transforms defined in mapping config to BOTH external and velaris CSVs.
@@ -175,64 +587,5 @@ def apply_mapping(external_df, velaris_df, config):
       external_field, velaris_field, external_transforms, velaris_transforms,
       external_custom (pipeline or JS function), velaris_custom
     """
-    external = external_df.copy()
-    velaris = velaris_df.copy()
-
-    # Apply key field transformations first
-    key_fields = config.get("key_fields", {})
-    ext_key_field = key_fields.get("external_field")
-    vel_key_field = key_fields.get("velaris_field")
-    ext_key_custom = key_fields.get("external_custom", "")
-    vel_key_custom = key_fields.get("velaris_custom", "")
-
-    if ext_key_field and ext_key_field in external.columns and ext_key_custom:
-        print(f"[DEBUG] Applying external key transformation on '{ext_key_field}': {ext_key_custom}")
-        original_sample = external[ext_key_field].iloc[0] if len(external) > 0 else None
-        # Check if it's a pipeline or custom JS function
-        if '|' in ext_key_custom or any(op in ext_key_custom for op in ['trim', 'lower', 'upper', 'replace(', 'map(']):
-            external[ext_key_field] = external[ext_key_field].apply(lambda x: apply_custom_pipeline(x, ext_key_custom))
-        else:
-            external[ext_key_field] = external[ext_key_field].apply(lambda x: execute_custom_function(x, ext_key_custom))
-        transformed_sample = external[ext_key_field].iloc[0] if len(external) > 0 else None
-        print(f"[DEBUG] External key transformation result: {original_sample} -> {transformed_sample}")
-
-    if vel_key_field and vel_key_field in velaris.columns and vel_key_custom:
-        # Check if it's a pipeline or custom JS function
-        if '|' in vel_key_custom or any(op in vel_key_custom for op in ['trim', 'lower', 'upper', 'replace(', 'map(']):
-            velaris[vel_key_field] = velaris[vel_key_field].apply(lambda x: apply_custom_pipeline(x, vel_key_custom))
-        else:
-            velaris[vel_key_field] = velaris[vel_key_field].apply(lambda x: execute_custom_function(x, vel_key_custom))
-
-    # Apply field mapping transformations
-    for m in config["mappings"]:
-        e = m.get("external_field")
-        v = m.get("velaris_field")
-        ext_transforms = m.get("external_transforms", [])
-        vel_transforms = m.get("velaris_transforms", [])
-        ext_custom = m.get("external_custom", "")
-        vel_custom = m.get("velaris_custom", "")
-
-        if e in external.columns:
-            if ext_transforms:
-                external[e] = external[e].apply(lambda x: apply_transform(x, ext_transforms))
-            if ext_custom:
-                # Check if it's a pipeline (contains |) or custom JS function
-                if '|' in ext_custom or any(op in ext_custom for op in ['trim', 'lower', 'upper', 'replace(', 'map(']):
-                    # Pipeline operations
-                    external[e] = external[e].apply(lambda x: apply_custom_pipeline(x, ext_custom))
-                else:
-                    # Custom JavaScript function
-                    external[e] = external[e].apply(lambda x: execute_custom_function(x, ext_custom))
-        if v in velaris.columns:
-            if vel_transforms:
-                velaris[v] = velaris[v].apply(lambda x: apply_transform(x, vel_transforms))
-            if vel_custom:
-                # Check if it's a pipeline (contains |) or custom JS function
-                if '|' in vel_custom or any(op in vel_custom for op in ['trim', 'lower', 'upper', 'replace(', 'map(']):
-                    # Pipeline operations
-                    velaris[v] = velaris[v].apply(lambda x: apply_custom_pipeline(x, vel_custom))
-                else:
-                    # Custom JavaScript function
-                    velaris[v] = velaris[v].apply(lambda x: execute_custom_function(x, vel_custom))
-
+    external, velaris, _ = apply_mapping_with_stats(external_df, velaris_df, config)
     return external, velaris
@@ -0,0 +1,175 @@
+import copy
+import threading
+from collections import OrderedDict
+
+from pydantic import ValidationError
+
+from config import config
+from services.comparison_engine import COMPARISON_REGISTRY, SIDES, check_key_fields, check_rule_options, get_result_mode
+from services.filter_engine import FilterGroup
+from services.fuzzy_match import fuzzy_options
+from services.incremental import snapshot_path
+from services.mapping_engine import (
+    PIPELINE_OPERATIONS, TRANSFORM_REGISTRY, is_pipeline, compile_custom_function, compile_pipeline, compile_transforms,
+    key_columns, key_customs,
+)
+from services.result_cache import canonical_mapping, digest
+
+# Mapping plans
+#
+# A mapping_config can be checked on its own (and against the CSV headers)
+# before any data is uploaded, and kept under a plan id: its digest, so equal
+# configs share an id. Comparison routes accept {"plan_id": id} in place of the
+# config. Job workers compile the transforms of a config once and cache them
+# (mapping_engine.compile_transforms), so reusing a plan also reuses that work.
+
+def plan_id(mapping):
+    return digest(canonical_mapping(mapping))
+
+def _custom_problems(custom, where):
+    """(errors, warnings) for a key or field custom: a pipeline string or a JS-like function."""
+    if not custom:
+        return [], []
+    if not isinstance(custom, str):
+        return [f"{where} must be a string"], []
+    if is_pipeline(custom):
+        steps = compile_pipeline(custom)
+        tokens = [t for t in custom.split("|") if t.strip()]
+        warnings = []
+        if len(steps) < len(tokens):
+            warnings.append(f"{where}: {len(tokens) - len(steps)} invalid pipeline token(s) are skipped")
+        for op, args in steps:
+            if not (op in TRANSFORM_REGISTRY and not args) and op not in PIPELINE_OPERATIONS:
+                warnings.append(f"{where}: unknown pipeline op '{op}' is skipped")
+        return [], warnings
+    try:
+        compile_custom_function(custom)
+    except Exception as e:
+        return [], [f"{where}: custom function does not compile ({e}); values are left unchanged"]
+    return [], []
+
+def _header_problems(mapping, columns):
+    """(errors, warnings) for the columns a mapping_config references but a side's header lacks."""
+    errors, warnings = [], []
+    compare_only_mapped = mapping.get("compare_only_mapped", True)
+    for side in SIDES:
+        header = columns.get(side)
+        if header is None:
+            continue
+        header = set(header)
+        keys = key_columns(mapping, side)
+        for column in keys:
+            if column not in header:
+                errors.append(f"Key field '{column}' not found in {side} CSV")
+        for m in mapping.get("mappings") or []:
+            column = m.get(f"{side}_field")
+            if not column or column in header or column in keys:
+                continue
+            if compare_only_mapped:
+                errors.append(f"Field '{column}' not found in {side} CSV")
+            else:
+                warnings.append(f"Field '{column}' not found in {side} CSV; its transforms are skipped")
+        group = (mapping.get("filters") or {}).get(side) or {}
+        for condition in group.get("conditions", []) if isinstance(group, dict) else []:
+            if isinstance(condition, dict) and condition.get("field") and condition["field"] not in header:
+                warnings.append(f"{side} filter field '{condition['field']}' not found; the condition never matches")
+    return errors, warnings
+
+def validate_mapping(mapping, columns=None):
+    """
+    Check a mapping_config without touching any data. columns optionally maps a
+    side ("external" / "velaris") to its CSV header. Returns (errors, warnings):
+    errors would make a comparison fail or be rejected, warnings describe parts
+    that a comparison skips (unknown transforms, rules or pipeline ops, custom
+    functions that do not compile, invalid filter groups).
+    """
+    if not isinstance(mapping, dict):
+        return ["mapping_config must be an object"], []
+    errors, warnings = [], []
+    for check in (get_result_mode, check_key_fields, check_rule_options, fuzzy_options):
+        try:
+            check(mapping)
+        except (ValueError, AttributeError, TypeError) as e:
+            errors.append(str(e))
+    if mapping.get("incremental"):
+        try:
+            snapshot_path(mapping["incremental"].get("snapshot"))
+        except (ValueError, AttributeError) as e:
+            errors.append(str(e))
+
+    mappings = mapping.get("mappings", [])
+    if not isinstance(mappings, list) or not all(isinstance(m, dict) for m in mappings):
+        return errors + ["mappings must be a list of objects"], warnings
+    if "mappings" not in mapping and mapping.get("compare_only_mapped", True):
+        errors.append("mappings is required unless compare_only_mapped is false")
+    for i, m in enumerate(mappings):
+        where = f"mappings[{i}]"
+        for name in ("external_field", "velaris_field", "rule"):
+            if not m.get(name):
+                errors.append(f"{where} needs '{name}'")
+        if m.get("rule") and m["rule"] not in COMPARISON_REGISTRY:
+            warnings.append(f"{where}: unknown rule '{m['rule']}', 'equals' is used instead")
+        for side in SIDES:
+            for name in m.get(f"{side}_transforms") or []:
+                if name not in TRANSFORM_REGISTRY:
+                    warnings.append(f"{where}: unknown transform '{name}' is skipped")
+            e, w = _custom_problems(m.get(f"{side}_custom"), f"{where}.{side}_custom")
+            errors.extend(e)
+            warnings.extend(w)
+    if not errors:
+        for side in SIDES:
+            for column, custom in zip(key_columns(mapping, side), key_customs(mapping, side)):
+                e, w = _custom_problems(custom, f"key_fields.{side}_custom ('{column}')")
+                errors.extend(e)
+                warnings.extend(w)
+
+    for side, group in (mapping.get("filters") or {}).items():
+        if group:
+            try:
+                FilterGroup(**group)
+            except ValidationError as e:
+                problems = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+                warnings.append(f"filters.{side} is invalid and is ignored ({problems})")
+            except TypeError:
+                warnings.append(f"filters.{side} is invalid and is ignored (expected an object)")
+    if columns and not errors:
+        e, w = _header_problems(mapping, columns)
+        errors.extend(e)
+        warnings.extend(w)
+    return errors, warnings
+
+def transformed_columns(mapping):
+    """Per side, the columns the compiled plan transforms (key columns first, in application order)."""
+    plans = compile_transforms(mapping)
+    return {side: [column for column, _ in keys + fields] for side, (keys, fields) in plans.items()}
+
+class PlanRegistry:
+    """
+    Validated mapping_configs by plan id, least recently used dropped beyond `size`.
+    Lives in the API process; configs are resolved here and shipped to job workers.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, mapping):
+        key = plan_id(mapping)
+        with self._lock:
+            self._plans[key] = copy.deepcopy(mapping)
+            self._plans.move_to_end(key)
+            while len(self._plans) > self.size:
+                self._plans.popitem(last=False)
+        return key
+
+    def get(self, key):
+        """A copy of the stored mapping_config, or None."""
+        with self._lock:
+            mapping = self._plans.get(key)
+            if mapping is None:
+                return None
+            self._plans.move_to_end(key)
+            return copy.deepcopy(mapping)
+
+plans = PlanRegistry(config.MAPPING_PLAN_CACHE_SIZE)
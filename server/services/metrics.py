@@ -0,0 +1,171 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Exported metrics: name -> (type, help). Names are prefixed with METRIC_PREFIX when rendered.
+METRIC_PREFIX = "csv_compare_"
+METRICS = {
+    "stage_seconds": ("histogram", "Duration of a comparison stage (read_csv, apply_filters, apply_mapping, compare_records, ...)."),
+    "bytes_parsed_total": ("counter", "CSV bytes handed to the parser."),
+    "rows_compared_total": ("counter", "Rows (both sides) entering the comparison stage."),
+    "rule_evaluations_total": ("counter", "Paired rows evaluated per comparison rule."),
+    "transform_failures_total": ("counter", "Cells a transform, pipeline op or custom function failed on (the value is kept)."),
+    "warnings_total": ("counter", "Warnings raised while comparing, by kind."),
+    "jobs_total": ("counter", "Comparison jobs finished, by status."),
+    "admission_reserved_bytes": ("gauge", "Estimated memory reserved by comparisons in flight."),
+    "admission_in_flight": ("gauge", "Comparisons holding a memory reservation."),
+    "admission_queue_depth": ("gauge", "Comparisons waiting for a memory reservation."),
+    "admission_rejections_total": ("counter", "Comparisons rejected (503) for lack of memory budget."),
+}
+
+# Upper bounds (seconds) of the stage_seconds histogram buckets; +Inf is implicit
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+class MetricsRegistry:
+    """
+    Process-local counters and histograms, rendered in the Prometheus text format.
+    Job workers record into their own registry; what one job recorded is sent back
+    with its result (see recorded) and merged into the API process's registry,
+    which GET /metrics serves. Gauges describe the process that sets them and
+    are not merged.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+
+    @staticmethod
+    def _key(name, labels):
+        if name not in METRICS:
+            raise KeyError(f"Unknown metric '{name}'")
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            # [per-bucket counts..., +Inf count], sum
+            buckets, total = self._histograms.get(key, ([0] * (len(STAGE_BUCKETS) + 1), 0.0))
+            for i, bound in enumerate(STAGE_BUCKETS):
+                if value <= bound:
+                    buckets[i] += 1
+                    break
+            else:
+                buckets[-1] += 1
+            self._histograms[key] = (buckets, total + value)
+
+    def snapshot(self):
+        """Plain (picklable) copy of everything recorded so far."""
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "histograms": {k: (list(b), s) for k, (b, s) in self._histograms.items()},
+                "gauges": dict(self._gauges),
+            }
+
+    def merge(self, snapshot):
+        """Add another registry's snapshot (e.g. a worker's) into this one."""
+        with self._lock:
+            for key, value in snapshot["counters"].items():
+                self._counters[key] = self._counters.get(key, 0) + value
+            for key, (buckets, total) in snapshot["histograms"].items():
+                mine, my_total = self._histograms.get(key, ([0] * len(buckets), 0.0))
+                self._histograms[key] = ([a + b for a, b in zip(mine, buckets)], my_total + total)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._gauges.clear()
+
+    def render(self):
+        """Prometheus text exposition (version 0.0.4) of every metric."""
+        snapshot = self.snapshot()
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            full = METRIC_PREFIX + name
+            lines.append(f"# HELP {full} {help_text}")
+            lines.append(f"# TYPE {full} {kind}")
+            if kind in ("counter", "gauge"):
+                for (metric, labels), value in sorted(snapshot[kind + "s"].items()):
+                    if metric == name:
+                        lines.append(f"{full}{_labels(labels)} {_number(value)}")
+                continue
+            for (metric, labels), (buckets, total) in sorted(snapshot["histograms"].items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(STAGE_BUCKETS + ("+Inf",), buckets):
+                    cumulative += count
+                    lines.append(f"{full}_bucket{_labels(labels + (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{full}_sum{_labels(labels)} {_number(total)}")
+                lines.append(f"{full}_count{_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+metrics = MetricsRegistry()
+
+def warn(logger, kind, message):
+    """Log a warning and count it in warnings_total under kind."""
+    metrics.inc("warnings_total", warning=kind)
+    logger.warning(message)
+
+def recorded(fn, *args):
+    """
+    Run fn(*args) in a worker process and return (result, metrics it recorded),
+    so the submitting process can merge the worker's counters into its own.
+    """
+    metrics.reset()
+    return fn(*args), metrics.snapshot()
+
+class Timings:
+    """
+    Per-run stage timings, reported as the "timings" block of a comparison result:
+    {"total_seconds", "stages": [{"stage", "seconds", "rows_in", "rows_out", ...}]}.
+    Every stage is also observed in the stage_seconds histogram.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        """Time the enclosed block; the yielded dict takes rows_out and any extra fields."""
+        entry = {"stage": name, "seconds": None, "rows_in": rows_in, "rows_out": None}
+        start = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            self._record(entry, time.perf_counter() - start)
+
+    def add(self, name, seconds, rows_in=None, rows_out=None):
+        """Record a stage timed by the caller (e.g. one still producing output)."""
+        self._record({"stage": name, "seconds": None, "rows_in": rows_in, "rows_out": rows_out}, seconds)
+
+    def _record(self, entry, seconds):
+        entry["seconds"] = round(seconds, 6)
+        self.stages.append(entry)
+        metrics.observe("stage_seconds", seconds, stage=entry["stage"])
+
+    def report(self):
+        return {"total_seconds": round(time.perf_counter() - self.started, 6), "stages": self.stages}
@@ -0,0 +1,340 @@
+import logging
+import math
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from config import config
+from services.comparison_engine import (
+    bucket_records, build_summary, check_key_fields, compare_positions, duplicate_order, duplicate_records, get_result_mode, key_labels,
+    key_values, merge_unparseable, orphan_matches, remap_duplicates, unparseable_report, RecordTally, RESULT_BUCKETS,
+)
+from services.csv_loader import required_columns
+from services.dataset_cache import load_frame, save_frame
+from services.filter_engine import apply_filters
+from services.fuzzy_match import fuzzy_options
+from services.mapping_engine import apply_mapping_with_stats, key_columns, TRANSFORM_ROLES
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Rough peak memory per byte of parsed rows while a chunk is filtered and mapped
+# (apply_mapping copies the frame, transforms build new columns) or while a
+# partition pair is joined and compared
+WORK_FACTOR = 4
+
+SIDES = ("external", "velaris")
+
+# Column of a spilled piece holding each row's position in its (filtered) CSV
+ROW_COLUMN = "__row_position__"
+
+def _header(source, columns):
+    header = pd.read_csv(source, nrows=0).columns
+    return [c for c in header if columns is None or c in columns]
+
+def _unify_dtypes(seen):
+    """
+    The dtype to force for a column that chunked parsing saw as `seen`, or None
+    to leave it to inference: ints that meet floats (or an all-missing chunk)
+    become float64, like a whole-file parse; any other mix is read as text.
+    """
+    if len(seen) == 1:
+        dtype = next(iter(seen))
+        return None if dtype == object else dtype
+    if all(isinstance(d, np.dtype) and d.kind in "iuf" for d in seen):
+        return np.float64
+    return str
+
+def scan_csv(source, columns, chunk_rows):
+    """
+    First pass over a CSV: rows, parsed bytes per row and per-column dtypes to
+    force in the second pass, so every chunk parses values as the whole file would.
+    """
+    usecols = _header(source, columns)
+    # With CSV_DTYPE "string" or "category" everything is text (categories would differ per chunk)
+    text = config.CSV_DTYPE != "infer"
+    seen = {c: set() for c in usecols}
+    rows, size = 0, 0
+    for chunk in pd.read_csv(source, usecols=usecols, dtype=str if text else None, chunksize=chunk_rows):
+        rows += len(chunk)
+        size += int(chunk.memory_usage(index=False, deep=True).sum())
+        for c in usecols:
+            seen[c].add(chunk[c].dtype)
+    if text:
+        return usecols, str, rows, size
+    dtypes = {c: _unify_dtypes(s) for c, s in seen.items() if s}
+    return usecols, {c: d for c, d in dtypes.items() if d is not None}, rows, size
+
+def plan(budget_bytes, parsed_bytes, rows):
+    """(chunk rows, partitions) keeping one chunk, or one partition pair, within the budget."""
+    bytes_per_row = max(1, sum(parsed_bytes) / max(1, sum(rows)))
+    chunk_rows = max(1, int(budget_bytes / (WORK_FACTOR * bytes_per_row)))
+    partitions = max(1, math.ceil(WORK_FACTOR * sum(parsed_bytes) / budget_bytes))
+    return chunk_rows, partitions
+
+def stable_key_hashes(keys):
+    """
+    64-bit key hashes that depend only on each value, never on the chunk it was
+    read in, so keys the join treats as equal always land in the same partition:
+    numbers (1, 1.0, True) hash as float64, strings as strings, missing keys as 0.
+    Composite keys (DataFrames) combine the hashes of their columns.
+    """
+    if isinstance(keys, pd.DataFrame):
+        hashes = np.zeros(len(keys), dtype=np.uint64)
+        for i in range(keys.shape[1]):
+            hashes = hashes * np.uint64(1000003) ^ stable_key_hashes(keys.iloc[:, i])
+        return hashes
+    if pd.api.types.is_numeric_dtype(keys.dtype) and not pd.api.types.is_bool_dtype(keys.dtype):
+        values = keys.to_numpy(dtype=np.float64, na_value=np.nan)
+        hashes = pd.util.hash_array(values)
+        hashes[np.isnan(values)] = 0
+        return hashes
+    values = keys.to_numpy(dtype=object)
+    hashes = np.zeros(len(values), dtype=np.uint64)
+    na = pd.isna(values)
+    if pd.api.types.infer_dtype(values, skipna=True) in ("string", "empty"):
+        hashes[~na] = pd.util.hash_array(values[~na])
+        return hashes
+    numeric = np.array([isinstance(v, (int, float, bool, np.number)) for v in values], dtype=bool) & ~na
+    if numeric.any():
+        hashes[numeric] = pd.util.hash_array(values[numeric].astype(np.float64))
+    text = ~na & ~numeric
+    if text.any():
+        hashes[text] = pd.util.hash_array(np.array([str(v) for v in values[text]], dtype=object))
+    return hashes
+
+def _merge_filter_stats(total, stats):
+    if total is None:
+        return dict(stats)
+    for k in ("original", "kept", "dropped"):
+        total[k] += stats[k]
+    return total
+
+def _merge_transform_stats(total, stats):
+    for role, columns in stats.items():
+        for column, s in columns.items():
+            entry = total[role].setdefault(column, {"rows": 0, "distinct": None, "memoized": False, "chunks_memoized": 0, "seconds": 0.0})
+            entry["rows"] += s["rows"]
+            entry["seconds"] = round(entry["seconds"] + s["seconds"], 6)
+            entry["memoized"] = entry["memoized"] or s["memoized"]
+            entry["chunks_memoized"] += int(s["memoized"])
+
+def spill_side(source, side, mapping, usecols, dtype, chunk_rows, partitions, directory):
+    """
+    Second pass over one CSV: filter and map each chunk, then add its rows to
+    the key-hash partitions, one directory per partition holding a numbered
+    piece per chunk (see save_frame). Returns (filter_stats, transform_stats,
+    dtype kinds of every mapped column).
+    """
+    keys = key_columns(mapping, side)
+    group = (mapping.get("filters") or {}).get(side)
+    paths = [os.path.join(directory, f"{side}-{p}") for p in range(partitions)]
+    for path in paths:
+        os.makedirs(path, exist_ok=True)
+    pieces = [0] * partitions
+    filter_stats, transform_stats, kinds = None, {role: {} for role in TRANSFORM_ROLES}, {}
+    position = 0
+    metrics.inc("bytes_parsed_total", os.path.getsize(source))
+    chunks = pd.read_csv(source, usecols=usecols, dtype=dtype, chunksize=chunk_rows)
+    for chunk in chunks:
+        chunk, stats = apply_filters(chunk, group)
+        filter_stats = _merge_filter_stats(filter_stats, stats)
+        empty = pd.DataFrame()
+        frames = (chunk, empty) if side == "external" else (empty, chunk)
+        mapped_e, mapped_v, stats = apply_mapping_with_stats(*frames, mapping)
+        mapped = mapped_e if side == "external" else mapped_v
+        _merge_transform_stats(transform_stats, stats[side])
+        for c in mapped.columns:
+            kinds.setdefault(c, set()).add(mapped[c].dtype.kind)
+
+        rows = np.arange(position, position + len(mapped), dtype=np.int64)
+        position += len(mapped)
+        if not set(keys) <= set(mapped.columns):
+            continue
+        key = mapped[keys[0]] if len(keys) == 1 else mapped[keys]
+        bucket = (stable_key_hashes(key) % np.uint64(partitions)).astype(np.int64)
+        for p in np.unique(bucket):
+            take = np.flatnonzero(bucket == p)
+            save_frame(mapped.iloc[take].assign(**{ROW_COLUMN: rows[take]}), os.path.join(paths[p], str(pieces[p])))
+            pieces[p] += 1
+    if filter_stats is None:
+        # No data rows: report what an in-memory run over an empty frame would
+        _, filter_stats = apply_filters(pd.DataFrame(columns=usecols), group)
+    return filter_stats, transform_stats, kinds
+
+def load_partition(path, upcast):
+    """
+    Concatenate the spilled pieces of one partition directory in chunk order;
+    upcast holds columns to read as float64. Returns (row positions, frame).
+    """
+    pieces = sorted(int(name[:-len(".json")]) for name in os.listdir(path) if name.endswith(".json"))
+    if not pieces:
+        return np.empty(0, dtype=np.int64), None
+    frames = [load_frame(os.path.join(path, str(n))) for n in pieces]
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    positions = df.pop(ROW_COLUMN).to_numpy(dtype=np.int64)
+    for c in upcast:
+        if c in df.columns and df[c].dtype.kind in "iu":
+            df[c] = df[c].astype(np.float64)
+    return positions, df
+
+def _mixed_numeric(kinds):
+    """Columns some chunks mapped to ints and others to floats; a whole-frame run would hold floats."""
+    return {c for c, seen in kinds.items() if seen & {"i", "u"} and seen & {"f"}}
+
+def _spill_inputs(sources, mapping, memory_budget, partitions, directory):
+    """
+    Scan both CSVs, then filter, map and spill them to key-hash partitions in
+    directory. Returns (partitions, filter_stats, transform_stats, upcast).
+    """
+    check_key_fields(mapping)
+    scans = {}
+    for side in SIDES:
+        scans[side] = scan_csv(sources[side], required_columns(mapping, side), config.OUT_OF_CORE_SCAN_ROWS)
+        # Validate key fields exist
+        for key in key_columns(mapping, side):
+            if key not in scans[side][0]:
+                raise ValueError(f"Key field '{key}' not found in {side} CSV")
+    chunk_rows, planned = plan(memory_budget, [s[3] for s in scans.values()], [s[2] for s in scans.values()])
+    partitions = partitions or planned
+    logger.info(f"Out-of-core comparison: {partitions} partitions, {chunk_rows} rows per chunk")
+
+    filter_stats, transform_stats, upcast = {}, {}, {}
+    for side in SIDES:
+        usecols, dtype, _, _ = scans[side]
+        filter_stats[side], transform_stats[side], kinds = spill_side(
+            sources[side], side, mapping, usecols, dtype, chunk_rows, partitions, directory,
+        )
+        upcast[side] = _mixed_numeric(kinds)
+    return partitions, filter_stats, transform_stats, upcast
+
+def _partition_pairs(directory, partitions, upcast, mapping):
+    """Yield (external rows, external, velaris rows, velaris) for each spilled partition pair holding rows."""
+    for p in range(partitions):
+        ext_rows, external = load_partition(os.path.join(directory, f"external-{p}"), upcast["external"])
+        vel_rows, velaris = load_partition(os.path.join(directory, f"velaris-{p}"), upcast["velaris"])
+        if external is None and velaris is None:
+            continue
+        external = external if external is not None else pd.DataFrame(columns=key_columns(mapping, "external"))
+        velaris = velaris if velaris is not None else pd.DataFrame(columns=key_columns(mapping, "velaris"))
+        yield ext_rows, external, vel_rows, velaris
+
+def compare_out_of_core(external_source, velaris_source, mapping, memory_budget=None, partitions=None):
+    """
+    read -> filter -> map -> compare for CSV files that may not fit in memory.
+
+    Both files are parsed twice in chunks: a scan fixes every column's dtype
+    and sizes the chunks, then each chunk is filtered, mapped and spilled to
+    on-disk partitions bucketed by key hash. Partition pairs are then compared
+    one at a time and the results merged back into input row order, giving the
+    same output as run_comparison. memory_budget (bytes, default
+    OUT_OF_CORE_MEMORY_MB) bounds one chunk or one partition pair, assuming
+    keys are reasonably spread across partitions. Summaries only add up bucket
+    counts and mismatch histograms per partition (plus the orphan keys when
+    fuzzy_keys is set), so their memory does not grow with the row count.
+    Returns (result, filter_stats, transform_stats).
+    """
+    memory_budget = memory_budget or config.OUT_OF_CORE_MEMORY_MB * 1024 * 1024
+    mode = get_result_mode(mapping)
+    detail = mode != "summary"
+    compare_only_mapped = mapping.get("compare_only_mapped", True)
+    sources = {"external": external_source, "velaris": velaris_source}
+
+    directory = tempfile.mkdtemp(prefix="compare-", dir=config.UPLOAD_TMP_DIR)
+    try:
+        partitions, filter_stats, transform_stats, upcast = _spill_inputs(sources, mapping, memory_budget, partitions, directory)
+
+        # Summaries keep only counts and histograms; labels are collected for full / page
+        # results, or in summary mode for the orphans fuzzy matching needs
+        fuzzy = fuzzy_options(mapping) is not None
+        collected = {bucket: [] for bucket in RESULT_BUCKETS if bucket not in ("duplicate_keys", "probable_matches")}
+        counts = dict.fromkeys(RESULT_BUCKETS, 0)
+        duplicates, duplicate_rows = [], []
+        field_mismatches, unparseable = {}, {}
+        for ext_rows, external, vel_rows, velaris in _partition_pairs(directory, partitions, upcast, mapping):
+            ext_keys, vel_keys = key_values(external, velaris, mapping)
+            positions = compare_positions(external, velaris, mapping, detail=detail, keys=(ext_keys, vel_keys))
+            merge_unparseable(unparseable, positions["unparseable"])
+            for bucket in counts:
+                if bucket != "probable_matches":
+                    counts[bucket] += len(positions[bucket])
+            if detail or fuzzy:
+                local = positions["missing_in_velaris"]
+                collected["missing_in_velaris"].append((ext_rows[local], key_labels(ext_keys, local)))
+                local = positions["missing_in_external"]
+                collected["missing_in_external"].append((vel_rows[local], key_labels(vel_keys, local)))
+            if detail:
+                local = positions["matched"]
+                collected["matched"].append((ext_rows[local], key_labels(ext_keys, local)))
+                local = positions["mismatched"]
+                collected["mismatched"].append((ext_rows[local], list(zip(key_labels(ext_keys, local), positions["differences"]))))
+                local = positions["duplicate_keys"]
+                duplicates.extend(duplicate_records(ext_keys, vel_keys, local))
+                duplicate_rows.append(remap_duplicates(local, ext_rows, vel_rows))
+            else:
+                for label, histogram in positions["field_mismatches"].items():
+                    merged = field_mismatches.setdefault(label, {})
+                    for pair, count in histogram.items():
+                        merged[pair] = merged.get(pair, 0) + count
+            del external, velaris, positions
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    ordered = {}
+    for bucket, parts in collected.items():
+        rows = np.concatenate([r for r, _ in parts]) if parts else np.empty(0, dtype=np.int64)
+        values = [v for _, vs in parts for v in vs]
+        ordered[bucket] = [values[i] for i in np.argsort(rows, kind="stable")]
+    # Near-miss keys usually hash to different partitions, so orphans are matched globally
+    probable = orphan_matches(ordered["missing_in_velaris"], ordered["missing_in_external"], mapping)
+
+    if mode == "summary":
+        counts["probable_matches"] = len(probable)
+        positions = {"field_mismatches": field_mismatches, "unparseable": unparseable}
+        result = build_summary(positions, compare_only_mapped, counts=counts)
+    else:
+        duplicate_rows = np.concatenate(duplicate_rows) if duplicate_rows else np.empty((0, 4), dtype=np.int64)
+        result = {
+            "matched": ordered["matched"],
+            "mismatched": [{"id": k, "differences": d} for k, d in ordered["mismatched"]],
+            "missing_in_velaris": ordered["missing_in_velaris"],
+            "missing_in_external": ordered["missing_in_external"],
+            "duplicate_keys": [duplicates[i] for i in duplicate_order(duplicate_rows)],
+            "probable_matches": probable,
+            "compare_mode": "mapped_fields_only" if compare_only_mapped else "all_fields"
+        }
+        if unparseable:
+            result["unparseable"] = unparseable_report(unparseable)
+        if mode == "page":
+            result["result_mode"] = "page"
+    return result, filter_stats, transform_stats
+
+def stream_out_of_core(external_source, velaris_source, mapping, memory_budget=None, partitions=None, chunk_size=None):
+    """
+    compare_out_of_core as a stream of comparison_engine.iter_records lines.
+    Each partition pair's records are yielded as soon as it is compared, so
+    only one pair is held at a time however many rows differ; lines are
+    therefore grouped by partition rather than in input row order. With
+    fuzzy_keys the orphan key labels are also kept until the end, when the
+    probable_matches records are built. The summary line additionally
+    carries filter_stats and transform_stats.
+    """
+    memory_budget = memory_budget or config.OUT_OF_CORE_MEMORY_MB * 1024 * 1024
+    sources = {"external": external_source, "velaris": velaris_source}
+    directory = tempfile.mkdtemp(prefix="compare-", dir=config.UPLOAD_TMP_DIR)
+    try:
+        partitions, filter_stats, transform_stats, upcast = _spill_inputs(sources, mapping, memory_budget, partitions, directory)
+        tally = RecordTally(mapping)
+        for ext_rows, external, vel_rows, velaris in _partition_pairs(directory, partitions, upcast, mapping):
+            yield from bucket_records(external, velaris, mapping, tally, chunk_size, rows=(ext_rows, vel_rows))
+            del external, velaris
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    for record in tally.finish(mapping):
+        if record["type"] == "summary":
+            record["filter_stats"] = filter_stats
+            record["transform_stats"] = transform_stats
+        yield record
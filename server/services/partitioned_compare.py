@@ -0,0 +1,337 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from config import config
+from services.comparison_engine import (
+    align_key_dtypes, add_probable_matches, bucket_records, build_results, build_summary, compare_positions, get_result_mode,
+    iter_records, key_values, merge_unparseable, order_duplicates, remap_duplicates, RecordTally,
+)
+from services.dataset_cache import load_frame, save_frame
+from services.mapping_engine import apply_mapping_with_stats, combine_side_stats, TRANSFORM_ROLES
+from services.metrics import metrics, recorded
+
+logger = logging.getLogger(__name__)
+
+_partition_pool = None
+_partition_pool_size = 0
+
+def partition_workers(partitions):
+    """
+    Processes available to one partitioned comparison. It already runs inside a
+    job worker, so the CPUs are shared with the other JOB_WORKERS.
+    """
+    return max(1, min(partitions, (os.cpu_count() or 1) // max(1, config.JOB_WORKERS)))
+
+def _executor(workers):
+    """Spawn-based pool shared by the comparisons of this process, grown if a caller asks for more workers."""
+    global _partition_pool, _partition_pool_size
+    if _partition_pool is None or _partition_pool_size < workers:
+        if _partition_pool is not None:
+            _partition_pool.shutdown(wait=False)
+        _partition_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        _partition_pool_size = workers
+    return _partition_pool
+
+def _hash_keys(keys, strings):
+    """64-bit hashes such that keys the join treats as equal always hash equally."""
+    if pd.api.types.is_numeric_dtype(keys.dtype):
+        # 1 and 1.0 join as equal, so hash every numeric key as float64
+        return pd.util.hash_array(keys.to_numpy(dtype=np.float64, na_value=np.nan))
+    values = keys.to_numpy(dtype=object)
+    if strings:
+        return pd.util.hash_array(values)
+    # Mixed objects: Python's hash agrees with ==; all missing values share partition 0
+    na = pd.isna(values)
+    hashes = np.zeros(len(values), dtype=np.uint64)
+    hashes[~na] = [hash(v) & 0xFFFFFFFFFFFFFFFF for v in values[~na]]
+    return hashes
+
+def _column_hashes(ext_keys, vel_keys):
+    ext_keys, vel_keys = align_key_dtypes(ext_keys, vel_keys)
+    strings = all(
+        pd.api.types.infer_dtype(k.to_numpy(dtype=object), skipna=True) in ("string", "empty")
+        for k in (ext_keys, vel_keys)
+    )
+    return _hash_keys(ext_keys, strings), _hash_keys(vel_keys, strings)
+
+def partition_keys(ext_keys, vel_keys, partitions):
+    """
+    Assign every row of both key columns to one of `partitions` buckets by key hash.
+    Composite keys (DataFrames) combine the hashes of their columns.
+    """
+    if isinstance(ext_keys, pd.DataFrame):
+        ext_hashes = np.zeros(len(ext_keys), dtype=np.uint64)
+        vel_hashes = np.zeros(len(vel_keys), dtype=np.uint64)
+        for i in range(ext_keys.shape[1]):
+            e, v = _column_hashes(ext_keys.iloc[:, i], vel_keys.iloc[:, i])
+            ext_hashes = ext_hashes * np.uint64(1000003) ^ e
+            vel_hashes = vel_hashes * np.uint64(1000003) ^ v
+    else:
+        ext_hashes, vel_hashes = _column_hashes(ext_keys, vel_keys)
+    return (
+        (ext_hashes % np.uint64(partitions)).astype(np.int64),
+        (vel_hashes % np.uint64(partitions)).astype(np.int64),
+    )
+
+def _kinds(mapped_external, mapped_velaris, stats):
+    return {
+        "external": {c: mapped_external[c].dtype.kind for c in stats["external"]["fields"]},
+        "velaris": {c: mapped_velaris[c].dtype.kind for c in stats["velaris"]["fields"]},
+    }
+
+def _global_positions(positions, ext_rows, vel_rows):
+    positions["matched"] = ext_rows[positions["matched"]]
+    positions["mismatched"] = ext_rows[positions["mismatched"]]
+    positions["missing_in_velaris"] = ext_rows[positions["missing_in_velaris"]]
+    positions["missing_in_external"] = vel_rows[positions["missing_in_external"]]
+    positions["duplicate_keys"] = remap_duplicates(positions["duplicate_keys"], ext_rows, vel_rows)
+    return positions
+
+def _compare_partition(external, velaris, mapping, ext_rows, vel_rows, detail=True, spill_path=None):
+    """
+    Worker: apply field transforms and compare one partition, reporting global row positions.
+    When a transformed column came out as ints, the mapped frames are kept in
+    spill_path in case another partition holds floats there (see _upcast_columns).
+    """
+    mapped_external, mapped_velaris, stats = apply_mapping_with_stats(external, velaris, mapping, keys=False)
+    kinds = _kinds(mapped_external, mapped_velaris, stats)
+    if spill_path and any(kind in "iu" for side in kinds.values() for kind in side.values()):
+        _spill(spill_path, mapped_external, mapped_velaris)
+    else:
+        spill_path = None
+    positions = compare_positions(mapped_external, mapped_velaris, mapping, detail=detail)
+    return _global_positions(positions, ext_rows, vel_rows), stats, kinds, spill_path
+
+def _spill(spill_path, mapped_external, mapped_velaris):
+    """Keep one partition's mapped frames in the directory spill_path, stored like datasets (see save_frame)."""
+    os.makedirs(spill_path, exist_ok=True)
+    save_frame(mapped_external, os.path.join(spill_path, "external"))
+    save_frame(mapped_velaris, os.path.join(spill_path, "velaris"))
+
+def _load_spilled(spill_path, upcast):
+    """Mapped frames kept by a partition worker, with the upcast {side: {column: dtype}} applied."""
+    frames = {side: load_frame(os.path.join(spill_path, side)) for side in ("external", "velaris")}
+    for side, columns in upcast.items():
+        for column, dtype in columns.items():
+            if frames[side][column].dtype.kind in "iu":
+                frames[side][column] = frames[side][column].astype(dtype)
+    return frames
+
+def _recompare_partition(spill_path, mapping, ext_rows, vel_rows, detail, upcast):
+    """Worker: compare a spilled partition again with the upcast applied."""
+    frames = _load_spilled(spill_path, upcast)
+    return _global_positions(compare_positions(frames["external"], frames["velaris"], mapping, detail=detail), ext_rows, vel_rows)
+
+def _map_partition(external, velaris, mapping, spill_path):
+    """Worker: apply field transforms to one partition and keep the mapped frames in spill_path."""
+    mapped_external, mapped_velaris, stats = apply_mapping_with_stats(external, velaris, mapping, keys=False)
+    _spill(spill_path, mapped_external, mapped_velaris)
+    return stats, _kinds(mapped_external, mapped_velaris, stats)
+
+def _partition_records(spill_path, mapping, ext_rows, vel_rows, upcast):
+    """Worker: the bucket_records of one mapped partition, as (records, RecordTally)."""
+    frames = _load_spilled(spill_path, upcast)
+    shutil.rmtree(spill_path)
+    tally = RecordTally(mapping)
+    records = list(bucket_records(frames["external"], frames["velaris"], mapping, tally, rows=(ext_rows, vel_rows)))
+    return records, tally
+
+def _upcast_columns(kinds_per_partition):
+    """
+    Transformed columns infer their dtype from the values they hold. Partitions only
+    diverge from a whole-frame run when one holds ints and another floats/NaN (the
+    whole column would be upcast to float); other mixes stringify identically.
+    Returns {side: {column: dtype}} for the int partitions of such columns.
+    """
+    upcast = {}
+    for side in ("external", "velaris"):
+        seen = {}
+        for kinds in kinds_per_partition:
+            for column, kind in kinds[side].items():
+                seen.setdefault(column, set()).add(kind)
+        for column, kinds in seen.items():
+            if kinds & {"i", "u"} and kinds & {"f", "c"}:
+                logger.info(f"Partitions disagree on dtype of {side} column '{column}' ({kinds}), upcasting")
+                upcast.setdefault(side, {})[column] = np.complex128 if "c" in kinds else np.float64
+    return upcast
+
+def _needs_upcast(kinds, upcast):
+    return any(kinds[side].get(column, "") in "iu" for side, columns in upcast.items() for column in columns)
+
+def _merge_stats(stats_per_partition, rows):
+    merged = {side: {role: {} for role in TRANSFORM_ROLES} for side in ("external", "velaris")}
+    for side, roles in merged.items():
+        for role, columns in roles.items():
+            for stats in stats_per_partition:
+                for column, s in stats[side][role].items():
+                    entry = columns.setdefault(column, {"rows": 0, "distinct": None, "memoized": False, "partitions_memoized": 0, "seconds": 0.0})
+                    entry["memoized"] = entry["memoized"] or s["memoized"]
+                    # Summed over partitions: CPU time, not wall time
+                    entry["seconds"] = round(entry["seconds"] + s["seconds"], 6)
+                    entry["partitions_memoized"] += int(s["memoized"])
+            for entry in columns.values():
+                entry["rows"] = rows[side]
+    return merged
+
+def _collect(futures):
+    results = []
+    for f in futures:
+        result, recorded_metrics = f.result()
+        metrics.merge(recorded_metrics)
+        results.append(result)
+    return results
+
+def _compare_partitions(external, velaris, ext_keys, vel_keys, mapping, partitions, workers, detail):
+    """Map and compare the hash partitions on the pool; returns merged (positions, transform_stats)."""
+    ext_part, vel_part = partition_keys(ext_keys, vel_keys, partitions)
+    pool = _executor(workers)
+    rows = [(np.flatnonzero(ext_part == p), np.flatnonzero(vel_part == p)) for p in range(partitions)]
+    directory = tempfile.mkdtemp(prefix="partitions-", dir=config.UPLOAD_TMP_DIR)
+    try:
+        partials = _collect([
+            pool.submit(
+                recorded, _compare_partition, external.iloc[ext_rows], velaris.iloc[vel_rows], mapping,
+                ext_rows, vel_rows, detail, os.path.join(directory, str(p)),
+            )
+            for p, (ext_rows, vel_rows) in enumerate(rows)
+        ])
+        # Give int partitions of a column the float dtype a whole-frame run would infer;
+        # only their comparison runs again, on the mapped frames they kept
+        upcast = _upcast_columns([p[2] for p in partials])
+        redo = [p for p, (_, _, kinds, _) in enumerate(partials) if upcast and _needs_upcast(kinds, upcast)]
+        redone = _collect([
+            pool.submit(recorded, _recompare_partition, partials[p][3], mapping, *rows[p], detail, upcast)
+            for p in redo
+        ])
+        for p, partition_positions in zip(redo, redone):
+            partials[p] = (partition_positions, *partials[p][1:])
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    positions = {}
+    for bucket in ("matched", "missing_in_velaris", "missing_in_external"):
+        positions[bucket] = np.sort(np.concatenate([p[0][bucket] for p in partials]))
+    mismatched = np.concatenate([p[0]["mismatched"] for p in partials])
+    order = np.argsort(mismatched, kind="stable")
+    positions["mismatched"] = mismatched[order]
+    # A key lives in a single partition, so its counts are already global
+    positions["duplicate_keys"] = order_duplicates(np.concatenate([p[0]["duplicate_keys"] for p in partials]))
+    if detail:
+        differences = [d for p in partials for d in p[0]["differences"]]
+        positions["differences"] = [differences[i] for i in order]
+    else:
+        # Value-pair counters are exact, so partition histograms simply add up
+        positions["field_mismatches"] = {}
+        for p in partials:
+            for label, histogram in p[0]["field_mismatches"].items():
+                merged = positions["field_mismatches"].setdefault(label, {})
+                for pair, count in histogram.items():
+                    merged[pair] = merged.get(pair, 0) + count
+    positions["unparseable"] = {}
+    for p in partials:
+        merge_unparseable(positions["unparseable"], p[0]["unparseable"])
+    return positions, _merge_stats([p[1] for p in partials], {"external": len(external), "velaris": len(velaris)})
+
+def compare_partitioned(external_df, velaris_df, mapping, partitions=None, workers=None):
+    """
+    apply_mapping + compare_records split across worker processes.
+    Key transforms run here; both frames are then hash-partitioned on the
+    transformed key so equal keys always land in the same partition. Each
+    partition is mapped and compared on a pool of `workers` processes (default
+    partition_workers) and the positional results are merged back into input
+    row order, giving the same output as a single-process run. With a single
+    worker the frames are mapped and compared here instead.
+    Returns (result, transform_stats).
+    """
+    partitions = partitions or config.COMPARE_PARTITIONS
+    workers = workers or partition_workers(partitions)
+    mode = get_result_mode(mapping)
+    detail = mode != "summary"
+    external, velaris, key_stats = apply_mapping_with_stats(external_df, velaris_df, mapping, fields=False)
+    ext_keys, vel_keys = key_values(external, velaris, mapping)
+    if workers == 1:
+        # Shipping partitions to one other process would only add copies
+        mapped_external, mapped_velaris, stats = apply_mapping_with_stats(external, velaris, mapping, keys=False)
+        positions = compare_positions(mapped_external, mapped_velaris, mapping, detail=detail, keys=(ext_keys, vel_keys))
+    else:
+        positions, stats = _compare_partitions(external, velaris, ext_keys, vel_keys, mapping, partitions, workers, detail)
+
+    for side in ("external", "velaris"):
+        stats[side] = combine_side_stats(key_stats[side], stats[side])
+    add_probable_matches(positions, ext_keys, vel_keys, mapping)
+    compare_only_mapped = mapping.get("compare_only_mapped", True)
+    if mode == "summary":
+        return build_summary(positions, compare_only_mapped), stats
+    result = build_results(ext_keys, vel_keys, positions, compare_only_mapped)
+    if mode == "page":
+        result["result_mode"] = "page"
+    return result, stats
+
+def _finished_records(future, tally):
+    """Wait for one _partition_records future, fold its tally into tally and return its records."""
+    (records, partition_tally), = _collect([future])
+    tally.merge(partition_tally)
+    return records
+
+def stream_partitioned(external_df, velaris_df, mapping, partitions=None, workers=None):
+    """
+    compare_partitioned as a stream of comparison_engine.iter_records lines.
+    Partitions are first mapped on the pool and kept on disk, which settles the
+    dtypes a whole-frame run would infer (see _upcast_columns); they are then
+    compared with at most `workers` in flight and each one's records are
+    yielded, in partition order, as soon as it finishes. Memory therefore
+    holds the inputs and a few partitions' records however many rows differ;
+    lines are grouped by partition rather than in input row order. The
+    summary line additionally carries transform_stats.
+    """
+    partitions = partitions or config.COMPARE_PARTITIONS
+    workers = workers or partition_workers(partitions)
+    external, velaris, key_stats = apply_mapping_with_stats(external_df, velaris_df, mapping, fields=False)
+    if workers == 1:
+        # Shipping partitions to one other process would only add copies
+        mapped_external, mapped_velaris, stats = apply_mapping_with_stats(external, velaris, mapping, keys=False)
+        for record in iter_records(mapped_external, mapped_velaris, mapping):
+            if record["type"] == "summary":
+                record["transform_stats"] = {side: combine_side_stats(key_stats[side], stats[side]) for side in stats}
+            yield record
+        return
+
+    ext_part, vel_part = partition_keys(*key_values(external, velaris, mapping), partitions)
+    pool = _executor(workers)
+    rows = [(np.flatnonzero(ext_part == p), np.flatnonzero(vel_part == p)) for p in range(partitions)]
+    directory = tempfile.mkdtemp(prefix="partitions-", dir=config.UPLOAD_TMP_DIR)
+    try:
+        paths = [os.path.join(directory, str(p)) for p in range(partitions)]
+        mapped = _collect([
+            pool.submit(recorded, _map_partition, external.iloc[ext_rows], velaris.iloc[vel_rows], mapping, path)
+            for path, (ext_rows, vel_rows) in zip(paths, rows)
+        ])
+        upcast = _upcast_columns([kinds for _, kinds in mapped])
+        stats = _merge_stats([stats for stats, _ in mapped], {"external": len(external), "velaris": len(velaris)})
+        del mapped
+
+        tally = RecordTally(mapping)
+        pending = deque()
+        for p in range(partitions):
+            pending.append(pool.submit(recorded, _partition_records, paths[p], mapping, *rows[p], upcast))
+            if len(pending) == workers:
+                yield from _finished_records(pending.popleft(), tally)
+        while pending:
+            yield from _finished_records(pending.popleft(), tally)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    for side in ("external", "velaris"):
+        stats[side] = combine_side_stats(key_stats[side], stats[side])
+    for record in tally.finish(mapping):
+        if record["type"] == "summary":
+            record["transform_stats"] = stats
+        yield record
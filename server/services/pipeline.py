@@ -0,0 +1,302 @@
+from services.csv_loader import read_csvs, required_columns
+from services.filter_engine import apply_filters
+from services.mapping_engine import apply_mapping_with_stats, map_side_with_stats
+from services.comparison_engine import compare_records, iter_records, KeyIndex, RESULT_BUCKETS
+from services.partitioned_compare import compare_partitioned, stream_partitioned
+from services.incremental import compare_incremental
+from services.out_of_core import compare_out_of_core, stream_out_of_core
+from services.dataset_cache import DatasetRef, dataset_cache
+from services.result_cache import filter_stage_key, mapping_stage_key, side_stage_keys, stage_cache
+from services.metrics import Timings, metrics
+from config import config
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import time
+import numpy as np
+
+def load_frames(sources):
+    """
+    Load (source, columns) pairs in order: DatasetRef sources come from the dataset
+    cache, the rest (bytes or paths) are parsed in parallel by read_csvs.
+    """
+    frames = [None] * len(sources)
+    csvs = []
+    for i, (source, columns) in enumerate(sources):
+        if isinstance(source, DatasetRef):
+            frames[i] = dataset_cache.load(source.dataset_id, columns)
+        else:
+            csvs.append(i)
+    for i, df in zip(csvs, read_csvs([sources[i] for i in csvs])):
+        frames[i] = df
+    return frames
+
+def uses_datasets(*sources):
+    return any(isinstance(s, DatasetRef) for s in sources)
+
+def stage_keys(mapping, content_hashes):
+    """(filter stage key, mapping stage key) for inputs with known content hashes, else (None, None)."""
+    if not content_hashes:
+        return None, None
+    columns = {side: required_columns(mapping, side) for side in ("external", "velaris")}
+    filter_key = filter_stage_key(content_hashes, mapping, columns)
+    return filter_key, mapping_stage_key(filter_key, mapping)
+
+def _sides(external, velaris):
+    return {"external": len(external), "velaris": len(velaris)}
+
+def load_filtered(external_source, velaris_source, mapping, stage_key=None, timings=None):
+    """
+    Read both CSVs and apply the mapping's filters. Returns (external, velaris, filter_stats).
+    With a stage_key the filtered frames are reused from, and kept in, the stage cache.
+    With timings, the read_csv and apply_filters stages are recorded in it.
+    """
+    timings = timings or Timings()
+    if stage_key is not None:
+        cached = stage_cache.get(stage_key)
+        if cached is not None:
+            with timings.stage("apply_filters") as stage:
+                stage["cached"] = True
+                stage["rows_out"] = _sides(cached[0], cached[1])
+            return cached
+
+    # Parse both files in parallel, only materializing referenced columns
+    with timings.stage("read_csv") as stage:
+        external_data, velaris_data = load_frames([
+            (external_source, required_columns(mapping, "external")),
+            (velaris_source, required_columns(mapping, "velaris")),
+        ])
+        stage["rows_out"] = _sides(external_data, velaris_data)
+
+    # Apply filters if provided
+    with timings.stage("apply_filters", _sides(external_data, velaris_data)) as stage:
+        filter_cfg = mapping.get("filters", {})
+        external_data, external_filter_stats = apply_filters(external_data, filter_cfg.get("external"))
+        velaris_data, velaris_filter_stats = apply_filters(velaris_data, filter_cfg.get("velaris"))
+        stage["rows_out"] = _sides(external_data, velaris_data)
+    filtered = (external_data, velaris_data, {"external": external_filter_stats, "velaris": velaris_filter_stats})
+    if stage_key is not None:
+        stage_cache.put(stage_key, filtered)
+    return filtered
+
+def map_filtered(external_data, velaris_data, mapping, stage_key=None, timings=None):
+    """
+    apply_mapping_with_stats, reusing mapped frames from the stage cache when a stage_key
+    is given. With timings, the apply_mapping stage is recorded in it (per-column
+    transform time is in transform_stats).
+    """
+    timings = timings or Timings()
+    with timings.stage("apply_mapping", _sides(external_data, velaris_data)) as stage:
+        mapped = stage_cache.get(stage_key) if stage_key is not None else None
+        if mapped is not None:
+            stage["cached"] = True
+        else:
+            mapped = apply_mapping_with_stats(external_data, velaris_data, mapping)
+            if stage_key is not None:
+                stage_cache.put(stage_key, mapped)
+        stage["rows_out"] = _sides(mapped[0], mapped[1])
+    return mapped
+
+def _bucket_counts(result):
+    if "counts" in result:
+        return dict(result["counts"])
+    return {bucket: len(result[bucket]) for bucket in RESULT_BUCKETS}
+
+def use_out_of_core(external_source, velaris_source, mapping):
+    """Out-of-core mode needs both inputs as files; it is requested per mapping or chosen by size."""
+    if mapping.get("incremental") or not all(isinstance(s, (str, os.PathLike)) for s in (external_source, velaris_source)):
+        return False
+    if mapping.get("out_of_core"):
+        return True
+    threshold = config.OUT_OF_CORE_MIN_MB * 1024 * 1024
+    return threshold > 0 and os.path.getsize(external_source) + os.path.getsize(velaris_source) >= threshold
+
+def run_comparison(external_source, velaris_source, mapping, content_hashes=None):
+    """
+    Full read -> filter -> map -> compare run for one pair of CSVs.
+    Sources are bytes, file paths or DatasetRefs; mapping is the parsed mapping_config.
+    content_hashes (the inputs' SHA-256s) enable the per-stage cache, so a run that
+    only changes comparison rules reuses the filtered and mapped frames.
+    Module-level so it can be shipped to worker processes.
+    """
+    timings = Timings()
+    if use_out_of_core(external_source, velaris_source, mapping):
+        # Never holds both frames: chunks are spilled to key-hash partitions on disk,
+        # so reading, filtering, mapping and comparing form a single stage
+        with timings.stage("compare_out_of_core") as stage:
+            result, filter_stats, transform_stats = compare_out_of_core(external_source, velaris_source, mapping)
+            stage["rows_in"] = {side: filter_stats[side]["original"] for side in filter_stats}
+            stage["rows_out"] = _bucket_counts(result)
+        metrics.inc("rows_compared_total", sum(stats["kept"] for stats in filter_stats.values()))
+        result["filter_stats"] = filter_stats
+        result["transform_stats"] = transform_stats
+        result["timings"] = timings.report()
+        return result
+
+    filter_key, mapping_key = stage_keys(mapping, content_hashes)
+    external_data, velaris_data, filter_stats = load_filtered(external_source, velaris_source, mapping, filter_key, timings)
+
+    rows = len(external_data) + len(velaris_data)
+    metrics.inc("rows_compared_total", rows)
+    if mapping.get("incremental"):
+        # Re-evaluate only keys whose rows changed since the named snapshot
+        with timings.stage("compare_incremental", _sides(external_data, velaris_data)) as stage:
+            result, transform_stats = compare_incremental(external_data, velaris_data, mapping)
+    elif config.COMPARE_PARTITIONS > 1 and rows >= config.PARTITION_MIN_ROWS:
+        # Large inputs: map and compare hash partitions in parallel worker processes
+        with timings.stage("compare_partitioned", _sides(external_data, velaris_data)) as stage:
+            result, transform_stats = compare_partitioned(external_data, velaris_data, mapping)
+    else:
+        mapped_external, mapped_velaris, transform_stats = map_filtered(external_data, velaris_data, mapping, mapping_key, timings)
+        with timings.stage("compare_records", _sides(mapped_external, mapped_velaris)) as stage:
+            result = compare_records(mapped_external, mapped_velaris, mapping)
+    stage["rows_out"] = _bucket_counts(result)
+    result["filter_stats"] = filter_stats
+    result["transform_stats"] = transform_stats
+    if uses_datasets(external_source, velaris_source):
+        result["dataset_cache"] = dataset_cache.stats()
+    if content_hashes:
+        result["stage_cache"] = stage_cache.stats()
+    result["timings"] = timings.report()
+    return result
+
+# Targets of a batch job are compared on threads, so they share the prepared external frames
+_batch_pool = ThreadPoolExecutor(max_workers=config.BATCH_WORKERS, thread_name_prefix="batch-target")
+
+def _union_columns(mappings, side):
+    """Columns of one side that any of the mappings references (None: all of them)."""
+    columns = set()
+    for mapping in mappings:
+        needed = required_columns(mapping, side)
+        if needed is None:
+            return None
+        columns |= needed
+    return columns
+
+def _compare_target(variant, velaris_source, mapping):
+    """Read, filter and map one velaris source and compare it with a prepared external variant."""
+    external, filter_stats, transform_stats, key_index = variant
+    timings = Timings()
+    with timings.stage("read_csv") as stage:
+        velaris = load_frames([(velaris_source, required_columns(mapping, "velaris"))])[0]
+        stage["rows_out"] = {"velaris": len(velaris)}
+    with timings.stage("apply_filters", {"velaris": len(velaris)}) as stage:
+        velaris, velaris_filter_stats = apply_filters(velaris, mapping.get("filters", {}).get("velaris"))
+        stage["rows_out"] = {"velaris": len(velaris)}
+    with timings.stage("apply_mapping", {"velaris": len(velaris)}) as stage:
+        velaris, velaris_transform_stats = map_side_with_stats(velaris, mapping, "velaris")
+        stage["rows_out"] = {"velaris": len(velaris)}
+    metrics.inc("rows_compared_total", len(external) + len(velaris))
+    with timings.stage("compare_records", _sides(external, velaris)) as stage:
+        result = compare_records(external, velaris, mapping, ext_index=key_index)
+        stage["rows_out"] = _bucket_counts(result)
+    result["filter_stats"] = {"external": filter_stats, "velaris": velaris_filter_stats}
+    result["transform_stats"] = {"external": transform_stats, "velaris": velaris_transform_stats}
+    result["timings"] = timings.report()
+    return result
+
+def run_batch(external_source, targets):
+    """
+    Compare one external CSV with several (velaris source, mapping) targets in one job.
+    The external side is parsed once (every column some target needs), then
+    filtered and transformed once per distinct external configuration (see
+    side_stage_keys), each variant keeping one KeyIndex for all its targets.
+    Targets are read, mapped and compared concurrently on BATCH_WORKERS threads.
+    Returns {"external": {"rows", "variants"}, "targets": [...], "timings"}: one
+    result (with its own timings) or {"error"} per target, in order.
+    Module-level so it can be shipped to worker processes.
+    """
+    timings = Timings()
+    mappings = [mapping for _, mapping in targets]
+    with timings.stage("read_csv") as stage:
+        external = load_frames([(external_source, _union_columns(mappings, "external"))])[0]
+        stage["rows_out"] = {"external": len(external)}
+
+    filtered = {}
+    variants = {}
+    variant_keys = []
+    for mapping in mappings:
+        filter_key, mapping_key = side_stage_keys(mapping, "external")
+        if filter_key not in filtered:
+            with timings.stage("apply_filters", {"external": len(external)}) as stage:
+                filtered[filter_key] = apply_filters(external, mapping.get("filters", {}).get("external"))
+                stage["rows_out"] = {"external": len(filtered[filter_key][0])}
+        if mapping_key not in variants:
+            external_data, filter_stats = filtered[filter_key]
+            with timings.stage("apply_mapping", {"external": len(external_data)}) as stage:
+                mapped, transform_stats = map_side_with_stats(external_data, mapping, "external")
+                stage["rows_out"] = {"external": len(mapped)}
+            variants[mapping_key] = (mapped, filter_stats, transform_stats, KeyIndex())
+        variant_keys.append(mapping_key)
+
+    futures = [
+        _batch_pool.submit(_compare_target, variants[key], velaris_source, mapping)
+        for key, (velaris_source, mapping) in zip(variant_keys, targets)
+    ]
+    results = []
+    for f in futures:
+        try:
+            results.append(f.result())
+        except Exception as e:
+            # One bad target (e.g. a missing column) does not fail the others
+            results.append({"error": f"{type(e).__name__}: {e}"})
+    return {
+        "external": {"rows": len(external), "variants": len(variants)},
+        "targets": results,
+        "timings": timings.report(),
+    }
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+def stream_comparison(external_source, velaris_source, mapping, output_path, content_hashes=None):
+    """
+    Like run_comparison, but writes the result to output_path as NDJSON
+    (see comparison_engine.iter_records) while it is produced, so a reader can
+    follow the file. The summary line also carries filter and transform stats
+    and the timings (the comparison stage includes writing the output).
+    Out-of-core and partitioned runs are chosen as in run_comparison and write
+    each partition's records as soon as it is compared, so their lines are
+    grouped by partition; no run holds the whole result.
+    Returns that summary.
+    """
+    timings = Timings()
+    filter_stats = transform_stats = rows_in = None
+    if use_out_of_core(external_source, velaris_source, mapping):
+        stage = "compare_out_of_core"
+        records = stream_out_of_core(external_source, velaris_source, mapping)
+    else:
+        filter_key, mapping_key = stage_keys(mapping, content_hashes)
+        external_data, velaris_data, filter_stats = load_filtered(external_source, velaris_source, mapping, filter_key, timings)
+        rows = len(external_data) + len(velaris_data)
+        metrics.inc("rows_compared_total", rows)
+        if config.COMPARE_PARTITIONS > 1 and rows >= config.PARTITION_MIN_ROWS:
+            stage, rows_in = "compare_partitioned", _sides(external_data, velaris_data)
+            records = stream_partitioned(external_data, velaris_data, mapping)
+        else:
+            mapped_external, mapped_velaris, transform_stats = map_filtered(external_data, velaris_data, mapping, mapping_key, timings)
+            stage, rows_in = "compare_records", _sides(mapped_external, mapped_velaris)
+            records = iter_records(mapped_external, mapped_velaris, mapping)
+    start = time.perf_counter()
+    with open(output_path, "w") as out:
+        for record in records:
+            if record["type"] == "summary":
+                # Out-of-core and partitioned streams report their stats on the summary line
+                filter_stats = record.pop("filter_stats", filter_stats)
+                transform_stats = record.pop("transform_stats", transform_stats)
+                if rows_in is None:
+                    rows_in = {side: filter_stats[side]["original"] for side in filter_stats}
+                    metrics.inc("rows_compared_total", sum(stats["kept"] for stats in filter_stats.values()))
+                # The summary is the last line, so this covers the whole comparison but not writing it
+                timings.add(stage, time.perf_counter() - start, rows_in, dict(record["counts"]))
+                record["timings"] = timings.report()
+                record["filter_stats"] = filter_stats
+                record["transform_stats"] = transform_stats
+                if uses_datasets(external_source, velaris_source):
+                    record["dataset_cache"] = dataset_cache.stats()
+                if content_hashes:
+                    record["stage_cache"] = stage_cache.stats()
+            out.write(json.dumps(record, default=_json_default) + "\n")
+    return record
@@ -0,0 +1,215 @@
+import copy
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from config import config
+
+class TTLCache:
+    """
+    LRU cache whose entries expire after `ttl` seconds and whose total size,
+    as measured by sizeof(value), stays within `max_bytes`. Entries may carry
+    tags (e.g. input content hashes) so related entries can be invalidated together.
+    """
+
+    def __init__(self, max_bytes: int, ttl: int, sizeof):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self._entries = OrderedDict()  # key -> (value, size, expires_at, tags)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _drop(self, key):
+        _, size, _, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] < time.time():
+                self._drop(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, tags=()):
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, size, time.time() + self.ttl, frozenset(tags))
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def discard(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+
+    def values(self):
+        """Unexpired values, least recently used first."""
+        with self._lock:
+            now = time.time()
+            return [entry[0] for entry in self._entries.values() if entry[2] >= now]
+
+    def invalidate(self, tag=None):
+        """Drop every entry (or only those tagged with `tag`); returns how many were dropped."""
+        with self._lock:
+            keys = [k for k, entry in self._entries.items() if tag is None or tag in entry[3]]
+            for key in keys:
+                self._drop(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+            }
+
+# Canonical mapping_config
+
+def _canonical_group(group):
+    # apply_filters treats any falsy group as "no filters"
+    if not group:
+        return None
+    if not isinstance(group, dict):
+        return group
+    return {**group, "logic": group.get("logic", "AND"), "conditions": group.get("conditions", [])}
+
+def _canonical_key(value):
+    # A one-column key list keys (and transforms) exactly like the bare value
+    if isinstance(value, (list, tuple)):
+        return value[0] if len(value) == 1 else list(value)
+    return value
+
+def canonical_mapping(mapping):
+    """
+    mapping_config with defaults filled in, so configs that compare identically
+    produce the same digest: missing transforms/custom functions, filter groups
+    compare_only_mapped and fuzzy_keys take their defaults. Mapping order is kept (it decides
+    the order of differences). Paging parameters are dropped: they only window
+    the result.
+    """
+    canonical = copy.deepcopy(mapping)
+    canonical.pop("page", None)
+    key_fields = canonical.get("key_fields") or {}
+    canonical["key_fields"] = {
+        **key_fields,
+        "external_field": _canonical_key(key_fields.get("external_field")),
+        "velaris_field": _canonical_key(key_fields.get("velaris_field")),
+        "external_custom": _canonical_key(key_fields.get("external_custom") or ""),
+        "velaris_custom": _canonical_key(key_fields.get("velaris_custom") or ""),
+    }
+    canonical["mappings"] = [
+        {
+            **m,
+            "external_transforms": m.get("external_transforms") or [],
+            "velaris_transforms": m.get("velaris_transforms") or [],
+            "external_custom": m.get("external_custom") or "",
+            "velaris_custom": m.get("velaris_custom") or "",
+            "rule_options": m.get("rule_options") or {},
+        }
+        for m in canonical.get("mappings", [])
+    ]
+    filters = canonical.get("filters") or {}
+    canonical["filters"] = {side: _canonical_group(filters.get(side)) for side in ("external", "velaris")}
+    canonical["compare_only_mapped"] = bool(canonical.get("compare_only_mapped", True))
+    canonical["result_mode"] = canonical.get("result_mode", "full")
+    canonical["fuzzy_keys"] = canonical.get("fuzzy_keys") or False
+    return canonical
+
+def digest(obj):
+    """SHA-256 of obj serialized as canonical JSON (sorted keys, no whitespace)."""
+    payload = json.dumps(obj, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def result_key(content_hashes, mapping):
+    """Key of a whole comparison result: both inputs' content hashes plus the canonical config."""
+    return digest({"inputs": list(content_hashes), "mapping": canonical_mapping(mapping)})
+
+def filter_stage_key(content_hashes, mapping, columns):
+    """Key of the filtered frames: inputs, the columns parsed from each, and the filters."""
+    canonical = canonical_mapping(mapping)
+    return digest({
+        "inputs": list(content_hashes),
+        "columns": {side: sorted(c) if c is not None else None for side, c in columns.items()},
+        "filters": canonical["filters"],
+    })
+
+def mapping_stage_key(filter_key, mapping):
+    """
+    Key of the mapped frames: the filter stage plus everything but rules (and
+    their options), fuzzy key matching and result shape.
+    """
+    canonical = canonical_mapping(mapping)
+    for m in canonical["mappings"]:
+        m.pop("rule", None)
+        m.pop("rule_options")
+    canonical.pop("result_mode")
+    canonical.pop("fuzzy_keys")
+    return digest({"filtered": filter_key, "mapping": canonical})
+
+def side_stage_keys(mapping, side):
+    """
+    (filter key, mapping key) of one side's stages, independent of the inputs:
+    configs with equal keys filter and transform that side identically.
+    """
+    canonical = canonical_mapping(mapping)
+    key_fields = canonical["key_fields"]
+    filter_key = digest(canonical["filters"][side])
+    mapping_key = digest({
+        "filtered": filter_key,
+        "key": [key_fields[f"{side}_field"], key_fields[f"{side}_custom"]],
+        "fields": [[m.get(f"{side}_field"), m[f"{side}_transforms"], m[f"{side}_custom"]] for m in canonical["mappings"]],
+    })
+    return filter_key, mapping_key
+
+def json_size(value, sample=64):
+    """
+    Approximate JSON size of a result. Lists longer than `sample` are measured on
+    evenly spaced items and scaled, so sizing a large result does not encode it
+    a second time.
+    """
+    if isinstance(value, dict):
+        return 2 + sum(len(str(k)) + 4 + json_size(v, sample) for k, v in value.items())
+    if isinstance(value, list) and len(value) > sample:
+        step = len(value) / sample
+        items = [value[int(i * step)] for i in range(sample)]
+        return int(len(json.dumps(items, default=str)) * len(value) / sample)
+    return len(json.dumps(value, default=str))
+
+def _frames_size(value):
+    return sum(int(v.memory_usage(index=True, deep=True).sum()) for v in value if hasattr(v, "memory_usage"))
+
+# Whole results, kept in the API process
+result_cache = TTLCache(config.RESULT_CACHE_MB * 1024 * 1024, config.RESULT_CACHE_TTL_SECONDS, json_size)
+
+# Filtered / mapped frames, kept in each job worker process: workers do not share
+# it, so a stage is only reused when the same worker runs the next comparison
+stage_cache = TTLCache(config.STAGE_CACHE_MB * 1024 * 1024, config.RESULT_CACHE_TTL_SECONDS, _frames_size)
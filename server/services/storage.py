@@ -0,0 +1,17 @@
+import os
+import stat
+
+def private_directory(path):
+    """
+    Create path (mode 0700) if needed and return it. The default stores live
+    under the shared system temp dir, so a directory that is not ours (or a
+    symlink someone else planted) is refused with PermissionError, and one of
+    ours that others could write to is tightened to 0700.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+        raise PermissionError(f"Refusing to use '{path}': it is not a directory owned by this user")
+    if stat.S_IMODE(info.st_mode) & 0o077:
+        os.chmod(path, 0o700)
+    return path
@@ -0,0 +1,113 @@
+import os
+import tempfile
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from config import config
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Room for the form fields (mapping_config, ids) and multipart headers of a request
+FORM_OVERHEAD_BYTES = 1024 * 1024
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload exceeds Config.MAX_CSV_SIZE_MB."""
+
+def request_body_limit(path):
+    """Largest request body a route accepts: MAX_CSV_SIZE_MB per CSV it takes, plus the form fields."""
+    if path.rstrip("/") == "/compare/batch":
+        files = config.BATCH_MAX_TARGETS + 1
+    elif path.rstrip("/") == "/datasets":
+        files = 1
+    else:
+        files = 2
+    return files * config.MAX_CSV_SIZE_MB * 1024 * 1024 + FORM_OVERHEAD_BYTES
+
+class UploadLimitMiddleware:
+    """
+    Reject oversized request bodies before the multipart parser receives them:
+    413 right away when Content-Length is over request_body_limit, otherwise as
+    soon as the body streamed so far goes over it. spool_upload then checks each
+    file against MAX_CSV_SIZE_MB.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH"):
+            await self.app(scope, receive, send)
+            return
+        limit = request_body_limit(scope["path"])
+        detail = f"Request body exceeds the {limit // (1024 * 1024)} MB limit of {scope['path']}"
+        length = dict(scope["headers"]).get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > limit:
+            await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+            return
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # An HTTPException from the body stream passes through FastAPI's form parsing as is
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+async def spool_upload(upload, max_bytes, chunk_size=UPLOAD_CHUNK_SIZE, digest=None):
+    """
+    Copy an UploadFile to a named temp file in fixed-size chunks and return its path.
+    Starlette has already received (and spooled) the upload by the time a route
+    runs, so this enforces the per-file limit on a body UploadLimitMiddleware let
+    through; it does not stop the bytes from arriving. If given, digest (a
+    hashlib object) is updated with every chunk.
+    """
+    if upload.size is not None and upload.size > max_bytes:
+        raise UploadTooLargeError(f"'{upload.filename}' exceeds the {config.MAX_CSV_SIZE_MB} MB upload limit")
+
+    fd, path = tempfile.mkstemp(prefix="upload-", suffix=".csv", dir=config.UPLOAD_TMP_DIR)
+    try:
+        written = 0
+        with os.fdopen(fd, "wb") as out:
+            while chunk := await upload.read(chunk_size):
+                written += len(chunk)
+                if written > max_bytes:
+                    raise UploadTooLargeError(f"'{upload.filename}' exceeds the {config.MAX_CSV_SIZE_MB} MB upload limit")
+                out.write(chunk)
+                if digest is not None:
+                    digest.update(chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path
+
+async def spool_uploads(uploads, max_bytes, digests=None):
+    """
+    Spool several uploads to temp files; on failure, files spooled so far are removed.
+    digests, if given, holds one hashlib object per upload.
+    """
+    paths = []
+    try:
+        for i, upload in enumerate(uploads):
+            paths.append(await spool_upload(upload, max_bytes, digest=digests[i] if digests else None))
+    except BaseException:
+        remove_files(paths)
+        raise
+    return paths
+
+def spool_file(prefix, suffix):
+    """Create an empty temp file next to the spooled uploads and return its path."""
+    fd, path = tempfile.mkstemp(prefix=prefix, suffix=suffix, dir=config.UPLOAD_TMP_DIR)
+    os.close(fd)
+    return path
+
+def remove_files(paths):
+    for path in paths:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
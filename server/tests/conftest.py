@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# Modules import each other as top-level packages (services, routes, config), as when run from server/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Stores shared by the API and its job workers (which read config from the
+# environment when they start) go to throwaway directories
+for name in ("DATASET_DIR", "SNAPSHOT_DIR"):
+    os.environ.setdefault(name, tempfile.mkdtemp(prefix=f"test-{name.lower()}-"))
@@ -0,0 +1,492 @@
+"""
+Row-at-a-time implementations of compare_records, apply_filters and apply_mapping
+as they were before the engines in services/ were vectorized. Parity tests check
+the engines against them; keep this module unchanged.
+"""
+import json
+import logging
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Literal, Optional, Tuple, Union
+
+import pandas as pd
+from pydantic import BaseModel, Field
+
+# services/comparison_engine.py
+
+# Dynamic comparison rules registry - add new rules here
+COMPARISON_REGISTRY = {
+    "equals": lambda a, b: a == b,
+    "case_insensitive_equals": lambda a, b: str(a).lower() == str(b).lower(),
+    "contains": lambda a, b: str(a) in str(b),
+    "starts_with": lambda a, b: str(b).startswith(str(a)),
+    "ends_with": lambda a, b: str(b).endswith(str(a)),
+    "not_equals": lambda a, b: a != b,
+    "greater_than": lambda a, b: float(a) > float(b) if str(a).replace('.','',1).isdigit() and str(b).replace('.','',1).isdigit() else False,
+    "less_than": lambda a, b: float(a) < float(b) if str(a).replace('.','',1).isdigit() and str(b).replace('.','',1).isdigit() else False,
+}
+
+def compare_values(a, b, rule):
+    """
+    Compare values dynamically from the registry.
+    New comparison rules can be added to COMPARISON_REGISTRY without code changes.
+    """
+    if rule in COMPARISON_REGISTRY:
+        try:
+            return COMPARISON_REGISTRY[rule](a, b)
+        except Exception as e:
+            print(f"Warning: Error in comparison rule '{rule}': {e}")
+            return False
+    else:
+        print(f"Warning: Unknown rule '{rule}', defaulting to 'equals'")
+        return a == b
+
+def compare_records(external, velaris, config):
+    key_e = config["key_fields"]["external_field"]
+    key_v = config["key_fields"]["velaris_field"]
+    compare_only_mapped = config.get("compare_only_mapped", True)
+
+    # Validate key fields exist
+    if key_e not in external.columns:
+        raise ValueError(f"Key field '{key_e}' not found in external CSV")
+    if key_v not in velaris.columns:
+        raise ValueError(f"Key field '{key_v}' not found in velaris CSV")
+
+    external = external.set_index(key_e)
+    velaris = velaris.set_index(key_v)
+
+    results = {
+        "matched": [],
+        "mismatched": [],
+        "missing_in_velaris": [],
+        "missing_in_external": [],
+        "compare_mode": "mapped_fields_only" if compare_only_mapped else "all_fields"
+    }
+
+    for key in external.index:
+        if key not in velaris.index:
+            results["missing_in_velaris"].append(str(key))
+            continue
+
+        diff = {}
+        has_field_mappings = False
+        
+        if compare_only_mapped:
+            # Compare only the mapped fields
+            for m in config["mappings"]:
+                e = m["external_field"]
+                v = m["velaris_field"]
+                rule = m["rule"]
+
+                # Skip if the field is the key field (it's now the index, not a column)
+                if e == key_e or v == key_v:
+                    continue
+
+                # Check if fields exist in the dataframe
+                if e not in external.columns:
+                    raise ValueError(f"Field '{e}' not found in external CSV")
+                if v not in velaris.columns:
+                    raise ValueError(f"Field '{v}' not found in velaris CSV")
+
+                has_field_mappings = True
+                a = external.loc[key][e]
+                b = velaris.loc[key][v]
+
+                if not compare_values(a, b, rule):
+                    diff[e] = {"external": str(a), "velaris": str(b)}
+        else:
+            # Compare ALL fields (original behavior - match columns by name)
+            common_columns = set(external.columns) & set(velaris.columns)
+            for col in common_columns:
+                has_field_mappings = True
+                a = external.loc[key][col]
+                b = velaris.loc[key][col]
+                
+                # Use equals by default for all-field comparison
+                if not compare_values(a, b, "equals"):
+                    diff[col] = {"external": str(a), "velaris": str(b)}
+
+        # If no field mappings were checked, consider it a match (key-only matching)
+        if not has_field_mappings:
+            results["matched"].append(str(key))
+        elif diff:
+            results["mismatched"].append({"id": str(key), "differences": diff})
+        else:
+            results["matched"].append(str(key))
+
+    for key in velaris.index:
+        if key not in external.index:
+            results["missing_in_external"].append(str(key))
+
+    return results
+
+# services/filter_engine.py
+
+logger = logging.getLogger(__name__)
+
+# Supported operators and data types
+Operator = Literal['equals', 'not_equals', 'greater_than', 'less_than', 'contains', 'not_null', 'regex']
+DataType = Literal['string', 'number', 'date', 'boolean']
+Logic = Literal['AND', 'OR']
+
+class FilterCondition(BaseModel):
+    field: str
+    operator: Operator
+    data_type: DataType
+    value: Optional[Union[str, int, float, bool]] = None
+
+class FilterGroup(BaseModel):
+    logic: Logic = 'AND'
+    conditions: List[FilterCondition] = Field(default_factory=list)
+
+# Coercion helper
+
+def coerce_value(value: Any, target_type: DataType) -> Any:
+    if value is None:
+        return None
+    try:
+        if target_type == 'string':
+            return str(value)
+        elif target_type == 'number':
+            if isinstance(value, (int, float)):
+                return value
+            return float(value)
+        elif target_type == 'boolean':
+            if isinstance(value, bool):
+                return value
+            return str(value).lower() == 'true'
+        elif target_type == 'date':
+            if isinstance(value, datetime):
+                return value
+            return datetime.fromisoformat(str(value))
+    except (ValueError, TypeError):
+        logger.warning(f"Failed to coerce value '{value}' to type '{target_type}'")
+        return None
+    return value
+
+
+def evaluate_condition(record: Dict[str, Any], condition: FilterCondition) -> bool:
+    field_value = record.get(condition.field)
+    if condition.operator == 'not_null':
+        return field_value is not None
+
+    # Missing field -> fail condition (could choose True for not_equals but keep simple)
+    if condition.field not in record:
+        return False
+
+    coerced_record_value = coerce_value(field_value, condition.data_type)
+    coerced_condition_value = coerce_value(condition.value, condition.data_type)
+
+    if coerced_record_value is None or (coerced_condition_value is None and condition.operator not in ['not_null']):
+        if condition.operator == 'not_equals':
+            return True
+        return False
+
+    if condition.data_type == 'string':
+        if isinstance(coerced_record_value, str):
+            coerced_record_value = coerced_record_value.lower()
+        if isinstance(coerced_condition_value, str):
+            coerced_condition_value = coerced_condition_value.lower()
+
+    try:
+        op = condition.operator
+        if op == 'equals':
+            return coerced_record_value == coerced_condition_value
+        if op == 'not_equals':
+            return coerced_record_value != coerced_condition_value
+        if op == 'greater_than':
+            return coerced_record_value > coerced_condition_value
+        if op == 'less_than':
+            return coerced_record_value < coerced_condition_value
+        if op == 'contains':
+            if condition.data_type != 'string':
+                return False
+            return str(coerced_condition_value) in str(coerced_record_value)
+        if op == 'regex':
+            if condition.data_type != 'string':
+                return False
+            return bool(re.match(str(coerced_condition_value), str(coerced_record_value)))
+    except TypeError:
+        logger.warning(f"Type error comparing {coerced_record_value} {condition.operator} {coerced_condition_value}")
+        return False
+    return False
+
+
+def evaluate_group(record: Dict[str, Any], group: FilterGroup) -> bool:
+    if not group.conditions:
+        return True
+    results = [evaluate_condition(record, c) for c in group.conditions]
+    if group.logic == 'AND':
+        return all(results)
+    return any(results)
+
+
+def apply_filters(df: pd.DataFrame, group_data: Optional[Dict[str, Any]]) -> Tuple[pd.DataFrame, Dict[str, int]]:
+    """Apply filters to DataFrame and return filtered DataFrame plus stats."""
+    if not group_data:
+        return df, {"original": len(df), "kept": len(df), "dropped": 0}
+    try:
+        group = FilterGroup(**group_data)
+    except Exception as e:
+        logger.warning(f"Invalid filter group payload: {e}")
+        return df, {"original": len(df), "kept": len(df), "dropped": 0}
+
+    # Sanitize conditions: drop incomplete ones (empty field or missing value when required)
+    sanitized: List[FilterCondition] = []
+    for c in group.conditions:
+        if not c.field:
+            continue
+        if c.operator != 'not_null' and (c.value is None or (isinstance(c.value, str) and c.value.strip() == '')):
+            continue
+        sanitized.append(c)
+    dropped_incomplete = len(group.conditions) - len(sanitized)
+    group.conditions = sanitized
+
+    if dropped_incomplete:
+        logger.info(f"Sanitized filter group: removed {dropped_incomplete} incomplete conditions")
+
+    mask = []
+    for _, row in df.iterrows():
+        record = row.to_dict()
+        mask.append(evaluate_group(record, group))
+    filtered = df[mask]
+    stats = {"original": len(df), "kept": len(filtered), "dropped": len(df) - len(filtered), "incomplete_conditions_removed": dropped_incomplete}
+    return filtered, stats
+
+# services/mapping_engine.py
+
+# JavaScript-to-Python translation for custom functions
+def execute_custom_function(value, js_code):
+    """
+    Execute user-provided JavaScript-like transformation code safely.
+    Translates common JS patterns to Python.
+    """
+    if not js_code or not js_code.strip():
+        return value
+    
+    try:
+        # Clean up the code
+        code = js_code.strip()
+        
+        # Remove comments
+        code = re.sub(r'//.*$', '', code, flags=re.MULTILINE)
+        code = re.sub(r'/\*.*?\*/', '', code, flags=re.DOTALL)
+        
+        # Translate common JS to Python
+        # Handle value.replace() - convert single quotes to double quotes for Python
+        code = re.sub(r"'", '"', code)
+        
+        translations = [
+            (r'value\.toString\(\)', 'str(value)'),
+            (r'value\.trim\(\)', 'str(value).strip()'),
+            (r'value\.toLowerCase\(\)', 'str(value).lower()'),
+            (r'value\.toUpperCase\(\)', 'str(value).upper()'),
+            (r'parseInt\(([^)]+)\)', r'int(\1)'),
+            (r'parseFloat\(([^)]+)\)', r'float(\1)'),
+            (r'\.split\(([^)]+)\)', r'.split(\1)'),
+            (r'\.join\(([^)]+)\)', r'.join(\1)'),
+            (r'\.substring\(([^)]+)\)', r'[\1]'),
+        ]
+        
+        for pattern, replacement in translations:
+            code = re.sub(pattern, replacement, code)
+        
+        # Handle simple return statements
+        if 'return' not in code:
+            # If no explicit return and it's a single expression, add return
+            has_multiple_statements = ';' in code or code.count('\n') > 0
+            has_control_flow = any(kw in code for kw in ['if ', 'for ', 'while ', 'def '])
+            
+            if not has_multiple_statements and not has_control_flow:
+                code = f'return {code}'
+        
+        # Create a safe execution environment
+        safe_globals = {
+            '__builtins__': {
+                'str': str,
+                'int': int,
+                'float': float,
+                'len': len,
+                'range': range,
+                'True': True,
+                'False': False,
+                'None': None,
+            }
+        }
+        safe_locals = {'value': value}
+        
+        # Execute the code
+        final_code = f"def transform_fn(value):\n    {code.replace(chr(10), chr(10) + '    ')}"
+        exec(final_code, safe_globals, safe_locals)
+        result = safe_locals['transform_fn'](value)
+        
+        return result if result is not None else value
+        
+    except Exception as e:
+        print(f"Warning: Custom function execution failed for value '{value}': {e}")
+        print(f"  Original JS code: {js_code}")
+        print(f"  Translated Python code: {code}")
+        return value
+
+# Dynamic transform registry - add new transforms here (simple, no-arg)
+TRANSFORM_REGISTRY = {
+    "trim": lambda x: str(x).strip(),
+    "lower": lambda x: str(x).lower(),
+    "upper": lambda x: str(x).upper(),
+    "strip_spaces": lambda x: str(x).replace(" ", ""),
+    "capitalize": lambda x: str(x).capitalize(),
+    "title": lambda x: str(x).title(),
+}
+
+# Allowed pipeline operations with (optional) arguments.
+# Each entry maps to a handler that receives (value, *args)
+PIPELINE_OPERATIONS = {
+    "replace": lambda v, old, new: str(v).replace(old, new),
+    "substring": lambda v, start, end=None: str(v)[int(start): (int(end) if end is not None else None)],
+    "to_int": lambda v: int(str(v)) if str(v).strip() != '' else v,
+    "to_float": lambda v: float(str(v)) if str(v).strip() != '' else v,
+    "map": lambda v, mapping: mapping.get(str(v), v),  # mapping is a dict
+}
+
+PIPELINE_SAFE_BUILTINS = {"True": True, "False": False, "None": None}
+
+def apply_transform(val, transforms):
+    """
+    Apply transforms dynamically from the registry.
+    New transforms can be added to TRANSFORM_REGISTRY without code changes.
+    """
+    if not transforms:
+        return val
+    for t in transforms:
+        if t in TRANSFORM_REGISTRY:
+            val = TRANSFORM_REGISTRY[t](val)
+        else:
+            # Skip unknown transforms or log warning
+            print(f"Warning: Unknown transform '{t}' skipped")
+    return val
+
+def parse_pipeline(pipeline_str):
+    """Parse a pipeline string into a list of (op, args) tuples.
+    Syntax examples:
+      trim|lower|replace(foo,bar)|substring(0,3)|map({"NY":"New York"})|to_int
+    Whitespace around tokens is ignored.
+    """
+    steps = []
+    if not pipeline_str or not pipeline_str.strip():
+        return steps
+    tokens = [t.strip() for t in pipeline_str.split('|') if t.strip()]
+    for token in tokens:
+        m = re.match(r'^(\w+)(\((.*)\))?$', token)
+        if not m:
+            print(f"Warning: Invalid pipeline token '{token}' skipped")
+            continue
+        op = m.group(1)
+        arg_str = m.group(3)
+        args = []
+        if arg_str:
+            # Special handling for map(...) containing JSON
+            if op == 'map':
+                try:
+                    args.append(json.loads(arg_str))
+                except Exception as e:
+                    print(f"Warning: map() JSON parse failed for '{arg_str}': {e}")
+                    continue
+            else:
+                raw_args = [a.strip() for a in arg_str.split(',')]
+                args.extend(raw_args)
+        steps.append((op, args))
+    return steps
+
+def apply_custom_pipeline(val, pipeline_str):
+    """Apply a parsed pipeline of operations to a single value."""
+    if val is None:
+        return val
+    steps = parse_pipeline(pipeline_str)
+    for op, args in steps:
+        # First check simple TRANSFORM_REGISTRY (no args)
+        if op in TRANSFORM_REGISTRY and not args:
+            try:
+                val = TRANSFORM_REGISTRY[op](val)
+            except Exception as e:
+                print(f"Warning: transform '{op}' failed: {e}")
+            continue
+        # Then pipeline operations with args
+        if op in PIPELINE_OPERATIONS:
+            handler = PIPELINE_OPERATIONS[op]
+            try:
+                val = handler(val, *args)
+            except Exception as e:
+                print(f"Warning: pipeline op '{op}' failed: {e}")
+        else:
+            print(f"Warning: unknown pipeline op '{op}'")
+    return val
+
+def apply_mapping(external_df, velaris_df, config):
+    """
+    Apply transforms defined in mapping config to BOTH external and velaris CSVs.
+    Also applies transformations to key fields.
+    Mapping entries now use keys:
+      external_field, velaris_field, external_transforms, velaris_transforms,
+      external_custom (pipeline or JS function), velaris_custom
+    """
+    external = external_df.copy()
+    velaris = velaris_df.copy()
+
+    # Apply key field transformations first
+    key_fields = config.get("key_fields", {})
+    ext_key_field = key_fields.get("external_field")
+    vel_key_field = key_fields.get("velaris_field")
+    ext_key_custom = key_fields.get("external_custom", "")
+    vel_key_custom = key_fields.get("velaris_custom", "")
+
+    if ext_key_field and ext_key_field in external.columns and ext_key_custom:
+        print(f"[DEBUG] Applying external key transformation on '{ext_key_field}': {ext_key_custom}")
+        original_sample = external[ext_key_field].iloc[0] if len(external) > 0 else None
+        # Check if it's a pipeline or custom JS function
+        if '|' in ext_key_custom or any(op in ext_key_custom for op in ['trim', 'lower', 'upper', 'replace(', 'map(']):
+            external[ext_key_field] = external[ext_key_field].apply(lambda x: apply_custom_pipeline(x, ext_key_custom))
+        else:
+            external[ext_key_field] = external[ext_key_field].apply(lambda x: execute_custom_function(x, ext_key_custom))
+        transformed_sample = external[ext_key_field].iloc[0] if len(external) > 0 else None
+        print(f"[DEBUG] External key transformation result: {original_sample} -> {transformed_sample}")
+
+    if vel_key_field and vel_key_field in velaris.columns and vel_key_custom:
+        # Check if it's a pipeline or custom JS function
+        if '|' in vel_key_custom or any(op in vel_key_custom for op in ['trim', 'lower', 'upper', 'replace(', 'map(']):
+            velaris[vel_key_field] = velaris[vel_key_field].apply(lambda x: apply_custom_pipeline(x, vel_key_custom))
+        else:
+            velaris[vel_key_field] = velaris[vel_key_field].apply(lambda x: execute_custom_function(x, vel_key_custom))
+
+    # Apply field mapping transformations
+    for m in config["mappings"]:
+        e = m.get("external_field")
+        v = m.get("velaris_field")
+        ext_transforms = m.get("external_transforms", [])
+        vel_transforms = m.get("velaris_transforms", [])
+        ext_custom = m.get("external_custom", "")
+        vel_custom = m.get("velaris_custom", "")
+
+        if e in external.columns:
+            if ext_transforms:
+                external[e] = external[e].apply(lambda x: apply_transform(x, ext_transforms))
+            if ext_custom:
+                # Check if it's a pipeline (contains |) or custom JS function
+                if '|' in ext_custom or any(op in ext_custom for op in ['trim', 'lower', 'upper', 'replace(', 'map(']):
+                    # Pipeline operations
+                    external[e] = external[e].apply(lambda x: apply_custom_pipeline(x, ext_custom))
+                else:
+                    # Custom JavaScript function
+                    external[e] = external[e].apply(lambda x: execute_custom_function(x, ext_custom))
+        if v in velaris.columns:
+            if vel_transforms:
+                velaris[v] = velaris[v].apply(lambda x: apply_transform(x, vel_transforms))
+            if vel_custom:
+                # Check if it's a pipeline (contains |) or custom JS function
+                if '|' in vel_custom or any(op in vel_custom for op in ['trim', 'lower', 'upper', 'replace(', 'map(']):
+                    # Pipeline operations
+                    velaris[v] = velaris[v].apply(lambda x: apply_custom_pipeline(x, vel_custom))
+                else:
+                    # Custom JavaScript function
+                    velaris[v] = velaris[v].apply(lambda x: execute_custom_function(x, vel_custom))
+
+    return external, velaris
@@ -0,0 +1,109 @@
+import asyncio
+import threading
+
+import pytest
+
+from config import config
+from services.admission import AdmissionController, AdmissionRejectedError, estimate_source
+
+MAPPING = {
+    "key_fields": {"external_field": "id", "velaris_field": "id"},
+    "mappings": [{"external_field": "a", "velaris_field": "a", "rule": "equals"}],
+}
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+def test_waiters_are_admitted_in_arrival_order():
+    async def run():
+        controller = AdmissionController(100, max_queue=5, wait_seconds=5)
+        held = await controller.reserve(70, "first")
+        admitted = []
+
+        async def request(nbytes, label):
+            reservation = await controller.reserve(nbytes, label)
+            admitted.append(label)
+            return reservation
+
+        large = asyncio.create_task(request(60, "large"))
+        await settle()
+        small = asyncio.create_task(request(10, "small"))
+        await settle()
+        # The small request would fit but does not overtake the large one queued first
+        assert admitted == [] and controller.stats()["queue_depth"] == 2
+        held.release()
+        held.release()
+        await asyncio.gather(large, small)
+        assert admitted == ["large", "small"]
+        assert controller.stats()["reserved_bytes"] == 70
+        large.result().release()
+        small.result().release()
+        assert controller.stats()["reserved_bytes"] == 0 and controller.stats()["in_flight"] == []
+
+    asyncio.run(run())
+
+def test_rejections():
+    async def run():
+        controller = AdmissionController(100, max_queue=1, wait_seconds=0.05)
+        await controller.reserve(100)
+        waiting = asyncio.create_task(controller.reserve(10))
+        await settle()
+        with pytest.raises(AdmissionRejectedError, match="already waiting"):
+            await controller.reserve(10)
+        with pytest.raises(AdmissionRejectedError, match="waited"):
+            await waiting
+        assert controller.stats()["rejected"] == 2 and controller.stats()["queue_depth"] == 0
+
+    asyncio.run(run())
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def run():
+        controller = AdmissionController(100, max_queue=5, wait_seconds=5)
+        await controller.reserve(50)
+        large = asyncio.create_task(controller.reserve(80))
+        await settle()
+        small = asyncio.create_task(controller.reserve(40))
+        await settle()
+        large.cancel()
+        # Withdrawing the head waiter lets the one behind it in
+        reservation = await asyncio.wait_for(small, 1)
+        assert reservation.bytes == 40 and controller.stats()["queue_depth"] == 0
+
+    asyncio.run(run())
+
+def test_release_from_another_thread_and_oversized_requests():
+    async def run():
+        controller = AdmissionController(100, max_queue=5, wait_seconds=5)
+        # Capped to the budget, so it runs alone instead of never
+        whole = await controller.reserve(500)
+        assert whole.bytes == 100
+        waiting = asyncio.create_task(controller.reserve(30))
+        await settle()
+        threading.Thread(target=whole.release).start()
+        assert (await asyncio.wait_for(waiting, 1)).bytes == 30
+
+    asyncio.run(run())
+
+def test_zero_budget_admits_everything_at_once(caplog):
+    async def run():
+        controller = AdmissionController(0, max_queue=0, wait_seconds=0)
+        with caplog.at_level("WARNING", logger="services.admission"):
+            reservations = [await controller.reserve(500, "large"), await controller.reserve(10**12, "huge")]
+        assert caplog.records == []
+        assert [r.bytes for r in reservations] == [500, 10**12]
+        assert len(controller.stats()["in_flight"]) == 2 and controller.stats()["queue_depth"] == 0
+        for reservation in reservations:
+            reservation.release()
+        assert controller.stats()["reserved_bytes"] == 0
+
+    asyncio.run(run())
+
+def test_estimate_source_scales_by_parsed_columns(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "ADMISSION_MEMORY_FACTOR", 2.0)
+    path = tmp_path / "external.csv"
+    path.write_text("id,a,b,c\n" + "1,2,3,4\n" * 100)
+    size = path.stat().st_size
+    assert estimate_source(str(path), MAPPING, "external") == int(size * 2 / 4 * 2.0)
+    assert estimate_source(str(path), {**MAPPING, "compare_only_mapped": False}, "external") == int(size * 2.0)
+    assert estimate_source(path.read_bytes(), MAPPING, "external") == int(size * 2.0)
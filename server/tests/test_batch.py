@@ -0,0 +1,92 @@
+import json
+import os
+
+from fastapi.testclient import TestClient
+
+from config import config
+from main import app
+from services.pipeline import run_batch
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAPPING = {
+    "key_fields": {"external_field": "customer_id", "velaris_field": "account_id"},
+    "mappings": [
+        {"external_field": "subscription_status", "velaris_field": "status", "rule": "case_insensitive_equals"},
+        {"external_field": "monthly_revenue", "velaris_field": "mrr", "rule": "equals"},
+    ],
+}
+BUCKETS = ("matched", "mismatched", "missing_in_velaris", "missing_in_external", "duplicate_keys")
+
+def sample(name):
+    with open(os.path.join(SERVER_DIR, name), "rb") as f:
+        return f.read()
+
+def variants():
+    velaris = sample("sample_velaris.csv")
+    # A second velaris file with one account dropped and one status changed
+    lines = velaris.decode().splitlines()
+    changed = "\n".join([lines[0]] + [line.replace("paused", "active") for line in lines[2:]]).encode()
+    mappings = [MAPPING, {**MAPPING, "mappings": MAPPING["mappings"][:1], "filters": {"external": {
+        "logic": "AND", "conditions": [{"field": "region", "operator": "not_equals", "value": "Europe"}],
+    }}}]
+    return velaris, changed, mappings
+
+def test_batch_matches_individual_comparisons():
+    client = TestClient(app)
+    external = sample("sample_external.csv")
+    velaris, changed, mappings = variants()
+    client.delete("/compare/cache")
+    files = [("external_csv", external), ("velaris_csv", ("a.csv", velaris)), ("velaris_csv", ("b.csv", changed))]
+    response = client.post("/compare/batch", files=files, data={"mapping_config": json.dumps(mappings)})
+    assert response.status_code == 200
+    batch = response.json()
+    assert [t["velaris_csv"] for t in batch["targets"]] == ["a.csv", "b.csv"]
+    assert batch["external"] == {"rows": 8, "variants": 2}
+
+    for target, csv, mapping in zip(batch["targets"], (velaris, changed), mappings):
+        single = client.post(
+            "/compare/external-velaris",
+            files={"external_csv": external, "velaris_csv": csv},
+            data={"mapping_config": json.dumps(mapping)},
+        ).json()
+        for bucket in BUCKETS:
+            assert target["result"][bucket] == single[bucket]
+
+    # Every target is now memoized, so the batch answers without a job
+    again = client.post("/compare/batch", files=files, data={"mapping_config": json.dumps(mappings)}).json()
+    assert again["external"] is None
+    assert [t["result"]["mismatched"] for t in again["targets"]] == [t["result"]["mismatched"] for t in batch["targets"]]
+
+def test_one_file_under_several_mappings():
+    external = sample("sample_external.csv")
+    velaris, _, mappings = variants()
+    files = [("external_csv", external), ("velaris_csv", ("a.csv", velaris))]
+    batch = TestClient(app).post("/compare/batch", files=files, data={"mapping_config": json.dumps(mappings)}).json()
+    assert [t["velaris_csv"] for t in batch["targets"]] == ["a.csv", "a.csv"]
+    assert all("result" in t for t in batch["targets"])
+
+def test_failing_targets_do_not_fail_the_batch(tmp_path):
+    paths = [os.path.join(SERVER_DIR, name) for name in ("sample_external.csv", "sample_velaris.csv")]
+    batch = run_batch(paths[0], [(paths[1], MAPPING), (str(tmp_path / "gone.csv"), MAPPING)])
+    assert "result" not in batch["targets"][1] and batch["targets"][1]["error"].startswith("FileNotFoundError")
+    assert len(batch["targets"][0]["matched"]) > 0
+
+def test_invalid_batches_are_refused(monkeypatch):
+    client = TestClient(app)
+    external = sample("sample_external.csv")
+    velaris, changed, mappings = variants()
+
+    def post(velaris_files, mapping_config):
+        files = [("external_csv", external)] + [("velaris_csv", (f"{i}.csv", csv)) for i, csv in enumerate(velaris_files)]
+        return client.post("/compare/batch", files=files, data={"mapping_config": json.dumps(mapping_config)})
+
+    assert post([velaris, changed, velaris], mappings).status_code == 400
+    assert post([velaris], []).status_code == 400
+    assert post([velaris], {**MAPPING, "result_mode": "page"}).status_code == 400
+    assert post([velaris], {**MAPPING, "out_of_core": True}).status_code == 400
+    missing = {**MAPPING, "mappings": [{"external_field": "nope", "velaris_field": "status", "rule": "equals"}]}
+    response = post([velaris], [MAPPING, missing])
+    assert response.status_code == 400
+    assert response.json()["detail"] == {"message": "Invalid mapping_config for target 1", "errors": ["Field 'nope' not found in external CSV"]}
+    monkeypatch.setattr(config, "BATCH_MAX_TARGETS", 1)
+    assert post([velaris, changed], MAPPING).status_code == 400
@@ -0,0 +1,49 @@
+import filecmp
+
+import pytest
+
+from benchmarks.datagen import DataSpec, generate, write
+from benchmarks.suite import compare_baselines, run_benchmark
+from services.comparison_engine import compare_records
+from services.filter_engine import apply_filters
+from services.mapping_engine import apply_mapping
+
+def compare(spec):
+    external, velaris, mapping = generate(spec)
+    external = apply_filters(external, mapping["filters"]["external"])[0]
+    return compare_records(*apply_mapping(external, velaris, mapping), mapping)
+
+def test_same_seed_same_files(tmp_path):
+    spec = DataSpec(rows=500, transform_heavy=True, duplicate_rate=0.1, seed=4)
+    first, second, other = (write(s, tmp_path / name) for s, name in ((spec, "a"), (spec, "b"), (DataSpec(rows=500, seed=5), "c")))
+    for name in ("external", "velaris", "mapping"):
+        assert filecmp.cmp(first[name], second[name], shallow=False)
+    assert not filecmp.cmp(first["external"], other["external"], shallow=False)
+
+@pytest.mark.parametrize("transform_heavy", [False, True])
+def test_the_mapping_lines_up_clean_data(transform_heavy):
+    result = compare(DataSpec(rows=2000, mismatch_rate=0, orphan_rate=0, transform_heavy=transform_heavy))
+    assert result["mismatched"] == [] and result["missing_in_velaris"] == []
+    # The external filter drops "closed" rows, whose velaris rows are then unmatched
+    assert len(result["matched"]) + len(result["missing_in_external"]) == 2000
+
+def test_rates_shape_the_result():
+    result = compare(DataSpec(rows=4000, mismatch_rate=0.2, orphan_rate=0.1, transform_heavy=True))
+    paired = len(result["matched"]) + len(result["mismatched"])
+    assert 0.15 < len(result["mismatched"]) / paired < 0.25
+    assert 0.05 < len(result["missing_in_velaris"]) / 4000 < 0.15
+    assert result["duplicate_keys"] == []
+    # 1000 distinct keys over 4000 rows plus 200 repeats of random rows
+    result = compare(DataSpec(rows=4000, key_cardinality=1000, duplicate_rate=0.05))
+    assert len(result["duplicate_keys"]) == 1000
+
+def test_run_benchmark_and_compare_baselines(tmp_path, capsys):
+    paths = write(DataSpec(rows=300), tmp_path)
+    run = run_benchmark("apply_filters", paths)
+    assert run["rows"] > 0 and run["rows_per_sec"] > 0 and run["peak_rss_mb"] > 0
+
+    previous = {"benchmarks": {"apply_filters": {**run, "rows_per_sec": run["rows_per_sec"] * 2}}, "data": {"rows": 300}}
+    current = {"benchmarks": {"apply_filters": run}, "data": {"rows": 300}}
+    assert compare_baselines(previous, current, 0.1) == ["apply_filters"]
+    assert compare_baselines(current, current, 0.1) == []
+    assert "apply_filters" in capsys.readouterr().out
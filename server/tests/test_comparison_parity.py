@@ -0,0 +1,95 @@
+import random
+
+import pandas as pd
+import pytest
+
+import reference
+from services.comparison_engine import compare_records
+
+VALUES = ["a", "A", "abc", "1", "1.5", "-2", "10", "3.0", "x y", " b", "", "nan", "Ab", "2"]
+RULES = list(reference.COMPARISON_REGISTRY) + ["bogus"]
+
+def random_case(rng, trial):
+    k1 = rng.sample(range(60), rng.randint(0, 30))
+    k2 = rng.sample(range(60), rng.randint(0, 30))
+    if trial % 3 == 0:
+        k1, k2 = [f"k{k}" for k in k1], [f"k{k}" for k in k2]
+    external = pd.DataFrame({
+        "id": k1,
+        "f1": [rng.choice(VALUES) for _ in k1],
+        "n": [rng.choice([1, 2, 3, 4.5, float("nan")]) for _ in k1],
+        "same": [rng.choice(VALUES) for _ in k1],
+    })
+    velaris = pd.DataFrame({
+        "vid": k2,
+        "g1": [rng.choice(VALUES) for _ in k2],
+        "m": [rng.choice([1, 2, 3, 4.5]) for _ in k2],
+        "same": [rng.choice(VALUES) for _ in k2],
+    })
+    if trial % 5 == 0:
+        external["f1"] = external["f1"].replace("", None)
+    config = {
+        "key_fields": {"external_field": "id", "velaris_field": "vid"},
+        "mappings": [
+            {"external_field": "f1", "velaris_field": "g1", "rule": rng.choice(RULES)},
+            {"external_field": "n", "velaris_field": "m", "rule": rng.choice(RULES)},
+            {"external_field": "f1", "velaris_field": "same", "rule": rng.choice(RULES)},
+        ],
+        "compare_only_mapped": trial % 7 != 0,
+    }
+    return external, velaris, config
+
+@pytest.mark.parametrize("seed", range(4))
+def test_matches_row_at_a_time_compare_records(seed):
+    rng = random.Random(seed)
+    for trial in range(75):
+        external, velaris, config = random_case(rng, trial)
+        expected = reference.compare_records(external, velaris, config)
+        result = compare_records(external, velaris, config)
+        # Buckets the reference does not have: unique keys never repeat, fuzzy_keys is off
+        assert result.pop("duplicate_keys") == []
+        assert result.pop("probable_matches") == []
+        assert result == expected, (trial, config)
+
+def test_key_only_mapping_matches_every_paired_key():
+    external = pd.DataFrame({"id": [1, 2, 3]})
+    velaris = pd.DataFrame({"vid": [2, 3, 4]})
+    config = {"key_fields": {"external_field": "id", "velaris_field": "vid"}, "mappings": []}
+    result = compare_records(external, velaris, config)
+    assert result["matched"] == ["2", "3"]
+    assert result["missing_in_velaris"] == ["1"]
+    assert result["missing_in_external"] == ["4"]
+
+def test_duplicate_keys_are_reported_and_paired_by_occurrence():
+    external = pd.DataFrame({"id": [1, 1, 2], "f": ["a", "b", "c"]})
+    velaris = pd.DataFrame({"vid": [1, 2, 2, 3], "g": ["a", "c", "c", "z"]})
+    config = {
+        "key_fields": {"external_field": "id", "velaris_field": "vid"},
+        "mappings": [{"external_field": "f", "velaris_field": "g", "rule": "equals"}],
+    }
+    result = compare_records(external, velaris, config)
+    assert result["duplicate_keys"] == [{"id": "1", "external": 2, "velaris": 1}, {"id": "2", "external": 1, "velaris": 2}]
+    # Occurrences pair up in order; the ones left over are missing on the other side
+    assert result["matched"] == ["1", "2"]
+    assert result["missing_in_velaris"] == ["1"]
+    assert result["missing_in_external"] == ["2", "3"]
+
+def test_missing_key_field_is_an_error():
+    config = {"key_fields": {"external_field": "nope", "velaris_field": "vid"}, "mappings": []}
+    with pytest.raises(ValueError, match="Key field 'nope' not found in external CSV"):
+        compare_records(pd.DataFrame({"id": [1]}), pd.DataFrame({"vid": [1]}), config)
+
+@pytest.mark.parametrize("rule", ["contains", "starts_with", "ends_with", "equals", "not_equals"])
+def test_substring_rules_keep_nul_characters_and_long_values(rule):
+    external = ["a\x00", "\x00", "ab", "x" * 100_000, "", "a\x00b"]
+    velaris = ["xa", "ab", "ab\x00", "x" * 100_000 + "y", "z", "a\x00b"]
+    ids = list(range(len(external)))
+    config = {
+        "key_fields": {"external_field": "id", "velaris_field": "vid"},
+        "mappings": [{"external_field": "f", "velaris_field": "g", "rule": rule}],
+    }
+    frames = pd.DataFrame({"id": ids, "f": external}), pd.DataFrame({"vid": ids, "g": velaris})
+    result = compare_records(*frames, config)
+    result.pop("duplicate_keys")
+    result.pop("probable_matches")
+    assert result == reference.compare_records(*frames, config)
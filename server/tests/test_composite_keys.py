@@ -0,0 +1,91 @@
+import random
+
+import pandas as pd
+import pytest
+
+from reference import compare_records as reference_compare
+from services.comparison_engine import check_key_fields, compare_records, pair_keys
+from services.mapping_engine import apply_mapping
+from services.partitioned_compare import compare_partitioned
+
+COLUMN_VALUES = {
+    "int": lambda rng: rng.randint(0, 4),
+    "float": lambda rng: rng.choice([0.0, 1.0, 2.5, float("nan")]),
+    "str": lambda rng: rng.choice(["a", "b", "c"]),
+    "mixed": lambda rng: rng.choice([1, "1", 2, 2.0, "a", True, False]),
+    "bool": lambda rng: rng.choice([True, False]),
+}
+
+def random_keys(rng, kinds, rows):
+    return pd.DataFrame({f"k{i}": [COLUMN_VALUES[kind](rng) for _ in range(rows)] for i, kind in enumerate(kinds)})
+
+def reference_pairs(ext_keys, vel_keys):
+    """Occurrence pairing on row tuples, with every missing value as one key value and booleans apart from numbers."""
+    def rows(keys):
+        return [tuple(None if pd.isna(v) else ("bool", v) if isinstance(v, bool) else v for v in row) for row in keys.itertuples(index=False)]
+    waiting = {}
+    for position, key in enumerate(rows(vel_keys)):
+        waiting.setdefault(key, []).append(position)
+    matched_ext, matched_vel, ext_only = [], [], []
+    for position, key in enumerate(rows(ext_keys)):
+        if waiting.get(key):
+            matched_ext.append(position)
+            matched_vel.append(waiting[key].pop(0))
+        else:
+            ext_only.append(position)
+    vel_only = sorted(p for positions in waiting.values() for p in positions)
+    return matched_ext, matched_vel, ext_only, vel_only
+
+@pytest.mark.parametrize("seed", range(20))
+def test_pair_keys_matches_tuple_join(seed):
+    rng = random.Random(seed)
+    kinds = [rng.choice(list(COLUMN_VALUES)) for _ in range(rng.randint(2, 3))]
+    ext_keys = random_keys(rng, kinds, rng.randint(0, 80))
+    # Integer and float columns join on numeric value; bool columns never join numbers
+    swaps = {"int": "float", "bool": "int"}
+    vel_kinds = [swaps[kind] if kind in swaps and rng.random() < 0.5 else kind for kind in kinds]
+    vel_keys = random_keys(rng, vel_kinds, rng.randint(0, 80))
+    got = [list(bucket) for bucket in pair_keys(ext_keys, vel_keys)]
+    assert got == [list(bucket) for bucket in reference_pairs(ext_keys, vel_keys)]
+
+def _mapping(**key_fields):
+    return {
+        "key_fields": {"external_field": ["region", "id"], "velaris_field": ["area", "vid"], **key_fields},
+        "mappings": [{"external_field": "v", "velaris_field": "v", "rule": "equals"}],
+    }
+
+def test_composite_key_result():
+    external = pd.DataFrame({"region": ["EU", "EU", "US", "US", "US"], "id": [1, 2, 1, 1, 3], "v": ["x", "y", "x", "x", "z"]})
+    velaris = pd.DataFrame({"area": ["eu", "US", "EU", "US"], "vid": [" 1", "1", " 2", "4"], "v": ["x", "x", "n", "x"]})
+    mapping = _mapping(velaris_custom=["upper", "trim|to_int"])
+    result = compare_records(*apply_mapping(external, velaris, mapping), mapping)
+    assert result["matched"] == ["EU|1", "US|1"]
+    assert [m["id"] for m in result["mismatched"]] == ["EU|2"]
+    assert result["missing_in_velaris"] == ["US|1", "US|3"]
+    assert result["missing_in_external"] == ["US|4"]
+    assert result["duplicate_keys"] == [{"id": "US|1", "external": 2, "velaris": 1}]
+
+@pytest.mark.parametrize("velaris_keys", [[1, 0, 2], [1.0, 0.0, 2.0], ["a", 1, True]])
+def test_bool_keys_never_pair_with_numbers(velaris_keys):
+    external = pd.DataFrame({"id": [True, False, True], "v": ["x", "y", "z"]})
+    velaris = pd.DataFrame({"vid": velaris_keys, "v": ["x", "y", "z"]})
+    mapping = {"key_fields": {"external_field": "id", "velaris_field": "vid"}, "mappings": [{"external_field": "v", "velaris_field": "v", "rule": "equals"}]}
+    result = compare_records(external, velaris, mapping)
+    assert result == compare_partitioned(external, velaris, mapping, partitions=3, workers=1)[0]
+    paired = ["True"] if any(k is True for k in velaris_keys) else []
+    assert result["matched"] + [m["id"] for m in result["mismatched"]] == paired
+    if not paired:
+        # The reference looks every key up in the other side's Index, which never finds True under 1
+        expected = reference_compare(external.copy(), velaris.copy(), mapping)
+        assert (result["missing_in_velaris"], result["missing_in_external"]) == (expected["missing_in_velaris"], expected["missing_in_external"])
+    assert result["missing_in_external"] == [str(k) for k in velaris_keys if k is not True]
+
+@pytest.mark.parametrize("key_fields", [
+    {"external_field": ["region", "id"], "velaris_field": "vid"},
+    {"external_field": ["region", 1], "velaris_field": ["area", "vid"]},
+    {"external_field": [], "velaris_field": []},
+    {"external_field": ["region", "id"], "velaris_field": ["area", "vid"], "external_custom": ["trim", "trim", "trim"]},
+])
+def test_malformed_key_fields(key_fields):
+    with pytest.raises(ValueError):
+        check_key_fields({"key_fields": key_fields})
@@ -0,0 +1,67 @@
+import asyncio
+import io
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.csv_compare import compare_csv_files
+
+def merge_diff(df1, df2):
+    """The merge-based implementation compare_csv_files replaced (set semantics)."""
+    only_in_1 = df1.merge(df2, indicator=True, how="left").query('_merge == "left_only"')
+    only_in_2 = df2.merge(df1, indicator=True, how="left").query('_merge == "left_only"')
+    return {"rows_in_file1_not_in_file2": len(only_in_1), "rows_in_file2_not_in_file1": len(only_in_2)}
+
+def upload(df):
+    buffer = io.BytesIO()
+    df.to_csv(buffer, index=False)
+    return SimpleNamespace(file=buffer)
+
+def diff(df1, df2, **kwargs):
+    return asyncio.run(compare_csv_files(upload(df1), upload(df2), **kwargs))
+
+def random_frames(seed, rows=2000):
+    rng = np.random.default_rng(seed)
+    df1 = pd.DataFrame({
+        "id": rng.permutation(rows * 2)[:rows],
+        "name": rng.choice(["a", "b", "c", None], rows),
+        "amount": np.round(rng.random(rows) * 100, 2),
+    })
+    df2 = df1.sample(frac=0.9, random_state=seed).reset_index(drop=True)
+    changed = rng.random(len(df2)) < 0.05
+    df2.loc[changed, "amount"] += 1
+    df2 = pd.concat([df2, df1.head(0).assign(id=[rows * 3], name=["z"], amount=[1.0])], ignore_index=True)
+    return df1, df2
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("chunked", [False, True])
+def test_counts_match_merge_implementation_on_distinct_rows(seed, chunked):
+    df1, df2 = random_frames(seed)
+    result = diff(df1, df2, chunked=chunked, chunksize=300)
+    expected = merge_diff(df1, df2)
+    for name, count in expected.items():
+        assert result[name] == count
+    assert result["compared_columns"] == ["id", "name", "amount"]
+
+@pytest.mark.parametrize("chunked", [False, True])
+def test_duplicate_rows_count_as_a_multiset(chunked):
+    df1 = pd.DataFrame({"id": [1, 1, 1, 2], "v": ["x", "x", "x", "y"]})
+    df2 = pd.DataFrame({"id": [1, 2, 2, 3], "v": ["x", "y", "y", "z"]})
+    result = diff(df1, df2, chunked=chunked, chunksize=2, sample_size=5)
+    assert result["rows_in_file1_not_in_file2"] == 2
+    assert result["rows_in_file2_not_in_file1"] == 2
+    assert len(result["sample_rows_in_file1_not_in_file2"]) == 2
+    assert [str(r["id"]) for r in result["sample_rows_in_file2_not_in_file1"]] == ["2", "3"]
+
+def test_only_common_columns_are_compared():
+    df1 = pd.DataFrame({"id": [1, 2], "extra": ["a", "b"]})
+    df2 = pd.DataFrame({"id": [2, 3], "other": [0, 0]})
+    result = diff(df1, df2)
+    assert result["compared_columns"] == ["id"]
+    assert (result["rows_in_file1_not_in_file2"], result["rows_in_file2_not_in_file1"]) == (1, 1)
+
+def test_no_common_columns():
+    with pytest.raises(ValueError):
+        diff(pd.DataFrame({"a": [1]}), pd.DataFrame({"b": [1]}))
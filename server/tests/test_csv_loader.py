@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+
+from services.csv_loader import read_csv, read_csvs, required_columns
+
+CSV = b"id,name,amount,unused,status\n1,a,1.5,x,open\n2,b,2,y,closed\n"
+
+MAPPING = {
+    "key_fields": {"external_field": "id", "velaris_field": ["region", "vid"]},
+    "mappings": [{"external_field": "name", "velaris_field": "nm", "rule": "equals"}],
+    "filters": {"external": {"logic": "AND", "conditions": [{"field": "status", "operator": "equals", "value": "open"}]}},
+}
+
+def test_required_columns():
+    assert required_columns(MAPPING, "external") == {"id", "name", "status"}
+    assert required_columns(MAPPING, "velaris") == {"region", "vid", "nm"}
+    assert required_columns({**MAPPING, "compare_only_mapped": False}, "external") is None
+
+@pytest.fixture
+def path(tmp_path):
+    path = tmp_path / "input.csv"
+    path.write_bytes(CSV)
+    return str(path)
+
+@pytest.mark.parametrize("as_path", [False, True])
+def test_only_needed_columns_are_parsed(path, as_path):
+    df = read_csv(path if as_path else CSV, columns={"id", "amount", "missing"})
+    # Header order is kept; referenced columns the file lacks are left to the caller
+    assert list(df.columns) == ["id", "amount"]
+    assert df["amount"].tolist() == [1.5, 2.0]
+
+def test_dtypes(path):
+    assert read_csv(path, dtype="string")["amount"].tolist() == ["1.5", "2"]
+    assert isinstance(read_csv(path, dtype="category")["status"].dtype, pd.CategoricalDtype)
+    # Without pyarrow installed the C engine is used instead
+    pd.testing.assert_frame_equal(read_csv(path, engine="pyarrow"), read_csv(path, engine="c"))
+
+def test_read_csvs_keeps_order(path):
+    first, second = read_csvs([(path, {"id"}), (CSV, {"status"})])
+    assert list(first.columns) == ["id"] and list(second.columns) == ["status"]
@@ -0,0 +1,41 @@
+import logging
+
+import pandas as pd
+
+from services import mapping_engine
+from services.mapping_engine import apply_custom_function, compile_custom_function, execute_custom_function
+from services.metrics import metrics
+
+def failures():
+    return metrics.snapshot()["counters"].get(("transform_failures_total", (("transform", "custom_function"),)), 0)
+
+def test_a_snippet_is_translated_and_compiled_once(monkeypatch):
+    compile_custom_function.cache_clear()
+    translations = []
+    translate = mapping_engine.translate_custom_function
+    monkeypatch.setattr(mapping_engine, "translate_custom_function", lambda code: translations.append(code) or translate(code))
+    code = "return value.toUpperCase();"
+    column = pd.Series(["a", "b", "c"] * 1000)
+    assert apply_custom_function(column, code).tolist() == ["A", "B", "C"] * 1000
+    assert execute_custom_function("d", code) == "D"
+    assert translations == [code]
+    assert compile_custom_function.cache_info().hits >= 1
+
+def test_failures_are_aggregated(caplog):
+    before = failures()
+    column = pd.Series(["1", "x", "2", "y", None], dtype=object, name="amount")
+    with caplog.at_level(logging.WARNING, logger=mapping_engine.__name__):
+        result = apply_custom_function(column, "return parseInt(value) * 2")
+    # Failing values are kept as they were
+    assert result.tolist() == [2, "x", 4, "y", None]
+    assert failures() - before == 3
+    warnings = [r for r in caplog.records if r.levelno == logging.WARNING]
+    assert len(warnings) == 1 and "failed for 3 of 5 value(s)" in warnings[0].getMessage()
+
+def test_a_snippet_that_does_not_compile_keeps_every_value(caplog):
+    before = failures()
+    column = pd.Series(["a", "b"])
+    with caplog.at_level(logging.WARNING, logger=mapping_engine.__name__):
+        assert apply_custom_function(column, "syntax error (").tolist() == ["a", "b"]
+    assert failures() - before == 2
+    assert execute_custom_function("a", "syntax error (") == "a"
@@ -0,0 +1,88 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+from config import config
+from main import app
+from services.csv_loader import read_csv
+from services.dataset_cache import DatasetCache, DatasetNotFoundError
+from services.storage import private_directory
+
+DATASET_ID = "0" * 64
+
+CSV = (
+    'id,name,amount,flag,code,note\n'
+    '1,"Smith, J",1.1,True,007,"line\nbreak"\n'
+    '2,,0.30000000000000004,False,12,"say ""hi"""\n'
+    '3,  padded ,-1e-300,True,,1.0\n'
+    '4,ü,,,0x1,\n'
+)
+
+@pytest.mark.parametrize("csv_dtype", ["infer", "string", "category"])
+def test_csv_format_round_trips_parsed_frames(tmp_path, monkeypatch, csv_dtype):
+    monkeypatch.setattr(config, "CSV_DTYPE", csv_dtype)
+    source = tmp_path / "source.csv"
+    source.write_text(CSV)
+    # A zero budget keeps nothing in memory, so load reads the stored file back
+    cache = DatasetCache(str(tmp_path / "store"), 0, "csv")
+    meta = cache.store(DATASET_ID, str(source), "source.csv")
+    assert meta["format"] == "csv" and meta["rows"] == 4
+    pd.testing.assert_frame_equal(cache.load(DATASET_ID), read_csv(str(source)))
+    assert list(cache.load(DATASET_ID, columns={"code", "id"}).columns) == ["id", "code"]
+
+def test_unknown_formats_are_refused(tmp_path):
+    with pytest.raises(ValueError, match="Unknown DATASET_FORMAT 'pickle'"):
+        DatasetCache(str(tmp_path), 0, "pickle")
+    # Pickled datasets stored by earlier versions are never loaded
+    (tmp_path / f"{DATASET_ID}.json").write_text(json.dumps({"dataset_id": DATASET_ID, "format": "pickle"}))
+    (tmp_path / f"{DATASET_ID}.pkl").write_bytes(b"not loaded")
+    cache = DatasetCache(str(tmp_path), 0, "csv")
+    assert not cache.exists(DATASET_ID)
+    with pytest.raises(DatasetNotFoundError):
+        cache.load(DATASET_ID)
+
+def test_private_directory(tmp_path):
+    created = private_directory(str(tmp_path / "new"))
+    assert os.stat(created).st_mode & 0o777 == 0o700
+    loose = tmp_path / "loose"
+    loose.mkdir(mode=0o777)
+    os.chmod(loose, 0o777)
+    private_directory(str(loose))
+    assert os.stat(loose).st_mode & 0o777 == 0o700
+    os.symlink(created, tmp_path / "link")
+    with pytest.raises(PermissionError):
+        private_directory(str(tmp_path / "link"))
+
+@pytest.mark.skipif(not hasattr(os, "geteuid") or os.geteuid() != 0, reason="needs root to chown")
+def test_private_directory_owned_by_another_user(tmp_path):
+    planted = tmp_path / "planted"
+    planted.mkdir()
+    os.chown(planted, 12345, 12345)
+    with pytest.raises(PermissionError):
+        DatasetCache(str(planted), 0, "csv").exists(DATASET_ID)
+
+def test_dataset_routes():
+    client = TestClient(app)
+    mapping = {
+        "key_fields": {"external_field": "id", "velaris_field": "id"},
+        "mappings": [{"external_field": "v", "velaris_field": "v", "rule": "equals"}],
+    }
+    external, velaris = b"id,v\n1,a\n2,b\n3,c\n", b"id,v\n1,a\n2,x\n4,d\n"
+    registered = [client.post("/datasets", files={"file": ("e.csv", content)}).json() for content in (external, external, velaris)]
+    assert [r["deduplicated"] for r in registered] == [False, True, False]
+    ids = [registered[0]["dataset_id"], registered[2]["dataset_id"]]
+    assert client.get(f"/datasets/{ids[0]}").json()["rows"] == 3
+
+    data = {"external_dataset": ids[0], "velaris_dataset": ids[1], "mapping_config": json.dumps(mapping)}
+    by_dataset = client.post("/compare/datasets", data=data).json()
+    uploaded = client.post("/compare/external-velaris", files={"external_csv": external, "velaris_csv": velaris}, data={"mapping_config": json.dumps(mapping)}).json()
+    for bucket in ("matched", "mismatched", "missing_in_velaris", "missing_in_external"):
+        assert by_dataset[bucket] == uploaded[bucket]
+    assert by_dataset["matched"] == ["1"] and by_dataset["missing_in_external"] == ["4"]
+
+    assert client.delete(f"/datasets/{ids[1]}").status_code == 200
+    assert client.get(f"/datasets/{ids[1]}").status_code == 404
+    assert client.post("/compare/datasets", data=data).status_code == 404
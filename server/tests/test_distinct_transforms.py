@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+
+from config import config
+from services.mapping_engine import apply_mapping_with_stats
+
+MAPPING = {
+    "key_fields": {"external_field": "id", "velaris_field": "id"},
+    "mappings": [
+        {"external_field": "status", "velaris_field": "status", "rule": "equals", "external_custom": "return value.trim().toUpperCase();"},
+        {"external_field": "note", "velaris_field": "note", "rule": "equals", "external_transforms": ["trim", "lower"]},
+    ],
+}
+
+def frames(rows):
+    rng = np.random.default_rng(2)
+    external = pd.DataFrame({
+        "id": np.arange(rows),
+        "status": pd.Series(rng.choice([" open", "closed ", None, np.nan], rows), dtype=object),
+        "note": [f" Note {i} " for i in range(rows)],
+    })
+    velaris = pd.DataFrame({"id": np.arange(rows), "status": "OPEN", "note": "x"})
+    return external, velaris
+
+def test_low_cardinality_columns_are_transformed_per_distinct_value(monkeypatch):
+    monkeypatch.setattr(config, "DISTINCT_TRANSFORM_MIN_ROWS", 100)
+    monkeypatch.setattr(config, "DISTINCT_TRANSFORM_MAX_RATIO", 0.1)
+    external, velaris = frames(2000)
+    mapped, _, stats = apply_mapping_with_stats(external, velaris, MAPPING)
+    status, note = stats["external"]["fields"]["status"], stats["external"]["fields"]["note"]
+    # None and NaN transform differently, so each is its own distinct value
+    assert (status["memoized"], status["distinct"], status["rows"]) == (True, 4, 2000)
+    assert (note["memoized"], note["distinct"]) == (False, 2000)
+
+    monkeypatch.setattr(config, "DISTINCT_TRANSFORM_MIN_ROWS", 10**9)
+    per_row, _, stats = apply_mapping_with_stats(external, velaris, MAPPING)
+    assert not stats["external"]["fields"]["status"]["memoized"] and stats["external"]["fields"]["status"]["distinct"] is None
+    pd.testing.assert_frame_equal(mapped, per_row)
+
+def test_key_and_field_transforms_of_one_column_are_reported_separately():
+    mapping = {
+        "key_fields": {"external_field": "status", "velaris_field": "status", "external_custom": "trim"},
+        "mappings": [{"external_field": "status", "velaris_field": "status", "rule": "equals", "external_transforms": ["lower"]}],
+    }
+    external, velaris = frames(50)
+    _, _, stats = apply_mapping_with_stats(external, velaris, mapping)
+    assert set(stats["external"]["keys"]) == {"status"} and set(stats["external"]["fields"]) == {"status"}
+    assert stats["external"]["keys"]["status"] is not stats["external"]["fields"]["status"]
@@ -0,0 +1,80 @@
+import logging
+import random
+
+import pandas as pd
+import pytest
+
+import reference
+from services.filter_engine import apply_filters
+
+POOL = [
+    "abc", "ABC", "1", "2.5", "-3", "1e2", "1_000", "", "nan", None, float("nan"), "true", "False",
+    "2023-01-05", "2023-01-05T10:00:00+02:00", "2022-12-31", "x.y", "Ab",
+]
+CONDITION_VALUES = [
+    "abc", "1", "2", "2.5", "2023-01-01", "2023-01-05T09:00:00+00:00", "true", "a.*", "x", 3, 1.5, True, "nan", "zzz", None, "",
+]
+OPERATORS = ["equals", "not_equals", "greater_than", "less_than", "contains", "not_null", "regex"]
+DATA_TYPES = ["string", "number", "date", "boolean"]
+
+def random_case(rng, trial):
+    n = rng.randint(0, 25)
+    df = pd.DataFrame({
+        "a": pd.Series([rng.choice(POOL) for _ in range(n)], dtype=object),
+        "b": [rng.choice([1, 2, 3.5, -1]) for _ in range(n)],
+        "c": pd.Series([rng.choice(["x", "Y", "2023-01-01", None]) for _ in range(n)], dtype="str" if trial % 2 else object),
+        "d": [rng.choice([True, False]) for _ in range(n)],
+    })
+    conditions = []
+    for _ in range(rng.randint(0, 3)):
+        operator = rng.choice(OPERATORS)
+        value = rng.choice(CONDITION_VALUES)
+        if operator == "regex" and value not in ("a.*", "x", "abc"):
+            value = "a.*"
+        conditions.append({
+            "field": rng.choice(["a", "b", "c", "d", "missing"]),
+            "operator": operator,
+            "data_type": rng.choice(DATA_TYPES),
+            "value": value,
+        })
+    return df, {"logic": rng.choice(["AND", "OR"]), "conditions": conditions}
+
+@pytest.mark.parametrize("seed", range(4))
+def test_matches_row_at_a_time_apply_filters(seed):
+    logging.disable(logging.WARNING)
+    try:
+        rng = random.Random(seed)
+        for trial in range(300):
+            df, group = random_case(rng, trial)
+            expected, expected_stats = reference.apply_filters(df, group)
+            result, stats = apply_filters(df, group)
+            assert stats == expected_stats, (trial, group)
+            if len(df):
+                pd.testing.assert_frame_equal(result, expected)
+    finally:
+        logging.disable(logging.NOTSET)
+
+@pytest.mark.parametrize("operator", ["equals", "not_equals", "greater_than", "less_than", "not_null"])
+@pytest.mark.parametrize("data_type", DATA_TYPES)
+def test_nullable_columns_match_row_at_a_time(operator, data_type):
+    df = pd.DataFrame({
+        "d": pd.array([True, None, False], dtype="boolean"),
+        "i": pd.array([1, None, 3], dtype="Int64"),
+        "s": pd.array(["a", None, "b"], dtype="string"),
+    })
+    logging.disable(logging.WARNING)
+    try:
+        for field in df.columns:
+            group = {"logic": "AND", "conditions": [{"field": field, "operator": operator, "data_type": data_type, "value": "true"}]}
+            expected, expected_stats = reference.apply_filters(df, group)
+            result, stats = apply_filters(df, group)
+            assert stats == expected_stats, field
+            pd.testing.assert_frame_equal(result, expected)
+    finally:
+        logging.disable(logging.NOTSET)
+
+def test_no_group_keeps_every_row():
+    df = pd.DataFrame({"a": [1, 2]})
+    result, stats = apply_filters(df, None)
+    assert len(result) == 2
+    assert stats == {"original": 2, "kept": 2, "dropped": 0}
@@ -0,0 +1,98 @@
+import random
+
+import pandas as pd
+import pytest
+
+from services.comparison_engine import compare_records
+from services.fuzzy_match import edit_distances, fuzzy_options, match_orphans, normalize_keys
+
+def levenshtein(a, b):
+    previous = list(range(len(b) + 1))
+    for i, x in enumerate(a, 1):
+        current = [i]
+        for j, y in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (x != y)))
+        previous = current
+    return previous[-1]
+
+def exhaustive_matches(ext_labels, vel_labels, threshold):
+    ext_norm, vel_norm = normalize_keys(ext_labels), normalize_keys(vel_labels)
+    scored = []
+    for i, a in enumerate(ext_norm):
+        for j, b in enumerate(vel_norm):
+            if a and b:
+                score = 1 - levenshtein(a, b) / max(len(a), len(b))
+                if score >= threshold:
+                    scored.append((-score, i, j))
+    used_external, used_velaris, matches = set(), set(), []
+    for score, i, j in sorted(scored):
+        if i not in used_external and j not in used_velaris:
+            used_external.add(i)
+            used_velaris.add(j)
+            matches.append((i, j, -score))
+    return sorted(matches)
+
+def random_key(rng):
+    return rng.choice(["INV-", "inv ", "ACC_", ""]) + "".join(rng.choice("0123456789ab") for _ in range(rng.randint(1, 7)))
+
+def test_normalize_keys():
+    assert list(normalize_keys(["INV-00123", " inv 123 ", "A_0B-007", "---", 42])) == ["inv123", "inv123", "a0b7", "", "42"]
+
+@pytest.mark.parametrize("seed", range(5))
+def test_edit_distances(seed):
+    rng = random.Random(seed)
+    a = ["".join(rng.choice("abc") for _ in range(rng.randint(0, 12))) for _ in range(300)]
+    b = ["".join(rng.choice("abc") for _ in range(rng.randint(0, 12))) for _ in range(300)]
+    assert list(edit_distances(a, b)) == [levenshtein(x, y) for x, y in zip(a, b)]
+
+@pytest.mark.parametrize("seed", range(10))
+def test_match_orphans_with_exhaustive_candidates(seed):
+    rng = random.Random(seed)
+    ext_labels = [random_key(rng) for _ in range(rng.randint(0, 40))]
+    vel_labels = [random_key(rng) for _ in range(rng.randint(0, 40))]
+    threshold = rng.choice([0.5, 0.7, 0.85, 1.0])
+    # A sorted-neighbourhood window spanning every key makes every pair a candidate
+    options = {"threshold": threshold, "ngram": 3, "window": 100, "max_block_size": 64, "max_candidates": 8}
+    matches = match_orphans(ext_labels, vel_labels, options)
+    expected = exhaustive_matches(ext_labels, vel_labels, threshold)
+    assert [(i, j) for i, j, _ in matches] == [(i, j) for i, j, _ in expected]
+    assert [s for _, _, s in matches] == pytest.approx([s for _, _, s in expected])
+
+def compare(ext_ids, vel_ids, fuzzy_keys):
+    external = pd.DataFrame({"id": ext_ids, "v": ["x"] * len(ext_ids)})
+    velaris = pd.DataFrame({"vid": vel_ids, "v": ["x"] * len(vel_ids)})
+    mapping = {
+        "key_fields": {"external_field": "id", "velaris_field": "vid"},
+        "mappings": [{"external_field": "v", "velaris_field": "v", "rule": "equals"}],
+    }
+    if fuzzy_keys is not None:
+        mapping["fuzzy_keys"] = fuzzy_keys
+    return compare_records(external, velaris, mapping)
+
+def test_probable_matches_leave_orphans_in_missing():
+    result = compare(["INV-001", "INV-12345", "ACC-77", "zzz"], ["inv 1", "INV-12346", "ACC-77", "qqq"], True)
+    assert result["matched"] == ["ACC-77"]
+    assert result["missing_in_velaris"] == ["INV-001", "INV-12345", "zzz"]
+    assert result["missing_in_external"] == ["inv 1", "INV-12346", "qqq"]
+    assert result["probable_matches"] == [
+        {"external_id": "INV-001", "velaris_id": "inv 1", "score": 1.0},
+        {"external_id": "INV-12345", "velaris_id": "INV-12346", "score": 0.875},
+    ]
+
+def test_threshold_and_off_by_default():
+    assert compare(["INV-12345"], ["INV-12346"], {"threshold": 0.9})["probable_matches"] == []
+    assert compare(["INV-001"], ["inv 1"], None)["probable_matches"] == []
+
+@pytest.mark.parametrize("fuzzy_keys", [
+    "yes",
+    {"threshold": 0},
+    {"threshold": 1.5},
+    {"threshold": "high"},
+    {"window": -1},
+    {"ngram": 0},
+    {"max_block_size": 1},
+    {"treshold": 0.9},
+])
+def test_invalid_options(fuzzy_keys):
+    with pytest.raises(ValueError):
+        fuzzy_options({"fuzzy_keys": fuzzy_keys})
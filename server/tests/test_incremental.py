@@ -0,0 +1,93 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from config import config
+from services.comparison_engine import compare_records
+from services.incremental import compare_incremental, delete_snapshot, list_snapshots, load_snapshot
+from services.mapping_engine import apply_mapping
+
+MAPPING = {
+    "key_fields": {"external_field": "id", "velaris_field": "vid"},
+    "mappings": [
+        {"external_field": "a", "velaris_field": "a", "rule": "equals"},
+        {"external_field": "b", "velaris_field": "b", "rule": "equals", "external_transforms": ["lower"]},
+    ],
+    "incremental": {"snapshot": "test"},
+}
+
+@pytest.fixture(autouse=True)
+def snapshot_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "SNAPSHOT_DIR", str(tmp_path))
+
+def frames(rng, rows=2000):
+    external = pd.DataFrame({
+        "id": rng.integers(0, 1500, rows),
+        "a": rng.integers(0, 4, rows),
+        "b": rng.choice(["X", "y", None], rows),
+        "extra": rng.random(rows),
+    })
+    velaris = pd.DataFrame({"vid": rng.integers(0, 1500, rows), "a": rng.integers(0, 4, rows), "b": rng.choice(["x", "y"], rows)})
+    return external, velaris
+
+def run(external, velaris, mapping=MAPPING):
+    result, _ = compare_incremental(external, velaris, mapping)
+    report = result.pop("incremental")
+    full = compare_records(*apply_mapping(external, velaris, mapping), mapping)
+    assert result == full
+    return report, full
+
+def test_runs_give_the_full_comparison_result():
+    rng = np.random.default_rng(5)
+    external, velaris = frames(rng)
+    first, _ = run(external, velaris)
+    assert first["previous_run_at"] is None and first["carried_forward_pairs"] == 0
+
+    again, _ = run(external, velaris)
+    assert again["reevaluated_pairs"] == 0
+    assert again["new_mismatches"] == [] and again["resolved_mismatches"] == []
+
+    changed = external.copy()
+    rows = rng.choice(len(changed), 40, replace=False)
+    changed.loc[rows, "a"] = rng.integers(0, 4, 40)
+    changed.loc[rows[:5], "id"] = 9999
+    # A column no mapping reads does not invalidate its rows
+    changed.loc[0:10, "extra"] = 0
+    report, _ = run(changed, velaris.drop(index=velaris.index[:20]))
+    assert 0 < report["reevaluated_pairs"] <= 80
+    assert report["carried_forward_pairs"] > 0
+
+def test_a_changed_mapping_re_evaluates_every_pair():
+    external, velaris = frames(np.random.default_rng(1))
+    run(external, velaris)
+    mapping = {**MAPPING, "mappings": MAPPING["mappings"][:1]}
+    report, _ = run(external, velaris, mapping)
+    assert report["carried_forward_pairs"] == 0
+
+def test_summary_mode():
+    external, velaris = frames(np.random.default_rng(2))
+    run(external, velaris)
+    mapping = {**MAPPING, "result_mode": "summary"}
+    result, _ = compare_incremental(external, velaris, mapping)
+    assert result["incremental"]["reevaluated_pairs"] == 0
+    result.pop("incremental")
+    assert result == compare_records(*apply_mapping(external, velaris, mapping), mapping)
+
+def test_composite_keys_and_snapshot_storage(tmp_path):
+    rng = np.random.default_rng(3)
+    external, velaris = frames(rng, rows=500)
+    external["region"] = rng.choice(["EU", "ü\x00", "a,b"], len(external))
+    velaris["area"] = rng.choice(["EU", "ü\x00", "a,b"], len(velaris))
+    mapping = {**MAPPING, "key_fields": {"external_field": ["region", "id"], "velaris_field": ["area", "vid"]}}
+    run(external, velaris, mapping)
+    snapshot = load_snapshot("test")
+    assert isinstance(snapshot["external"]["key"][0], tuple)
+    report, _ = run(external, velaris, mapping)
+    assert report["reevaluated_pairs"] == 0
+    # Nothing is unpickled, and listing reads only the small sidecars
+    assert sorted(os.listdir(tmp_path)) == ["test.json", "test.npz"]
+    assert os.stat(tmp_path).st_mode & 0o777 == 0o700
+    assert [s["snapshot"] for s in list_snapshots()] == ["test"]
+    assert delete_snapshot("test") and list_snapshots() == [] and load_snapshot("test") is None
@@ -0,0 +1,75 @@
+import json
+import os
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from routes import compare_routes
+from services.job_manager import JobManager, JobQueueFullError
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAPPING = {
+    "key_fields": {"external_field": "customer_id", "velaris_field": "account_id"},
+    "mappings": [{"external_field": "subscription_status", "velaris_field": "status", "rule": "case_insensitive_equals"}],
+}
+
+def sample_files():
+    files = {}
+    for field, name in (("external_csv", "sample_external.csv"), ("velaris_csv", "sample_velaris.csv")):
+        with open(os.path.join(SERVER_DIR, name), "rb") as f:
+            files[field] = f.read()
+    return files
+
+def wait_for(manager, job, timeout=60):
+    deadline = time.time() + timeout
+    while manager.get(job.id).status in ("queued", "running"):
+        assert time.time() < deadline
+        time.sleep(0.05)
+    return manager.get(job.id)
+
+def test_job_routes():
+    client = TestClient(app)
+    files = sample_files()
+    data = {"mapping_config": json.dumps(MAPPING)}
+    submitted = client.post("/compare/jobs", files=files, data=data)
+    assert submitted.status_code == 202 and submitted.json()["status"] in ("queued", "running", "completed")
+    job_id = submitted.json()["job_id"]
+
+    deadline = time.time() + 60
+    while (status := client.get(f"/compare/jobs/{job_id}").json()["status"]) != "completed":
+        assert status in ("queued", "running") and time.time() < deadline
+        time.sleep(0.05)
+    assert job_id in [job["job_id"] for job in client.get("/compare/jobs").json()]
+    result = client.get(f"/compare/jobs/{job_id}/result").json()
+    direct = client.post("/compare/external-velaris", files=files, data=data).json()
+    for bucket in ("matched", "mismatched", "missing_in_velaris", "missing_in_external"):
+        assert result[bucket] == direct[bucket]
+
+    assert client.get("/compare/jobs/missing").status_code == 404
+    assert client.get("/compare/jobs/missing/result").status_code == 404
+
+def test_failed_jobs_report_their_error(monkeypatch):
+    manager = JobManager(1, 1, 3600, 1 << 20)
+    job = wait_for(manager, manager.submit(int, "x", retain=True))
+    assert job.status == "failed" and job.error.startswith("ValueError: invalid literal")
+    monkeypatch.setattr(compare_routes, "job_manager", manager)
+    response = TestClient(app).get(f"/compare/jobs/{job.id}/result")
+    assert response.status_code == 500 and response.json()["detail"] == job.error
+
+def test_queue_is_bounded(monkeypatch):
+    manager = JobManager(1, 1, 3600, 1 << 20)
+    cleaned = []
+    jobs = [manager.submit(time.sleep, 0.5, cleanup=lambda: cleaned.append(1)) for _ in range(2)]
+    with pytest.raises(JobQueueFullError):
+        manager.submit(time.sleep, 0)
+    monkeypatch.setattr(compare_routes, "job_manager", manager)
+    response = TestClient(app).post("/compare/jobs", files=sample_files(), data={"mapping_config": json.dumps(MAPPING)})
+    assert response.status_code == 503 and "Retry-After" in response.headers
+    # Jobs submitted without retain are dropped once they finish and run their cleanup
+    deadline = time.time() + 60
+    while len(cleaned) < 2:
+        assert time.time() < deadline
+        time.sleep(0.05)
+    assert [manager.get(job.id) for job in jobs] == [None, None]
@@ -0,0 +1,76 @@
+import random
+
+import pandas as pd
+import pytest
+
+import reference
+from config import config
+from services.mapping_engine import apply_mapping
+
+CUSTOMS = [
+    "return value.replace('ext_', '');", "value.toLowerCase()",
+    "var n = value.toLowerCase();\nif (n == 'x') return 'y';\nreturn n;", "return parseInt(value) * 2",
+    "return value.substring(0,2)", "return value.split('-')", "trim|upper", "replace(a,b)|substring(0,3)",
+    'map({"A":"1"})|to_int', "lower|to_float", "return value + 1", "syntax error (", "", "value.trim()",
+    "title|strip_spaces|bogus", "replace(a)|lower", "substring(1)|upper", "substring(x,2)", 'map(["a"])|trim',
+    'map({"X": null, "12": 5})|to_float', "to_int|replace(1,9)", "trim(x)|lower", "to_float", "to_int",
+    "substring(-2)", 'map({"None": "n", "nan": "N"})', "replace(,_)",
+]
+TRANSFORMS = [[], ["trim"], ["lower", "upper"], ["bogus"], ["strip_spaces", "capitalize"], ["title"]]
+POOL = ["ext_1", " A ", "b-c", "X", "12", "3.5", None, float("nan"), "A", "a b", ""]
+
+def random_case(rng):
+    n = rng.randint(0, 30)
+    external = pd.DataFrame({
+        "k": [rng.choice(POOL) for _ in range(n)],
+        "f": pd.Series([rng.choice(POOL) for _ in range(n)], dtype=object),
+        "i": [rng.randint(0, 5) for _ in range(n)],
+    })
+    velaris = pd.DataFrame({
+        "vk": [rng.choice(POOL) for _ in range(n)],
+        "g": [rng.choice(POOL) for _ in range(n)],
+        "j": [rng.random() for _ in range(n)],
+    })
+    config = {
+        "key_fields": {
+            "external_field": "k", "velaris_field": "vk",
+            "external_custom": rng.choice(CUSTOMS), "velaris_custom": rng.choice(CUSTOMS),
+        },
+        "mappings": [
+            {
+                "external_field": "f", "velaris_field": "g", "rule": "equals",
+                "external_transforms": rng.choice(TRANSFORMS), "velaris_transforms": rng.choice(TRANSFORMS),
+                "external_custom": rng.choice(CUSTOMS), "velaris_custom": rng.choice(CUSTOMS),
+            },
+            {
+                "external_field": "i", "velaris_field": "j", "rule": "equals",
+                "external_transforms": rng.choice(TRANSFORMS),
+                "external_custom": rng.choice(CUSTOMS), "velaris_custom": rng.choice(CUSTOMS),
+            },
+        ],
+    }
+    return external, velaris, config
+
+@pytest.mark.parametrize("memoize", [False, True])
+@pytest.mark.parametrize("seed", range(3))
+def test_matches_row_at_a_time_apply_mapping(seed, memoize, monkeypatch):
+    # Memoized columns are transformed once per distinct value (user-005)
+    monkeypatch.setattr(config, "DISTINCT_TRANSFORM_MIN_ROWS", 1 if memoize else 10**9)
+    rng = random.Random(seed)
+    for _ in range(250):
+        external, velaris, mapping = random_case(rng)
+        expected = reference.apply_mapping(external, velaris, mapping)
+        result = apply_mapping(external, velaris, mapping)
+        for got, want in zip(result, expected):
+            pd.testing.assert_frame_equal(got, want, obj=str(mapping))
+
+def test_source_frames_are_not_modified():
+    external = pd.DataFrame({"k": [" a "], "f": ["X"]})
+    velaris = pd.DataFrame({"vk": ["a"], "g": ["x"]})
+    mapping = {
+        "key_fields": {"external_field": "k", "velaris_field": "vk", "external_custom": "trim"},
+        "mappings": [{"external_field": "f", "velaris_field": "g", "rule": "equals", "external_transforms": ["lower"]}],
+    }
+    mapped_external, _ = apply_mapping(external, velaris, mapping)
+    assert mapped_external.to_dict("list") == {"k": ["a"], "f": ["x"]}
+    assert external.to_dict("list") == {"k": [" a "], "f": ["X"]}
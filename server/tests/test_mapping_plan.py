@@ -0,0 +1,108 @@
+import json
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from services.mapping_plan import PlanRegistry, plan_id, validate_mapping
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MAPPING = {
+    "key_fields": {"external_field": "customer_id", "velaris_field": "account_id"},
+    "mappings": [
+        {"external_field": "subscription_status", "velaris_field": "status", "rule": "equals", "external_custom": "trim|lower"},
+        {"external_field": "monthly_revenue", "velaris_field": "mrr", "rule": "numeric_equals", "rule_options": {"abs_tol": 1}},
+    ],
+}
+
+def with_mapping(field, **changes):
+    mapping = json.loads(json.dumps(MAPPING))
+    mapping["mappings"][field].update(changes)
+    return mapping
+
+def test_valid_mapping():
+    columns = {"external": ["customer_id", "subscription_status", "monthly_revenue"], "velaris": ["account_id", "status", "mrr"]}
+    assert validate_mapping(MAPPING, columns) == ([], [])
+
+@pytest.mark.parametrize("mapping, error", [
+    ([], "mapping_config must be an object"),
+    ({**MAPPING, "result_mode": "all"}, "Unknown result_mode 'all', expected one of full, summary, page"),
+    ({**MAPPING, "key_fields": {"external_field": ["a", "b"], "velaris_field": "b"}}, "key_fields must list the same number of external and velaris columns"),
+    ({**MAPPING, "fuzzy_keys": {"threshold": 2}}, "fuzzy_keys threshold must be in (0, 1]"),
+    (with_mapping(1, rule_options={"abs_tol": -1}), "rule_options 'abs_tol' must be a non-negative number"),
+    (with_mapping(0, rule=""), "mappings[0] needs 'rule'"),
+    ({"key_fields": MAPPING["key_fields"]}, "mappings is required unless compare_only_mapped is false"),
+])
+def test_errors(mapping, error):
+    errors, _ = validate_mapping(mapping)
+    assert error in errors
+
+@pytest.mark.parametrize("mapping, warning", [
+    (with_mapping(0, rule="roughly"), "mappings[0]: unknown rule 'roughly', 'equals' is used instead"),
+    (with_mapping(0, velaris_transforms=["trim", "zap"]), "mappings[0]: unknown transform 'zap' is skipped"),
+    (with_mapping(0, external_custom="trim|nope"), "mappings[0].external_custom: unknown pipeline op 'nope' is skipped"),
+    ({**MAPPING, "filters": {"velaris": "status"}}, "filters.velaris is invalid and is ignored (expected an object)"),
+])
+def test_warnings(mapping, warning):
+    errors, warnings = validate_mapping(mapping)
+    assert errors == [] and warning in warnings
+
+def test_header_problems():
+    columns = {"external": ["customer_id", "subscription_status"], "velaris": ["status", "mrr"]}
+    errors, _ = validate_mapping(MAPPING, columns)
+    assert errors == ["Field 'monthly_revenue' not found in external CSV", "Key field 'account_id' not found in velaris CSV"]
+    _, warnings = validate_mapping({**MAPPING, "compare_only_mapped": False}, {"external": columns["external"]})
+    assert warnings == ["Field 'monthly_revenue' not found in external CSV; its transforms are skipped"]
+
+def test_plan_registry():
+    registry = PlanRegistry(2)
+    first = registry.put(MAPPING)
+    assert first == plan_id(json.loads(json.dumps(MAPPING)))
+    # Stored and returned configs are copies
+    registry.get(first)["mappings"].clear()
+    assert registry.get(first) == MAPPING
+    second = registry.put(with_mapping(0, rule="case_insensitive_equals"))
+    registry.get(first)
+    registry.put({**MAPPING, "result_mode": "summary"})
+    # The least recently used plan is dropped
+    assert registry.get(second) is None and registry.get(first) == MAPPING
+
+def test_routes_accept_a_registered_plan():
+    client = TestClient(app)
+    registered = client.post("/compare/plans", data={"mapping_config": json.dumps(MAPPING)}).json()
+    assert registered["valid"] and registered["transformed_columns"] == {"external": ["subscription_status"], "velaris": []}
+    assert client.get(f"/compare/plans/{registered['plan_id']}").json()["mapping_config"] == MAPPING
+
+    files = {}
+    for field, name in (("external_csv", "sample_external.csv"), ("velaris_csv", "sample_velaris.csv")):
+        with open(os.path.join(SERVER_DIR, name), "rb") as f:
+            files[field] = f.read()
+    direct = client.post("/compare/external-velaris", files=files, data={"mapping_config": json.dumps({**MAPPING, "result_mode": "summary"})})
+    via_plan = client.post("/compare/external-velaris", files=files, data={"mapping_config": json.dumps({"plan_id": registered["plan_id"], "result_mode": "summary"})})
+    assert via_plan.status_code == 200 and via_plan.json()["counts"] == direct.json()["counts"]
+    unknown = client.post("/compare/external-velaris", files=files, data={"mapping_config": json.dumps({"plan_id": "missing"})})
+    assert unknown.status_code == 404
+
+def test_compare_routes_check_the_mapping_against_the_headers():
+    client = TestClient(app)
+    external = b"customer_id,subscription_status\n1,active\n"
+    velaris = b"status,mrr\nactive,10\n"
+    files = {"external_csv": ("e.csv", external), "velaris_csv": ("v.csv", velaris)}
+    expected = ["Field 'monthly_revenue' not found in external CSV", "Key field 'account_id' not found in velaris CSV"]
+
+    response = client.post("/compare/external-velaris", files=files, data={"mapping_config": json.dumps(MAPPING)})
+    assert response.status_code == 400 and response.json()["detail"]["errors"] == expected
+    response = client.post("/compare/jobs", files=files, data={"mapping_config": json.dumps(MAPPING)})
+    assert response.status_code == 400 and response.json()["detail"]["errors"] == expected
+
+    good = b"account_id,status,mrr\n1,active,10\n"
+    batch = [("external_csv", ("e.csv", external)), ("velaris_csv", ("v1.csv", good)), ("velaris_csv", ("v2.csv", velaris))]
+    response = client.post("/compare/batch", files=batch, data={"mapping_config": json.dumps(MAPPING)})
+    assert response.status_code == 400
+    assert response.json()["detail"] == {"message": "Invalid mapping_config for target 0", "errors": expected[:1]}
+
+    ids = [client.post("/datasets", files={"file": (name, content)}).json()["dataset_id"] for name, content in (("e.csv", external), ("v.csv", velaris))]
+    response = client.post("/compare/datasets", data={"external_dataset": ids[0], "velaris_dataset": ids[1], "mapping_config": json.dumps(MAPPING)})
+    assert response.status_code == 400 and response.json()["detail"]["errors"] == expected
@@ -0,0 +1,85 @@
+import json
+import os
+import re
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from services.comparison_engine import compare_values
+from services.metrics import MetricsRegistry, Timings, metrics, recorded
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAPPING = {
+    "key_fields": {"external_field": "customer_id", "velaris_field": "account_id"},
+    "mappings": [
+        {"external_field": "subscription_status", "velaris_field": "status", "rule": "equals"},
+        {"external_field": "monthly_revenue", "velaris_field": "mrr", "rule": "roughly"},
+    ],
+}
+
+def sample(value):
+    match = re.search(rf"^{re.escape(value)} (\S+)$", TestClient(app).get("/metrics").text, re.M)
+    return float(match.group(1)) if match else 0.0
+
+def test_render():
+    registry = MetricsRegistry()
+    registry.inc("warnings_total", warning='say "hi"')
+    registry.observe("stage_seconds", 0.02, stage="read_csv")
+    registry.observe("stage_seconds", 400, stage="read_csv")
+    text = registry.render()
+    assert 'csv_compare_warnings_total{warning="say \\"hi\\""} 1' in text
+    assert 'csv_compare_stage_seconds_bucket{stage="read_csv",le="0.025"} 1' in text
+    assert 'csv_compare_stage_seconds_bucket{stage="read_csv",le="+Inf"} 2' in text
+    assert 'csv_compare_stage_seconds_count{stage="read_csv"} 2' in text
+    with pytest.raises(KeyError):
+        registry.inc("undeclared")
+
+def test_worker_metrics_are_merged():
+    result, snapshot = recorded(lambda: metrics.inc("rows_compared_total", 7) or "done")
+    assert result == "done"
+    registry = MetricsRegistry()
+    registry.merge(snapshot)
+    registry.merge(snapshot)
+    assert registry.snapshot()["counters"][("rows_compared_total", ())] == 14
+
+def test_timings():
+    timings = Timings()
+    with timings.stage("read_csv", {"external": 3}) as stage:
+        stage["rows_out"] = {"external": 2}
+    timings.add("compare_records", 0.5, rows_out={"matched": 1})
+    report = timings.report()
+    assert [(s["stage"], s["rows_in"], s["rows_out"]) for s in report["stages"]] == [
+        ("read_csv", {"external": 3}, {"external": 2}),
+        ("compare_records", None, {"matched": 1}),
+    ]
+    assert report["stages"][1]["seconds"] == 0.5
+
+def test_compare_route_reports_timings_and_metrics():
+    client = TestClient(app)
+    files = {}
+    for field, name in (("external_csv", "sample_external.csv"), ("velaris_csv", "sample_velaris.csv")):
+        with open(os.path.join(SERVER_DIR, name), "rb") as f:
+            files[field] = f.read()
+    rows = sample("csv_compare_rows_compared_total")
+    unknown_rules = sample('csv_compare_warnings_total{warning="unknown_rule"}')
+    evaluations = sample('csv_compare_rule_evaluations_total{rule="equals"}')
+    # A mapping this process has not compared yet, so the result cache cannot answer
+    mapping = {**MAPPING, "filters": {"external": {"logic": "OR", "conditions": []}}}
+    result = client.post("/compare/external-velaris", files=files, data={"mapping_config": json.dumps(mapping)}).json()
+    stages = [stage["stage"] for stage in result["timings"]["stages"]]
+    assert stages == ["read_csv", "apply_filters", "apply_mapping", "compare_records"]
+    assert result["timings"]["stages"][0]["rows_out"] == {"external": 8, "velaris": 6}
+
+    assert sample("csv_compare_rows_compared_total") == rows + 14
+    assert sample('csv_compare_warnings_total{warning="unknown_rule"}') > unknown_rules
+    assert sample('csv_compare_rule_evaluations_total{rule="equals"}') > evaluations
+    assert sample('csv_compare_stage_seconds_count{stage="compare_records"}') >= 1
+
+def test_unknown_cell_rule_is_logged_once_per_rule(caplog):
+    before = sample('csv_compare_warnings_total{warning="unknown_rule"}')
+    with caplog.at_level("WARNING", logger="services.comparison_engine"):
+        assert compare_values("a", "a", "equalz")
+        assert not compare_values("a", "b", "equalz")
+    assert [r.getMessage() for r in caplog.records] == ["Unknown comparison rule 'equalz', comparing values with =="]
+    assert sample('csv_compare_warnings_total{warning="unknown_rule"}') == before + 1
@@ -0,0 +1,104 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from config import config
+from services import pipeline
+from services.mapping_engine import apply_mapping
+from services.out_of_core import compare_out_of_core, load_partition, spill_side
+
+MAPPING = {
+    "key_fields": {"external_field": "id", "velaris_field": "key"},
+    "mappings": [
+        {"external_field": "amt", "velaris_field": "amount", "rule": "equals"},
+        {"external_field": "name", "velaris_field": "nm", "external_transforms": ["trim", "upper"], "velaris_transforms": ["upper"], "rule": "equals"},
+    ],
+    "filters": {"external": {"logic": "AND", "conditions": [{"field": "status", "operator": "equals", "data_type": "string", "value": "open"}]}},
+}
+
+@pytest.fixture
+def sources(tmp_path, monkeypatch):
+    # Small scan chunks, so early chunks see "amt" as int before its NaNs turn up
+    monkeypatch.setattr(config, "OUT_OF_CORE_SCAN_ROWS", 400)
+    rng = np.random.default_rng(3)
+    rows = 1500
+    external = pd.DataFrame({
+        "id": rng.integers(0, 1200, rows),
+        "amt": rng.integers(0, 50, rows).astype(float),
+        "name": rng.choice(["a", "b", " C ", None], rows),
+        "status": rng.choice(["open", "closed"], rows),
+    })
+    external.loc[1000:, "amt"] = np.where(rng.random(rows - 1000) < 0.05, np.nan, external.loc[1000:, "amt"])
+    velaris = pd.DataFrame({
+        "key": rng.integers(0, 1200, rows),
+        "amount": rng.integers(0, 50, rows),
+        "nm": rng.choice(["A", "b", "c"], rows),
+        "st": rng.choice(["open", "closed", "x"], rows),
+    })
+    paths = str(tmp_path / "external.csv"), str(tmp_path / "velaris.csv")
+    external.to_csv(paths[0], index=False)
+    velaris.to_csv(paths[1], index=False)
+    return paths
+
+def in_memory(external_path, velaris_path, mapping):
+    result = pipeline.run_comparison(external_path, velaris_path, mapping)
+    filter_stats = result.pop("filter_stats")
+    for key in ("transform_stats", "timings"):
+        result.pop(key)
+    return result, filter_stats
+
+def canonical(result):
+    return json.dumps(result, sort_keys=True, default=str)
+
+@pytest.mark.parametrize("mode", ["full", "summary", "page"])
+@pytest.mark.parametrize("compare_only_mapped", [True, False])
+@pytest.mark.parametrize("budget, partitions", [(30_000, None), (10**9, 1), (10**9, 5)])
+def test_matches_in_memory_comparison(sources, mode, compare_only_mapped, budget, partitions):
+    mapping = {**MAPPING, "result_mode": mode, "compare_only_mapped": compare_only_mapped}
+    expected, expected_filter_stats = in_memory(*sources, mapping)
+    result, filter_stats, _ = compare_out_of_core(*sources, mapping, memory_budget=budget, partitions=partitions)
+    assert canonical(result) == canonical(expected)
+    assert filter_stats == expected_filter_stats
+
+@pytest.mark.parametrize("mode", ["full", "summary"])
+def test_fuzzy_keys_match_across_partitions(tmp_path, mode):
+    rng = np.random.default_rng(8)
+    ids = [f"ACC-{n:05d}" for n in rng.choice(100_000, 300, replace=False)]
+    external = pd.DataFrame({"id": ids, "v": rng.integers(0, 3, 300)})
+    # Reformatted keys normalise to the same value and land in other partitions
+    velaris_ids = [i.lower().replace("-", " ") if n % 7 == 0 else i for n, i in enumerate(ids)]
+    velaris = pd.DataFrame({"key": velaris_ids, "v": rng.integers(0, 3, 300)})
+    paths = str(tmp_path / "external.csv"), str(tmp_path / "velaris.csv")
+    external.to_csv(paths[0], index=False)
+    velaris.to_csv(paths[1], index=False)
+    mapping = {
+        "key_fields": {"external_field": "id", "velaris_field": "key"},
+        "mappings": [{"external_field": "v", "velaris_field": "v", "rule": "equals"}],
+        "fuzzy_keys": True,
+        "result_mode": mode,
+    }
+    expected, _ = in_memory(*paths, mapping)
+    result, _, _ = compare_out_of_core(*paths, mapping, memory_budget=10**9, partitions=4)
+    assert canonical(result) == canonical(expected)
+    probable = expected["counts"]["probable_matches"] if mode == "summary" else len(expected["probable_matches"])
+    assert probable == 43
+
+def test_spilled_partitions_hold_the_mapped_rows_without_pickle(tmp_path):
+    source = str(tmp_path / "external.csv")
+    # trim + upper map "  " to "" and "na" to "NA", which must not come back as missing
+    pd.DataFrame({"id": range(50), "name": ["  ", "na", "x", None, "y"] * 10}).to_csv(source, index=False)
+    mapping = {
+        "key_fields": {"external_field": "id", "velaris_field": "key"},
+        "mappings": [{"external_field": "name", "velaris_field": "nm", "external_transforms": ["trim", "upper"], "rule": "equals"}],
+    }
+    directory = tmp_path / "spill"
+    spill_side(source, "external", mapping, None, None, 7, 3, str(directory))
+    assert {os.path.splitext(name)[1] for p in range(3) for name in os.listdir(directory / f"external-{p}")} <= {".json", ".csv", ".parquet", ".feather"}
+    loaded = [load_partition(str(directory / f"external-{p}"), set()) for p in range(3)]
+    rows = np.concatenate([r for r, _ in loaded])
+    spilled = pd.concat([df for _, df in loaded]).set_axis(rows).sort_index()
+    expected = apply_mapping(pd.read_csv(source), pd.DataFrame(), mapping)[0]
+    pd.testing.assert_frame_equal(spilled, expected)
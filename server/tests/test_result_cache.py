@@ -0,0 +1,81 @@
+import hashlib
+import json
+import os
+
+from fastapi.testclient import TestClient
+
+from main import app
+from services import pipeline
+from services.result_cache import TTLCache, canonical_mapping, filter_stage_key, mapping_stage_key, result_key, stage_cache
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAPPING = {
+    "key_fields": {"external_field": "customer_id", "velaris_field": "account_id"},
+    "mappings": [{"external_field": "subscription_status", "velaris_field": "status", "rule": "equals"}],
+}
+HASHES = ("a" * 64, "b" * 64)
+
+def with_rule(rule):
+    return {**MAPPING, "mappings": [{**MAPPING["mappings"][0], "rule": rule}]}
+
+def test_equivalent_configs_share_a_key():
+    spelled_out = {
+        "mappings": [{**MAPPING["mappings"][0], "external_transforms": [], "velaris_custom": "", "rule_options": {}}],
+        "key_fields": {"velaris_field": ["account_id"], "external_field": "customer_id"},
+        "filters": {"external": {}, "velaris": None},
+        "compare_only_mapped": True,
+        "page": {"offset": 10},
+    }
+    assert canonical_mapping(spelled_out) == canonical_mapping(MAPPING)
+    assert result_key(HASHES, spelled_out) == result_key(HASHES, MAPPING)
+    assert result_key(HASHES, with_rule("case_insensitive_equals")) != result_key(HASHES, MAPPING)
+    assert result_key(HASHES[::-1], MAPPING) != result_key(HASHES, MAPPING)
+
+def test_rule_changes_keep_the_stage_keys():
+    filtered = filter_stage_key(HASHES, MAPPING, {"external": None, "velaris": None})
+    assert filtered == filter_stage_key(HASHES, with_rule("contains"), {"external": None, "velaris": None})
+    assert mapping_stage_key(filtered, with_rule("contains")) == mapping_stage_key(filtered, MAPPING)
+    transformed = {**MAPPING, "mappings": [{**MAPPING["mappings"][0], "external_transforms": ["trim"]}]}
+    assert mapping_stage_key(filtered, transformed) != mapping_stage_key(filtered, MAPPING)
+
+def test_ttl_cache_bounds_and_invalidation():
+    cache = TTLCache(10, 3600, len)
+    cache.put("a", "aaaa", tags=("x",))
+    cache.put("b", "bbbb", tags=("y",))
+    cache.get("a")
+    cache.put("c", "cccc", tags=("x",))
+    # Over 10 bytes: the least recently used entry goes
+    assert cache.get("b") is None and cache.get("a") == "aaaa"
+    assert cache.invalidate("x") == 2 and cache.stats()["entries"] == 0
+    cache.put("big", "x" * 11)
+    assert cache.get("big") is None
+    expired = TTLCache(10, -1, len)
+    expired.put("a", "a")
+    assert expired.get("a") is None and expired.stats()["expirations"] == 1
+
+def test_stages_are_reused_when_only_the_rule_changes():
+    paths = [os.path.join(SERVER_DIR, name) for name in ("sample_external.csv", "sample_velaris.csv")]
+    stage_cache.invalidate()
+    first = pipeline.run_comparison(*paths, MAPPING, HASHES)
+    second = pipeline.run_comparison(*paths, with_rule("case_insensitive_equals"), HASHES)
+    assert second["stage_cache"]["hits"] - first["stage_cache"]["hits"] == 2
+    assert [stage["stage"] for stage in second["timings"]["stages"] if stage.get("cached")] == ["apply_filters", "apply_mapping"]
+
+def test_routes_memoize_and_invalidate():
+    client = TestClient(app)
+    files = {}
+    for field, name in (("external_csv", "sample_external.csv"), ("velaris_csv", "sample_velaris.csv")):
+        with open(os.path.join(SERVER_DIR, name), "rb") as f:
+            files[field] = f.read()
+    data = {"mapping_config": json.dumps({**MAPPING, "result_mode": "summary"})}
+    client.delete("/compare/cache")
+    first = client.post("/compare/external-velaris", files=files, data=data).json()
+    hits = client.get("/compare/cache").json()["hits"]
+    assert client.post("/compare/external-velaris", files=files, data=data).json() == first
+    assert client.get("/compare/cache").json()["hits"] == hits + 1
+
+    external_hash = hashlib.sha256(files["external_csv"]).hexdigest()
+    assert client.delete("/compare/cache", params={"content_hash": "0" * 64}).json() == {"invalidated": 0}
+    assert client.delete("/compare/cache", params={"content_hash": external_hash}).json() == {"invalidated": 1}
+    client.post("/compare/external-velaris", files=files, data=data)
+    assert client.get("/compare/cache").json()["hits"] == hits + 1
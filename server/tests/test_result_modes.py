@@ -0,0 +1,89 @@
+import asyncio
+import json
+import random
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from routes import compare_routes
+from services.comparison_engine import RESULT_BUCKETS
+from services.job_manager import JOB_RECORD_BYTES, JobManager
+
+MAPPING = {
+    "key_fields": {"external_field": "id", "velaris_field": "vid"},
+    "mappings": [{"external_field": "a", "velaris_field": "b", "rule": "equals"}],
+}
+
+def csv_files(seed):
+    rng = random.Random(seed)
+    external = "id,a\n" + "".join(f"{k},{rng.choice('xyz')}\n" for k in rng.sample(range(400), 300))
+    velaris = "vid,b\n" + "".join(f"{k},{rng.choice('xyz')}\n" for k in rng.sample(range(400), 300))
+    return {"external_csv": external.encode(), "velaris_csv": velaris.encode()}
+
+def compare(client, files, **mapping):
+    response = client.post("/compare/external-velaris", files=files, data={"mapping_config": json.dumps({**MAPPING, **mapping})})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+def test_summary_counts_the_full_result(client):
+    files = csv_files(1)
+    full = compare(client, files)
+    summary = compare(client, files, result_mode="summary")
+    assert summary["counts"] == {bucket: len(full[bucket]) for bucket in RESULT_BUCKETS}
+    assert not any(bucket in summary for bucket in RESULT_BUCKETS)
+    histogram = summary["field_mismatches"]["a"]
+    assert sum(entry["count"] for entry in histogram["top_values"]) <= summary["counts"]["mismatched"]
+
+def test_pages_read_back_the_full_result(client):
+    files = csv_files(2)
+    full = compare(client, files)
+    first = compare(client, files, result_mode="page", page={"offset": 0, "limit": 50})
+    assert first["totals"] == {bucket: len(full[bucket]) for bucket in RESULT_BUCKETS}
+    assert first["matched"] == full["matched"][:50]
+    for bucket in ("matched", "mismatched", "missing_in_velaris"):
+        windows, offset = [], 0
+        while offset < first["totals"][bucket]:
+            page = client.get(f"/compare/jobs/{first['result_id']}/result", params={"bucket": bucket, "offset": offset, "limit": 40}).json()
+            windows.extend(page[bucket])
+            offset += 40
+        assert windows == full[bucket]
+    assert client.get(f"/compare/jobs/{first['result_id']}/result", params={"bucket": "nope"}).status_code == 400
+    # The second page-mode request is answered from the result cache and retained again
+    again = compare(client, files, result_mode="page")
+    assert again["result_id"] != first["result_id"] and again["matched"] == full["matched"][:100]
+
+def test_retained_results_are_bounded():
+    def result(size):
+        return {"matched": ["x" * 96] * size}
+
+    manager = JobManager(1, 1, 3600, 3 * JOB_RECORD_BYTES + 3 * 10_000)
+    jobs = [manager.add_completed(result(80)) for _ in range(4)]
+    # About 8 KB each: the least recently used one is dropped to make room
+    assert manager.get(jobs[0].id) is None
+    assert [job.id for job in manager.all_jobs()] == [job.id for job in jobs[1:]]
+    manager.get(jobs[1].id)
+    manager.add_completed(result(80))
+    assert manager.get(jobs[2].id) is None and manager.get(jobs[1].id) is not None
+    huge = manager.add_completed(result(10_000))
+    assert manager.get(huge.id).discarded and manager.get(huge.id).result is None
+
+def test_only_retained_jobs_outlive_their_callers():
+    async def run():
+        manager = JobManager(1, 1, 3600, 1 << 20)
+        kept, dropped = manager.submit(pow, 2, 10, retain=True), manager.submit(pow, 3, 2)
+        assert await manager.wait(kept) == 1024 and await manager.wait(dropped) == 9
+        assert manager.get(kept.id).result == 1024 and manager.get(dropped.id) is None
+        manager._pool.shutdown()
+
+    asyncio.run(run())
+
+def test_discarded_result_is_gone(client, monkeypatch):
+    manager = JobManager(1, 1, 3600, JOB_RECORD_BYTES + 100)
+    monkeypatch.setattr(compare_routes, "job_manager", manager)
+    job = manager.add_completed({"matched": ["x" * 200]})
+    assert client.get(f"/compare/jobs/{job.id}/result").status_code == 410
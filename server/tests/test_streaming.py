@@ -0,0 +1,148 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+from config import config
+from main import app
+from services import out_of_core, partitioned_compare, pipeline
+from services.out_of_core import stream_out_of_core
+from services.partitioned_compare import stream_partitioned
+
+MAPPING = {
+    "key_fields": {"external_field": "id", "velaris_field": "key"},
+    "mappings": [
+        {"external_field": "amt", "velaris_field": "amount", "rule": "numeric_equals"},
+        {"external_field": "name", "velaris_field": "nm", "external_transforms": ["trim", "upper"], "rule": "equals"},
+    ],
+}
+
+@pytest.fixture
+def sources(tmp_path):
+    rng = np.random.default_rng(11)
+    rows = 800
+    external = pd.DataFrame({
+        "id": rng.integers(0, 700, rows),
+        "amt": rng.choice(["1", "2", "x", ""], rows),
+        "name": rng.choice(["a", " b ", "C"], rows),
+    })
+    velaris = pd.DataFrame({
+        "key": rng.integers(0, 700, rows),
+        "amount": rng.integers(1, 3, rows),
+        "nm": rng.choice(["A", "B", "c"], rows),
+    })
+    paths = str(tmp_path / "external.csv"), str(tmp_path / "velaris.csv")
+    external.to_csv(paths[0], index=False)
+    velaris.to_csv(paths[1], index=False)
+    return paths
+
+def streamed(tmp_path, sources, mapping):
+    path = tmp_path / "out.ndjson"
+    pipeline.stream_comparison(*sources, mapping, str(path))
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    for key in ("timings", "filter_stats", "transform_stats"):
+        records[-1].pop(key)
+    return records
+
+def test_records_follow_the_full_result(tmp_path, sources):
+    records = streamed(tmp_path, sources, MAPPING)
+    result = json.loads(json.dumps(pipeline.run_comparison(*sources, MAPPING), default=pipeline._json_default))
+    assert [r["id"] for r in records if r["type"] == "mismatched"] == [m["id"] for m in result["mismatched"]]
+    assert [r["differences"] for r in records if r["type"] == "mismatched"] == [m["differences"] for m in result["mismatched"]]
+    for bucket in ("missing_in_velaris", "missing_in_external"):
+        assert [r["id"] for r in records if r["type"] == bucket] == result[bucket]
+    assert [{k: v for k, v in r.items() if k != "type"} for r in records if r["type"] == "duplicate_keys"] == result["duplicate_keys"]
+    summary = records[-1]
+    assert summary["type"] == "summary" and summary["unparseable"] == result["unparseable"]
+    assert summary["counts"] == {bucket: len(result[bucket]) for bucket in summary["counts"]}
+
+def test_out_of_core_and_partitioned_runs_stream_the_same_records(tmp_path, sources, monkeypatch):
+    expected = streamed(tmp_path, sources, MAPPING)
+    assert streamed(tmp_path, sources, {**MAPPING, "out_of_core": True, "result_mode": "summary"}) == expected
+    monkeypatch.setattr(config, "COMPARE_PARTITIONS", 3)
+    monkeypatch.setattr(config, "PARTITION_MIN_ROWS", 0)
+    assert streamed(tmp_path, sources, MAPPING) == expected
+
+def unordered(records):
+    """A stream's records regardless of line order (partition streams group them by partition) and its summary."""
+    summary = {k: v for k, v in records[-1].items() if k not in ("timings", "filter_stats", "transform_stats")}
+    return sorted(json.dumps(r, sort_keys=True, default=pipeline._json_default) for r in records[:-1]), summary
+
+def test_partition_streams_hold_the_same_records(tmp_path, sources):
+    expected = unordered(streamed(tmp_path, sources, MAPPING))
+    assert unordered(list(stream_out_of_core(*sources, MAPPING, partitions=4))) == expected
+    frames = [pd.read_csv(path) for path in sources]
+    assert unordered(list(stream_partitioned(*frames, MAPPING, partitions=4, workers=2))) == expected
+
+def test_partition_streams_pair_orphans_across_partitions(tmp_path):
+    rng = np.random.default_rng(8)
+    ids = [f"ACC-{n:05d}" for n in rng.choice(100_000, 300, replace=False)]
+    # Reformatted keys normalise to the same value and land in other partitions
+    velaris_ids = [i.lower().replace("-", " ") if n % 7 == 0 else i for n, i in enumerate(ids)]
+    external = pd.DataFrame({"id": ids, "v": rng.integers(0, 3, 300)})
+    velaris = pd.DataFrame({"key": velaris_ids, "v": rng.integers(0, 3, 300)})
+    paths = str(tmp_path / "external.csv"), str(tmp_path / "velaris.csv")
+    external.to_csv(paths[0], index=False)
+    velaris.to_csv(paths[1], index=False)
+    mapping = {
+        "key_fields": {"external_field": "id", "velaris_field": "key"},
+        "mappings": [{"external_field": "v", "velaris_field": "v", "rule": "equals"}],
+        "fuzzy_keys": True,
+    }
+    expected = streamed(tmp_path, paths, mapping)
+    probable = [r for r in expected if r["type"] == "probable_matches"]
+    assert len(probable) == 43
+    for records in (
+        list(stream_out_of_core(*paths, mapping, partitions=4)),
+        list(stream_partitioned(external, velaris, mapping, partitions=4, workers=2)),
+    ):
+        assert [r for r in records if r["type"] == "probable_matches"] == probable
+        assert unordered(records) == unordered(expected)
+
+def test_partitioned_stream_yields_records_before_the_last_partition_is_compared(sources, monkeypatch):
+    pool = partitioned_compare._executor(2)
+    submitted = []
+
+    class CountingPool:
+        def submit(self, fn, *args):
+            submitted.append(args[0].__name__)
+            return pool.submit(fn, *args)
+
+    monkeypatch.setattr(partitioned_compare, "_executor", lambda workers: CountingPool())
+    frames = [pd.read_csv(path) for path in sources]
+    stream = stream_partitioned(*frames, MAPPING, partitions=6, workers=2)
+    first = next(stream)
+    assert first["type"] == "mismatched"
+    assert submitted.count("_partition_records") == 2
+    assert list(stream)[-1]["type"] == "summary"
+    assert submitted.count("_partition_records") == 6
+
+def test_out_of_core_stream_yields_records_before_the_last_partition_is_loaded(sources, monkeypatch):
+    loaded = []
+    load = out_of_core.load_partition
+    monkeypatch.setattr(out_of_core, "load_partition", lambda path, upcast: loaded.append(path) or load(path, upcast))
+    stream = stream_out_of_core(*sources, MAPPING, partitions=6)
+    assert next(stream)["type"] == "mismatched"
+    assert len(loaded) == 2
+    assert list(stream)[-1]["type"] == "summary"
+    assert len(loaded) == 12
+
+def test_route_streams_ndjson(sources):
+    client = TestClient(app)
+    files = {}
+    for field, path in zip(("external_csv", "velaris_csv"), sources):
+        with open(path, "rb") as f:
+            files[field] = f.read()
+    data = {"mapping_config": json.dumps(MAPPING)}
+    response = client.post("/compare/external-velaris", files=files, data=data, headers={"Accept": "application/x-ndjson"})
+    assert response.status_code == 200 and response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    full = client.post("/compare/external-velaris", files=files, data=data).json()
+    assert lines[-1]["type"] == "summary"
+    assert lines[-1]["counts"] == {bucket: len(full[bucket]) for bucket in lines[-1]["counts"]}
+
+    incremental = {**MAPPING, "incremental": {"snapshot": "streamed"}}
+    response = client.post("/compare/external-velaris", files=files, data={"mapping_config": json.dumps(incremental)}, headers={"Accept": "application/x-ndjson"})
+    assert response.status_code == 400
@@ -0,0 +1,80 @@
+import pandas as pd
+import pytest
+
+from services.comparison_engine import check_rule_options, compare_records, parse_dates
+
+def _config(rule, **options):
+    return {
+        "key_fields": {"external_field": "id", "velaris_field": "id"},
+        "mappings": [{"external_field": "a", "velaris_field": "b", "rule": rule, "rule_options": options}],
+    }
+
+def _compare(a, b, rule, **options):
+    ids = [str(i) for i in range(len(a))]
+    return compare_records(pd.DataFrame({"id": ids, "a": a}), pd.DataFrame({"id": ids, "b": b}), _config(rule, **options))
+
+def test_dayfirst_leaves_year_first_dates_alone():
+    values = pd.Series(["2024-01-02", "02/01/2024", "2024/01/02", "2024-01-02T10:00:00", "13/01/2024"])
+    nanos, missing, unparseable = parse_dates(values, dayfirst=True)
+    assert list(pd.to_datetime(nanos)) == [
+        pd.Timestamp("2024-01-02"), pd.Timestamp("2024-01-02"), pd.Timestamp("2024-01-02"),
+        pd.Timestamp("2024-01-02 10:00"), pd.Timestamp("2024-01-13"),
+    ]
+    assert not missing.any() and not unparseable.any()
+
+def test_date_equals_mixed_iso_and_day_first():
+    result = _compare(
+        ["2024-01-02", "2024-03-04", "05/06/2024"],
+        ["02/01/2024", "2024-03-04", "2024-06-05"],
+        "date_equals", dayfirst=True,
+    )
+    assert result["matched"] == ["0", "1", "2"]
+    assert result["mismatched"] == []
+
+def test_date_equals_dayfirst_per_side():
+    result = _compare(["01/02/2024", "2024-01-02"], ["02/01/2024", "02/01/2024"], "date_equals", velaris_dayfirst=True)
+    assert result["matched"] == ["0", "1"]
+
+def test_date_equals_offsets_and_tolerance():
+    result = _compare(
+        ["2024-01-02T10:00:00+01:00", "2024-01-02 09:00:30", "not a date"],
+        ["2024-01-02T09:00:00Z", "2024-01-02 09:00:00", "2024-01-02"],
+        "date_equals", tolerance_seconds=60,
+    )
+    assert result["matched"] == ["0", "1"]
+    assert [m["id"] for m in result["mismatched"]] == ["2"]
+    assert result["unparseable"]["a"]["external"]["cells"] == 1
+
+def test_numeric_equals_separators_and_notation():
+    result = _compare(
+        ["1,234.50", "-2e3", " 7 ", "1.234,5", None, "", "x"],
+        [1234.5, -2000, 7, "1234.5", None, "3", "1"],
+        "numeric_equals", external_thousands=".", external_decimal=",",
+    )
+    # Per-side separators: "1,234.50" reads as 1.2345 with "." thousands and "," decimal
+    assert result["matched"] == ["1", "2", "3", "4"]
+    assert [m["id"] for m in result["mismatched"]] == ["0", "5", "6"]
+    assert result["unparseable"]["a"]["external"]["cells"] == 1
+
+def test_numeric_equals_tolerances():
+    external, velaris = ["100", "100", "1000", "0"], ["100.4", "101", "1009", "0.0000001"]
+    assert _compare(external, velaris, "numeric_equals")["matched"] == []
+    assert _compare(external, velaris, "numeric_equals", abs_tol=0.5)["matched"] == ["0", "3"]
+    assert _compare(external, velaris, "numeric_equals", rel_tol=0.01)["matched"] == ["0", "1", "2"]
+
+def test_numeric_ordering_rules():
+    external, velaris = ["10", "2", "3", "n/a"], ["9", "2", "4", "1"]
+    assert _compare(external, velaris, "numeric_greater_than")["matched"] == ["0"]
+    assert _compare(external, velaris, "numeric_less_than")["matched"] == ["2"]
+
+@pytest.mark.parametrize("rule, options", [
+    ("numeric_equals", {"abs_tol": -1}),
+    ("numeric_equals", {"rel_tol": "wide"}),
+    ("numeric_equals", {"decimal": ","}),
+    ("numeric_greater_than", {"abs_tol": 1}),
+    ("date_equals", {"timezone": "Mars/Olympus"}),
+    ("equals", {"dayfirst": True}),
+])
+def test_invalid_rule_options(rule, options):
+    with pytest.raises(ValueError):
+        check_rule_options(_config(rule, **options))
@@ -0,0 +1,65 @@
+import asyncio
+import json
+import os
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from config import config
+from main import app
+from services.uploads import UploadLimitMiddleware, request_body_limit
+
+MB = 1024 * 1024
+MAPPING = {"key_fields": {"external_field": "id", "velaris_field": "id"}, "mappings": [{"external_field": "v", "velaris_field": "v", "rule": "equals"}]}
+
+@pytest.fixture
+def spool_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "MAX_CSV_SIZE_MB", 1)
+    monkeypatch.setattr(config, "UPLOAD_TMP_DIR", str(tmp_path))
+    return tmp_path
+
+def csv_of(size):
+    rows = b"".join(b"%d,x\n" % i for i in range(size // 8))
+    return b"id,v\n" + rows
+
+def test_request_body_limits(spool_dir):
+    assert request_body_limit("/compare/external-velaris") == 3 * MB
+    assert request_body_limit("/datasets/") == 2 * MB
+    assert request_body_limit("/compare/batch") == (config.BATCH_MAX_TARGETS + 2) * MB
+
+def test_oversized_uploads_are_rejected(spool_dir):
+    client = TestClient(app)
+    small = csv_of(1000)
+    data = {"mapping_config": json.dumps(MAPPING)}
+    ok = client.post("/compare/external-velaris", files={"external_csv": small, "velaris_csv": small}, data=data)
+    assert ok.status_code == 200 and len(ok.json()["matched"]) == 125
+    # The whole body is over the route's limit: refused on Content-Length
+    response = client.post("/compare/external-velaris", files={"external_csv": csv_of(4 * MB), "velaris_csv": small}, data=data)
+    assert response.status_code == 413
+    # Within the body limit but one file is over MAX_CSV_SIZE_MB
+    response = client.post("/compare/external-velaris", files={"external_csv": csv_of(MB + MB // 2), "velaris_csv": small}, data=data)
+    assert response.status_code == 413 and "upload limit" in response.json()["detail"]
+    assert os.listdir(spool_dir) == []
+
+def test_streamed_body_is_cut_off(spool_dir):
+    received = []
+
+    async def inner(scope, receive, send):
+        while True:
+            message = await receive()
+            received.append(len(message["body"]))
+            if not message.get("more_body"):
+                return
+
+    chunks = iter([b"x" * MB] * 5)
+
+    async def receive():
+        return {"type": "http.request", "body": next(chunks), "more_body": True}
+
+    scope = {"type": "http", "method": "POST", "path": "/datasets", "headers": []}
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(UploadLimitMiddleware(inner)(scope, receive, None))
+    assert raised.value.status_code == 413
+    # The chunk that crossed the 2 MB limit never reached the app
+    assert received == [MB, MB]